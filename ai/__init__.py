@@ -2,7 +2,7 @@
 AI package initialization
 """
 from .explainer import AIExplainer
-from .recommender import Recommender
+from .recommender import Recommender, RECOMMENDER
 from .gemini_client import GeminiClient
 
-__all__ = ['AIExplainer', 'Recommender', 'GeminiClient']
+__all__ = ['AIExplainer', 'Recommender', 'RECOMMENDER', 'GeminiClient']
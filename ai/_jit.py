@@ -0,0 +1,47 @@
+"""
+JIT helpers - Optional numba acceleration for numeric kernels
+"""
+import numpy as np
+
+# numba is optional; without it kernels run as plain Python / NumPy
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+# Severity / risk label -> int8 code used by the kernels
+HIGH = 2
+MEDIUM = 1
+LOW = 0
+SEVERITY_CODES = {"Low": LOW, "Medium": MEDIUM, "High": HIGH}
+RISK_CODES = {"Low Risk": LOW, "Medium Risk": MEDIUM, "High Risk": HIGH}
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def collect_high(codes):
+        """Return indices of entries coded HIGH, in order."""
+        out = np.empty(codes.shape[0], dtype=np.int64)
+        n = 0
+        for i in range(codes.shape[0]):
+            if codes[i] == 2:
+                out[n] = i
+                n += 1
+        return out[:n]
+else:
+    def collect_high(codes):
+        """Return indices of entries coded HIGH, in order."""
+        return np.flatnonzero(codes == HIGH)
+
+
+def encode(labels, code_map) -> np.ndarray:
+    """Encode an iterable of labels as an int8 code array (unknown labels -> LOW)."""
+    return np.fromiter((code_map.get(label, LOW) for label in labels), dtype=np.int8)
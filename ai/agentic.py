@@ -9,9 +9,172 @@ This module provides AI-powered automation for routine tasks:
 
 IMPORTANT: All actions require user approval before execution.
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
+from collections import Counter
+from dataclasses import asdict, dataclass, field
 from datetime import datetime
-import json
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+import threading
+import uuid
+
+import numpy as np
+import orjson
+
+from ._jit import SEVERITY_CODES, njit
+
+
+_utcnow = datetime.utcnow
+
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+# Urgency code -> (urgency, recommended timeline)
+_URGENCY_LEVELS = (
+    ("routine", "next scheduled visit"),
+    ("recommended", "within 30 days"),
+    ("urgent", "within 2 weeks"),
+)
+
+
+# Rule-based corrective action suggestions (deterministic, auditable).
+# Shared across calls: steps are tuples and must be treated as read-only.
+_ACTION_MAP = {
+    "missing_data": {
+        "action": "Request data entry completion",
+        "steps": (
+            "Identify missing fields in source documents",
+            "Contact site coordinator for data retrieval",
+            "Update eCRF with corrected values",
+            "Add comment explaining the delay"
+        ),
+        "owner": "Site Coordinator"
+    },
+    "query_backlog": {
+        "action": "Prioritize query resolution",
+        "steps": (
+            "Review oldest open queries first",
+            "Group related queries for efficient resolution",
+            "Schedule dedicated query review sessions",
+            "Escalate queries older than 14 days"
+        ),
+        "owner": "CRA"
+    },
+    "delayed_visits": {
+        "action": "Reschedule patient visits",
+        "steps": (
+            "Contact affected patients for rescheduling",
+            "Document reason for original delay",
+            "Update visit schedule in system",
+            "Assess protocol deviation if applicable"
+        ),
+        "owner": "Site"
+    },
+    "data_inconsistency": {
+        "action": "Clean and standardize data",
+        "steps": (
+            "Identify inconsistent data patterns",
+            "Verify against source documents",
+            "Apply data corrections",
+            "Add data management notes"
+        ),
+        "owner": "Data Manager"
+    }
+}
+
+_DEFAULT_ACTION = {
+    "action": "Review and address issue",
+    "steps": ("Review issue details", "Determine root cause", "Implement correction"),
+    "owner": "Study Team"
+}
+
+
+@lru_cache(maxsize=128)
+def _pretty(category: str) -> str:
+    """Title-case a snake_case category (e.g. 'missing_data' -> 'Missing Data')."""
+    return category.replace('_', ' ').title()
+
+
+@njit(cache=True)
+def _score_issues(severities):
+    """Return (urgency_code, high_count) for an int8 array of severity codes."""
+    high = 0
+    for sev in severities:
+        if sev == 2:
+            high += 1
+    
+    if high >= 3:
+        return 2, high
+    if high >= 1 or severities.shape[0] >= 5:
+        return 1, high
+    return 0, high
+
+
+@dataclass(slots=True, kw_only=True)
+class AgentAction:
+    """Base for actions that go through the approve/reject workflow."""
+    type: str
+    status: str
+    created_at: str
+    action_key: str = ""
+    metadata: Dict = field(default_factory=dict)
+    approved_at: Optional[str] = None
+    approved_by: Optional[str] = None
+    rejected_at: Optional[str] = None
+    rejection_reason: Optional[str] = None
+    
+    def to_dict(self) -> Dict:
+        """Convert to a plain dict (UI rendering / API responses)."""
+        return asdict(self)
+
+
+@dataclass(slots=True, kw_only=True)
+class EmailDraft(AgentAction):
+    """Query resolution email awaiting approval."""
+    type: str = "email_draft"
+    status: str = "pending_approval"
+    target_site: str
+    study: str
+    issue_id: Optional[str] = None
+    subject: str
+    body: str
+
+
+@dataclass(slots=True, kw_only=True)
+class SiteVisitRecommendation(AgentAction):
+    """Monitoring visit recommendation awaiting review."""
+    type: str = "site_visit_recommendation"
+    status: str = "pending_review"
+    site_id: str
+    study: str
+    urgency: str
+    recommended_timeline: str
+    issue_count: int
+    high_severity_count: int
+    rationale: str
+
+
+@dataclass(slots=True, kw_only=True)
+class CorrectiveAction:
+    """Rule-based corrective action suggestion (not queued for approval)."""
+    type: str = "corrective_action"
+    status: str = "suggested"
+    issue_id: Optional[str] = None
+    category: str
+    suggested_action: str
+    steps: Tuple[str, ...]
+    suggested_owner: str
+    metadata: Dict = field(default_factory=dict)
+    
+    def to_dict(self) -> Dict:
+        """Convert to a plain dict (UI rendering / API responses)."""
+        return asdict(self)
+
+
+_ACTION_TYPES = {
+    "email_draft": EmailDraft,
+    "site_visit_recommendation": SiteVisitRecommendation,
+}
 
 
 class AgenticAI:
@@ -23,38 +186,12 @@ class AgenticAI:
     - No action is taken without explicit user confirmation
     """
     
-    def __init__(self, gemini_client=None):
-        self.gemini_client = gemini_client
-        self.pending_actions = []
-        self.action_history = []
-    
-    def draft_query_resolution_email(self, issue: Dict, site_id: str, 
-                                     study_name: str) -> Dict:
-        """
-        Auto-draft a query resolution request email for a specific issue.
-        
-        Returns a draft that requires user approval before sending.
-        """
-        issue_category = issue.get("issue_category", "data_issue")
-        severity = issue.get("severity", "Medium")
-        description = issue.get("description", "Issue detected")
-        rule_id = issue.get("rule_id", "UNKNOWN")
-        
-        # Generate draft email
-        draft = {
-            "type": "email_draft",
-            "status": "pending_approval",
-            "created_at": datetime.utcnow().isoformat(),
-            "target_site": site_id,
-            "study": study_name,
-            "issue_id": issue.get("issue_id"),
-            "subject": f"[Action Required] Query Resolution: {issue_category.replace('_', ' ').title()} - {study_name}",
-            "body": f"""Dear Site {site_id} Team,
+    _EMAIL_TEMPLATE = """Dear Site {site_id} Team,
 
 We have identified a data quality issue in the {study_name} study that requires your attention.
 
 **Issue Details:**
-- Category: {issue_category.replace('_', ' ').title()}
+- Category: {category_title}
 - Severity: {severity}
 - Description: {description}
 - Rule ID: {rule_id}
@@ -75,52 +212,183 @@ Thank you for your prompt attention to this matter.
 Best regards,
 Clinical Trial Intelligence System
 (This is an AI-drafted message pending approval)
-""",
-            "metadata": {
+"""
+    
+    def __init__(self, gemini_client=None):
+        self.gemini_client = gemini_client
+        self.pending_actions: List[AgentAction] = []
+        self.action_history: List[AgentAction] = []
+        # Running status counters so summaries don't rescan the action lists
+        self._pending_count = 0
+        self._approved_count = 0
+        self._rejected_count = 0
+        # Pending actions indexed by their action_key for O(1) approve/reject
+        self._pending_by_key: Dict[str, AgentAction] = {}
+        # Queued (action_key, prompt) pairs for batched Gemini drafting; the
+        # instance is shared across sessions, so the queue is lock-guarded
+        self._batch_queue: List[Tuple[str, str]] = []
+        self._batch_drafts: Dict[str, EmailDraft] = {}
+        self._batch_lock = threading.Lock()
+    
+    def draft_query_resolution_email(self, issue: Dict, site_id: str, 
+                                     study_name: str, created_at: Optional[str] = None,
+                                     queue_ai_rewrite: bool = False) -> EmailDraft:
+        """
+        Auto-draft a query resolution request email for a specific issue.
+        
+        Returns a draft that requires user approval before sending.
+        queue_ai_rewrite queues a Gemini rewrite of the body for a later flush_batch().
+        """
+        issue_category = issue.get("issue_category", "data_issue")
+        severity = issue.get("severity", "Medium")
+        description = issue.get("description", "Issue detected")
+        rule_id = issue.get("rule_id", "UNKNOWN")
+        category_title = _pretty(issue_category)
+        
+        values = {
+            "site_id": site_id,
+            "study_name": study_name,
+            "category_title": category_title,
+            "severity": severity,
+            "description": description,
+            "rule_id": rule_id
+        }
+        
+        # Generate draft email
+        draft = EmailDraft(
+            created_at=created_at or _utcnow().isoformat(),
+            target_site=site_id,
+            study=study_name,
+            issue_id=issue.get("issue_id"),
+            subject=f"[Action Required] Query Resolution: {category_title} - {study_name}",
+            body=self._EMAIL_TEMPLATE.format_map(values),
+            metadata={
                 "severity": severity,
                 "rule_id": rule_id,
                 "auto_generated": True,
                 "requires_approval": True
             }
-        }
+        )
+        
+        self._register_pending(draft)
+        self._pending_count += 1
         
-        self.pending_actions.append(draft)
+        # Keyed by the unique action_key so drafts for issues sharing an id never collide
+        if queue_ai_rewrite and self._gemini_available():
+            with self._batch_lock:
+                self._batch_queue.append((draft.action_key, self._build_email_prompt(draft, description)))
+                self._batch_drafts[draft.action_key] = draft
         return draft
     
+    def draft_query_resolution_emails_batch(self, issues: List[Dict], study_name: str,
+                                            use_batch_api: bool = False,
+                                            combined: bool = False) -> List[EmailDraft]:
+        """
+        Draft query resolution emails for many issues in one pass.
+        
+        When Gemini is configured, all AI rewrites for these drafts are sent
+        together (synchronous calls by default, one packed request if
+        combined=True, or the Gemini Batch API if use_batch_api=True - that
+        blocks until the job finishes). Only this call's drafts are rewritten.
+        """
+        created_at = _utcnow().isoformat()
+        drafts = [
+            self.draft_query_resolution_email(issue, issue.get("site_id", "Unknown"), study_name, created_at)
+            for issue in issues
+        ]
+        if self._gemini_available():
+            prompts = {
+                draft.action_key: self._build_email_prompt(draft, issue.get("description", "Issue detected"))
+                for draft, issue in zip(drafts, issues)
+            }
+            self._apply_rewrites(prompts, {draft.action_key: draft for draft in drafts},
+                                 use_batch_api, combined)
+        return drafts
+    
+    def flush_batch(self, use_batch_api: bool = False, combined: bool = False) -> int:
+        """
+        Send all queued draft prompts to Gemini and apply the responses.
+        
+        Returns the number of drafts updated with AI-generated bodies.
+        Drafts without a response keep their rule-based template body.
+        use_batch_api=True uses the Gemini Batch API and blocks until the job finishes.
+        """
+        with self._batch_lock:
+            if not self._batch_queue:
+                return 0
+            prompts = dict(self._batch_queue)
+            drafts = self._batch_drafts
+            self._batch_queue = []
+            self._batch_drafts = {}
+        
+        return self._apply_rewrites(prompts, drafts, use_batch_api, combined)
+    
+    def _apply_rewrites(self, prompts: Dict[str, str], drafts: Dict[str, EmailDraft],
+                        use_batch_api: bool, combined: bool) -> int:
+        """Generate rewrites for prompts and copy them onto the matching drafts."""
+        if combined:
+            responses = self.gemini_client.generate_combined(prompts)
+        else:
+            responses = self.gemini_client.generate_batch(prompts, use_batch_api=use_batch_api)
+        
+        updated = 0
+        for key, text in responses.items():
+            draft = drafts.get(key)
+            if draft is not None and text:
+                draft.body = text
+                draft.metadata["ai_drafted"] = True
+                updated += 1
+        return updated
+    
+    def _register_pending(self, action: AgentAction):
+        """Assign an action key and add the action to the pending list and index."""
+        action.action_key = uuid.uuid4().hex
+        self._pending_by_key[action.action_key] = action
+        self.pending_actions.append(action)
+    
+    def _gemini_available(self) -> bool:
+        """Check if a usable Gemini client is configured."""
+        return self.gemini_client is not None and getattr(self.gemini_client, "is_available", False)
+    
+    def _build_email_prompt(self, draft: EmailDraft, description: str) -> str:
+        """Build the Gemini prompt used to refine an email draft."""
+        return f"""You are drafting a query resolution email to a clinical trial site.
+Rewrite the draft below so it is clear, courteous and specific to the issue.
+Keep all issue details and the rule ID. Do not invent data. Return only the email body.
+
+Issue description: {description}
+
+Draft:
+{draft.body}"""
+    
     def draft_site_visit_recommendation(self, site_id: str, issues: List[Dict],
-                                        study_name: str) -> Dict:
+                                        study_name: str) -> SiteVisitRecommendation:
         """Generate a site visit recommendation based on issue patterns."""
-        high_issues = [i for i in issues if i.get("severity") == "High"]
         total_issues = len(issues)
         
         # Determine urgency
-        if len(high_issues) >= 3:
-            urgency = "urgent"
-            timeline = "within 2 weeks"
-        elif len(high_issues) >= 1 or total_issues >= 5:
-            urgency = "recommended"
-            timeline = "within 30 days"
-        else:
-            urgency = "routine"
-            timeline = "next scheduled visit"
+        severities = np.fromiter(
+            (SEVERITY_CODES.get(i.get("severity"), 0) for i in issues),
+            dtype=np.int8, count=total_issues
+        )
+        urgency_code, high_count = _score_issues(severities)
+        urgency, timeline = _URGENCY_LEVELS[urgency_code]
         
         # Generate issue summary
         issue_summary = "\n".join([
             f"- [{i.get('severity')}] {i.get('description', 'Issue')}"
-            for i in issues[:5]
+            for i in islice(issues, 5)
         ])
         
-        recommendation = {
-            "type": "site_visit_recommendation",
-            "status": "pending_review",
-            "created_at": datetime.utcnow().isoformat(),
-            "site_id": site_id,
-            "study": study_name,
-            "urgency": urgency,
-            "recommended_timeline": timeline,
-            "issue_count": total_issues,
-            "high_severity_count": len(high_issues),
-            "rationale": f"""Site {site_id} has accumulated {total_issues} issues ({len(high_issues)} high-severity).
+        recommendation = SiteVisitRecommendation(
+            created_at=_utcnow().isoformat(),
+            site_id=site_id,
+            study=study_name,
+            urgency=urgency,
+            recommended_timeline=timeline,
+            issue_count=total_issues,
+            high_severity_count=high_count,
+            rationale=f"""Site {site_id} has accumulated {total_issues} issues ({high_count} high-severity).
 
 Key Issues:
 {issue_summary}
@@ -131,119 +399,129 @@ Focus Areas:
 - Verify source documentation
 - Provide additional training if needed
 """,
-            "metadata": {
+            metadata={
                 "auto_generated": True,
                 "requires_approval": True
             }
-        }
+        )
         
-        self.pending_actions.append(recommendation)
+        self._register_pending(recommendation)
         return recommendation
     
-    def suggest_corrective_action(self, issue: Dict) -> Dict:
+    def suggest_corrective_action(self, issue: Dict) -> CorrectiveAction:
         """Suggest specific corrective actions for an issue."""
         category = issue.get("issue_category", "unknown")
         
-        # Rule-based suggestions (deterministic, auditable)
-        action_map = {
-            "missing_data": {
-                "action": "Request data entry completion",
-                "steps": [
-                    "Identify missing fields in source documents",
-                    "Contact site coordinator for data retrieval",
-                    "Update eCRF with corrected values",
-                    "Add comment explaining the delay"
-                ],
-                "owner": "Site Coordinator"
-            },
-            "query_backlog": {
-                "action": "Prioritize query resolution",
-                "steps": [
-                    "Review oldest open queries first",
-                    "Group related queries for efficient resolution",
-                    "Schedule dedicated query review sessions",
-                    "Escalate queries older than 14 days"
-                ],
-                "owner": "CRA"
-            },
-            "delayed_visits": {
-                "action": "Reschedule patient visits",
-                "steps": [
-                    "Contact affected patients for rescheduling",
-                    "Document reason for original delay",
-                    "Update visit schedule in system",
-                    "Assess protocol deviation if applicable"
-                ],
-                "owner": "Site"
-            },
-            "data_inconsistency": {
-                "action": "Clean and standardize data",
-                "steps": [
-                    "Identify inconsistent data patterns",
-                    "Verify against source documents",
-                    "Apply data corrections",
-                    "Add data management notes"
-                ],
-                "owner": "Data Manager"
-            }
-        }
-        
-        suggestion = action_map.get(category, {
-            "action": "Review and address issue",
-            "steps": ["Review issue details", "Determine root cause", "Implement correction"],
-            "owner": "Study Team"
-        })
+        suggestion = _ACTION_MAP.get(category, _DEFAULT_ACTION)
         
-        return {
-            "type": "corrective_action",
-            "status": "suggested",
-            "issue_id": issue.get("issue_id"),
-            "category": category,
-            "suggested_action": suggestion["action"],
-            "steps": suggestion["steps"],
-            "suggested_owner": suggestion["owner"],
-            "metadata": {
+        return CorrectiveAction(
+            issue_id=issue.get("issue_id"),
+            category=category,
+            suggested_action=suggestion["action"],
+            steps=suggestion["steps"],
+            suggested_owner=suggestion["owner"],
+            metadata={
                 "auto_generated": True,
                 "confidence": "rule_verified"
             }
-        }
+        )
     
-    def get_pending_actions(self) -> List[Dict]:
+    def get_pending_actions(self) -> List[AgentAction]:
         """Get all pending actions awaiting approval."""
-        return [a for a in self.pending_actions if a.get("status") == "pending_approval"]
+        if not self._pending_count:
+            return []
+        # The key index only holds undecided actions, so decided ones aren't rescanned
+        return [a for a in self._pending_by_key.values() if a.status == "pending_approval"]
+    
+    def approve_by_key(self, action_key: str, approved_by: str = "user") -> Union[AgentAction, Dict]:
+        """Approve a pending action by its action_key."""
+        action = self._pending_by_key.pop(action_key, None)
+        if action is None:
+            return {"error": "Action not found"}
+        self._count_transition(action, "approved")
+        action.status = "approved"
+        action.approved_at = _utcnow().isoformat()
+        action.approved_by = approved_by
+        self.action_history.append(action)
+        return action
     
-    def approve_action(self, action_index: int, approved_by: str = "user") -> Dict:
-        """Approve a pending action for execution."""
+    def reject_by_key(self, action_key: str, reason: str = "") -> Union[AgentAction, Dict]:
+        """Reject a pending action by its action_key."""
+        action = self._pending_by_key.pop(action_key, None)
+        if action is None:
+            return {"error": "Action not found"}
+        self._count_transition(action, "rejected")
+        action.status = "rejected"
+        action.rejected_at = _utcnow().isoformat()
+        action.rejection_reason = reason
+        self.action_history.append(action)
+        return action
+    
+    def approve_action(self, action_index: int, approved_by: str = "user") -> Union[AgentAction, Dict]:
+        """Approve a pending action by list position (prefer approve_by_key)."""
         if 0 <= action_index < len(self.pending_actions):
             action = self.pending_actions[action_index]
-            action["status"] = "approved"
-            action["approved_at"] = datetime.utcnow().isoformat()
-            action["approved_by"] = approved_by
-            self.action_history.append(action)
-            return action
+            # Re-index decided actions so the positional API keeps its old behaviour
+            self._pending_by_key.setdefault(action.action_key, action)
+            return self.approve_by_key(action.action_key, approved_by)
         return {"error": "Action not found"}
     
-    def reject_action(self, action_index: int, reason: str = "") -> Dict:
-        """Reject a pending action."""
+    def reject_action(self, action_index: int, reason: str = "") -> Union[AgentAction, Dict]:
+        """Reject a pending action by list position (prefer reject_by_key)."""
         if 0 <= action_index < len(self.pending_actions):
             action = self.pending_actions[action_index]
-            action["status"] = "rejected"
-            action["rejected_at"] = datetime.utcnow().isoformat()
-            action["rejection_reason"] = reason
-            self.action_history.append(action)
-            return action
+            self._pending_by_key.setdefault(action.action_key, action)
+            return self.reject_by_key(action.action_key, reason)
         return {"error": "Action not found"}
     
     def clear_pending(self):
         """Clear all pending actions."""
         self.pending_actions = []
+        self._pending_by_key = {}
+        self._pending_count = 0
+    
+    def _count_transition(self, action: AgentAction, new_status: str):
+        """Update running counters for an action moving to a new status."""
+        old_status = action.status
+        if old_status == "pending_approval":
+            self._pending_count -= 1
+        elif old_status == "approved":
+            self._approved_count -= 1
+        elif old_status == "rejected":
+            self._rejected_count -= 1
+        
+        if new_status == "approved":
+            self._approved_count += 1
+        elif new_status == "rejected":
+            self._rejected_count += 1
+    
+    def export_actions(self) -> bytes:
+        """Serialize pending actions and action history to JSON bytes."""
+        return orjson.dumps({
+            "pending_actions": self.pending_actions,
+            "action_history": self.action_history
+        }, option=_ORJSON_OPTIONS)
+    
+    def save_action_history(self, path: str):
+        """Persist the action history (audit log) as JSON."""
+        Path(path).write_bytes(orjson.dumps(self.action_history, option=_ORJSON_OPTIONS))
+    
+    def load_action_history(self, path: str):
+        """Restore a previously saved action history and its status counts."""
+        self.action_history = [
+            _ACTION_TYPES[data["type"]](**data)
+            for data in orjson.loads(Path(path).read_bytes())
+        ]
+        status_counts = Counter(a.status for a in self.action_history)
+        self._approved_count = status_counts["approved"]
+        self._rejected_count = status_counts["rejected"]
     
     def get_action_summary(self) -> Dict:
         """Get summary of all actions."""
         return {
-            "pending": len([a for a in self.pending_actions if a.get("status") == "pending_approval"]),
-            "approved": len([a for a in self.action_history if a.get("status") == "approved"]),
-            "rejected": len([a for a in self.action_history if a.get("status") == "rejected"]),
+            "pending": self._pending_count,
+            "approved": self._approved_count,
+            "rejected": self._rejected_count,
             "total_actions": len(self.pending_actions) + len(self.action_history)
         }
 
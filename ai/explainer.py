@@ -1,13 +1,61 @@
 """
 AI Explainer - Generates natural language explanations for insights
 """
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+import hashlib
+import heapq
+import re
+import threading
+from itertools import islice
+from operator import itemgetter
+
+from cachetools import LRUCache, TTLCache
+
+# Question routing: one lookahead scan finds every keyword (substring match,
+# so "labs", "flagged" and "sites" still route as before)
+_ROUTING_KEYWORDS = (
+    "backlog", "missing", "lab", "why", "flag", "top", "main", "frequent",
+    "operational", "risk", "site", "attention", "need", "quality"
+)
+_KEYWORD_RE = re.compile(r"(?=(" + "|".join(_ROUTING_KEYWORDS) + r"))")
+_SITE_RE = re.compile(r"site\s*(\d+)")
+
+_MISSING_LAB_WORDS = frozenset({"missing", "lab"})
+_SITE_QUESTION_WORDS = frozenset({"why", "flag"})
+_TOP_WORDS = frozenset({"top", "main", "frequent"})
+_WHY_RISK_WORDS = frozenset({"why", "risk"})
+_ATTENTION_WORDS = frozenset({"attention", "need"})
+
+
+def _build_site_index(site_risks: Dict) -> Dict[str, str]:
+    """Map site ids and their numeric tails to the full site id."""
+    index = {}
+    # Exact ids take precedence over numeric tails
+    for sid in site_risks:
+        index.setdefault(str(sid), sid)
+    for sid in site_risks:
+        tail = str(sid).split('-')[-1].lstrip('0') or '0'
+        index.setdefault(tail, sid)
+    return index
 
 
 class AIExplainer:
     """Generates clear, non-technical explanations for clinical trial insights."""
     
+    ANSWER_CACHE_SIZE = 512
+    ANSWER_CACHE_TTL = 600  # seconds
+    TOP_ISSUE_TYPES = 10
+    
     def __init__(self):
+        # Answers are deterministic for a given question + analysis snapshot
+        self._answer_cache = TTLCache(maxsize=self.ANSWER_CACHE_SIZE, ttl=self.ANSWER_CACHE_TTL)
+        self._answer_cache_lock = threading.Lock()  # TTLCache is not thread-safe; sessions share it
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # id(site_risks) -> (site_risks, index); holding site_risks keeps its id from
+        # being reused, so the identity check is sound across sessions sharing this explainer
+        self._site_indexes = LRUCache(maxsize=32)
+        self._site_indexes_lock = threading.Lock()
         self.issue_descriptions = {
             "missing_lab_names": "Missing laboratory names in the data",
             "missing_reference_ranges": "Missing reference ranges for lab values",
@@ -19,19 +67,34 @@ class AIExplainer:
             "delayed_data_entry": "Data entry that is delayed after patient visits"
         }
     
+    def ingest(self, study_analysis: Dict):
+        """Index a study's site ids for fast "why site X" lookups."""
+        self._site_index(study_analysis.get("site_risks", {}))
+    
+    def _site_index(self, site_risks: Dict) -> Dict[str, str]:
+        """The site index for this exact site_risks mapping, built once and never shared across studies."""
+        with self._site_indexes_lock:
+            entry = self._site_indexes.get(id(site_risks))
+        if entry is not None and entry[0] is site_risks:
+            return entry[1]
+        index = _build_site_index(site_risks)
+        with self._site_indexes_lock:
+            self._site_indexes[id(site_risks)] = (site_risks, index)
+        return index
+    
     def explain_study_risk(self, study_analysis: Dict) -> str:
         """Generate explanation for why a study has its risk level."""
         study_risk = study_analysis.get("study_risk", {})
         risk_level = study_risk.get("risk_level", "Unknown")
         
-        explanation = f"## Study Risk Assessment: {risk_level}\n\n"
+        parts = [f"## Study Risk Assessment: {risk_level}\n\n"]
         
         if risk_level == "High Risk":
-            explanation += "This study requires **immediate attention**. "
+            parts.append("This study requires **immediate attention**. ")
         elif risk_level == "Medium Risk":
-            explanation += "This study has some concerns that should be monitored. "
+            parts.append("This study has some concerns that should be monitored. ")
         else:
-            explanation += "This study is performing well overall. "
+            parts.append("This study is performing well overall. ")
         
         # Add site breakdown
         total = study_risk.get("total_sites", 0)
@@ -39,99 +102,143 @@ class AIExplainer:
         medium = study_risk.get("medium_risk_sites", 0)
         
         if total > 0:
-            explanation += f"\n\n**Site Summary:**\n"
-            explanation += f"- {high} of {total} sites ({study_risk.get('high_risk_pct', 0)}%) are high risk\n"
-            explanation += f"- {medium} sites are medium risk\n"
-            explanation += f"- {total - high - medium} sites are performing well\n"
+            parts.append(f"\n\n**Site Summary:**\n")
+            parts.append(f"- {high} of {total} sites ({study_risk.get('high_risk_pct', 0)}%) are high risk\n")
+            parts.append(f"- {medium} sites are medium risk\n")
+            parts.append(f"- {total - high - medium} sites are performing well\n")
         
         # Add contributing factors
         factors = study_risk.get("contributing_factors", [])
         if factors:
-            explanation += f"\n**Key Concerns:**\n"
+            parts.append(f"\n**Key Concerns:**\n")
             for factor in factors:
-                explanation += f"- {factor}\n"
+                parts.append(f"- {factor}\n")
         
-        return explanation
+        return "".join(parts)
     
     def explain_site_risk(self, site_id: str, site_risk: Dict, 
                           quality_issues: List[Dict], operational_issues: List[Dict]) -> str:
         """Generate explanation for why a site has its risk level."""
         risk_level = site_risk.get("risk_level", "Unknown")
+        desc_map = self.issue_descriptions
         
-        explanation = f"## Site {site_id}: {risk_level}\n\n"
+        parts = [f"## Site {site_id}: {risk_level}\n\n"]
         
         if risk_level == "High Risk":
-            explanation += "This site needs **priority intervention**. "
-            explanation += "Multiple issues are present affecting both data quality and operations.\n\n"
+            parts.append("This site needs **priority intervention**. ")
+            parts.append("Multiple issues are present affecting both data quality and operations.\n\n")
         elif risk_level == "Medium Risk":
-            explanation += "This site has some issues that should be addressed proactively.\n\n"
+            parts.append("This site has some issues that should be addressed proactively.\n\n")
         else:
-            explanation += "This site is performing within acceptable parameters.\n\n"
+            parts.append("This site is performing within acceptable parameters.\n\n")
         
         # Detail quality issues
         if quality_issues:
-            explanation += "**Data Quality Issues:**\n"
+            parts.append("**Data Quality Issues:**\n")
             for issue in quality_issues:
-                desc = issue.get("description", self.issue_descriptions.get(issue.get("type", ""), ""))
+                desc = issue.get("description") or desc_map.get(issue.get("type", ""), "")
                 severity = issue.get("severity", "")
-                explanation += f"- [{severity}] {desc}\n"
+                parts.append(f"- [{severity}] {desc}\n")
         
         # Detail operational issues
         if operational_issues:
-            explanation += "\n**Operational Issues:**\n"
+            parts.append("\n**Operational Issues:**\n")
             for issue in operational_issues:
-                desc = issue.get("description", self.issue_descriptions.get(issue.get("type", ""), ""))
+                desc = issue.get("description") or desc_map.get(issue.get("type", ""), "")
                 severity = issue.get("severity", "")
-                explanation += f"- [{severity}] {desc}\n"
+                parts.append(f"- [{severity}] {desc}\n")
         
-        return explanation
+        return "".join(parts)
     
     def answer_question(self, question: str, study_analysis: Dict) -> str:
-        """Answer a natural language question about the study."""
+        """Answer a natural language question about the study (TTL-cached)."""
         question_lower = question.lower()
         
-        study_id = study_analysis.get("study_id", "Unknown")
+        cache_key = self._answer_cache_key(question_lower, study_analysis)
+        with self._answer_cache_lock:
+            cached = self._answer_cache.get(cache_key)
+            if cached is not None:
+                self._cache_hits += 1
+                return cached
+            self._cache_misses += 1
+        
+        answer = self._answer_question(question_lower, study_analysis)
+        with self._answer_cache_lock:
+            self._answer_cache[cache_key] = answer
+        return answer
+    
+    def _answer_cache_key(self, question_lower: str, study_analysis: Dict) -> bytes:
+        """Build a stable cache key from the question and an analysis fingerprint."""
+        study_risk = study_analysis.get("study_risk", {})
+        fingerprint = "|".join([
+            question_lower,
+            str(study_analysis.get("study_id", "")),
+            str(study_risk.get("risk_level")),
+            str(study_analysis.get("quality_issues", {}).get("total_issues")),
+            str(study_analysis.get("operational_issues", {}).get("total_issues")),
+        ])
+        return hashlib.blake2b(fingerprint.encode(), digest_size=16).digest()
+    
+    def get_cache_stats(self) -> Dict:
+        """Get answer cache hit/miss statistics."""
+        with self._answer_cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "size": len(self._answer_cache)
+            }
+    
+    def clear_cache(self):
+        """Clear cached answers (e.g. after a study is re-analyzed)."""
+        with self._answer_cache_lock:
+            self._answer_cache.clear()
+    
+    def _answer_question(self, question_lower: str, study_analysis: Dict) -> str:
+        """Dispatch a lower-cased question to the matching explanation builder."""
         study_risk = study_analysis.get("study_risk", {})
         site_risks = study_analysis.get("site_risks", {})
         quality_issues = study_analysis.get("quality_issues", {})
         operational_issues = study_analysis.get("operational_issues", {})
         
+        # Single regex pass collects every routing keyword present in the question
+        keywords = set(_KEYWORD_RE.findall(question_lower))
+        
         # Query backlog specific questions
-        if "backlog" in question_lower:
+        if "backlog" in keywords:
             return self._explain_backlog(site_risks, operational_issues)
         
         # Missing labs contribution
-        if "missing" in question_lower and "lab" in question_lower:
+        if _MISSING_LAB_WORDS <= keywords:
             return self._explain_missing_labs_impact(quality_issues, study_risk)
         
         # Specific site questions "why site X"
-        import re
-        site_match = re.search(r'site\s*(\d+)', question_lower)
-        if site_match and ("why" in question_lower or "flag" in question_lower):
-            site_id_q = site_match.group(1)
-            return self._explain_specific_site(site_id_q, site_risks, quality_issues, operational_issues)
+        if keywords & _SITE_QUESTION_WORDS:
+            site_match = _SITE_RE.search(question_lower)
+            if site_match:
+                site_id_q = site_match.group(1)
+                return self._explain_specific_site(site_id_q, site_risks, quality_issues, operational_issues)
         
         # Top/main issues
-        if "top" in question_lower or "main" in question_lower or "frequent" in question_lower:
-            if "operational" in question_lower:
+        if keywords & _TOP_WORDS:
+            if "operational" in keywords:
                 return self._explain_top_issues(operational_issues, "operational")
             else:
                 return self._explain_top_issues(quality_issues, "quality")
         
         # Why is study high risk?
-        if "why" in question_lower and "risk" in question_lower:
+        if _WHY_RISK_WORDS <= keywords:
             return self.explain_study_risk(study_analysis)
         
         # Which sites need attention?
-        if "site" in question_lower and ("attention" in question_lower or "need" in question_lower):
+        if "site" in keywords and keywords & _ATTENTION_WORDS:
             return self._explain_sites_needing_attention(site_risks, quality_issues, operational_issues)
         
         # What are the main data quality issues?
-        if "quality" in question_lower:
+        if "quality" in keywords:
             return self._explain_quality_issues(quality_issues)
         
         # What are the operational issues?
-        if "operational" in question_lower:
+        if "operational" in keywords:
             return self._explain_operational_issues(operational_issues)
         
         # Default summary
@@ -139,36 +246,37 @@ class AIExplainer:
     
     def _explain_backlog(self, site_risks: Dict, operational_issues: Dict) -> str:
         """Explain which sites have the biggest query backlog."""
-        explanation = "## Query Backlog Analysis\n\n"
+        parts = ["## Query Backlog Analysis\n\n"]
         
         backlog_issues = operational_issues.get("by_type", {}).get("query_backlog", [])
         
         if not backlog_issues:
-            return explanation + "No significant query backlog detected in this study."
+            parts.append("No significant query backlog detected in this study.")
+            return "".join(parts)
         
-        # Sort by count
-        sorted_issues = sorted(backlog_issues, key=lambda x: x.get("count", 0), reverse=True)
+        # Sort by count (defaults resolved once; caller's issue dicts are not modified)
+        sorted_issues = sorted(((i.get("count", 0), i) for i in backlog_issues),
+                               key=itemgetter(0), reverse=True)
         
-        explanation += "**Sites with highest query backlog:**\n\n"
-        for issue in sorted_issues[:5]:
+        parts.append("**Sites with highest query backlog:**\n\n")
+        for count, issue in islice(sorted_issues, 5):
             site_id = issue.get("site_id", "Unknown")
-            count = issue.get("count", 0)
             severity = issue.get("severity", "Low")
             
             site_risk = site_risks.get(site_id, {})
             risk_level = site_risk.get("risk_level", "Unknown")
             
-            explanation += f"### Site {site_id}\n"
-            explanation += f"- **{count} open queries** (Severity: {severity})\n"
-            explanation += f"- Site Risk Level: {risk_level}\n"
-            explanation += f"- **Why:** High query counts indicate data entry issues or delayed query resolution, "
-            explanation += "which delays database lock and can impact study timelines.\n\n"
+            parts.append(f"### Site {site_id}\n")
+            parts.append(f"- **{count} open queries** (Severity: {severity})\n")
+            parts.append(f"- Site Risk Level: {risk_level}\n")
+            parts.append(f"- **Why:** High query counts indicate data entry issues or delayed query resolution, ")
+            parts.append("which delays database lock and can impact study timelines.\n\n")
         
-        return explanation
+        return "".join(parts)
     
     def _explain_missing_labs_impact(self, quality_issues: Dict, study_risk: Dict) -> str:
         """Explain how missing labs contributed to overall study risk."""
-        explanation = "## Missing Labs Impact Analysis\n\n"
+        parts = ["## Missing Labs Impact Analysis\n\n"]
         
         lab_issues = quality_issues.get("by_type", {}).get("missing_lab_names", [])
         range_issues = quality_issues.get("by_type", {}).get("missing_reference_ranges", [])
@@ -177,37 +285,40 @@ class AIExplainer:
         total_issues = quality_issues.get("total_issues", 0)
         
         if total_lab_issues == 0:
-            return explanation + "No missing lab data issues detected in this study."
+            parts.append("No missing lab data issues detected in this study.")
+            return "".join(parts)
         
         contribution_pct = (total_lab_issues / total_issues * 100) if total_issues > 0 else 0
         
-        explanation += f"**Missing lab data accounts for {total_lab_issues} of {total_issues} "
-        explanation += f"quality issues ({contribution_pct:.1f}%)**\n\n"
+        parts.append(f"**Missing lab data accounts for {total_lab_issues} of {total_issues} ")
+        parts.append(f"quality issues ({contribution_pct:.1f}%)**\n\n")
         
         if lab_issues:
-            explanation += "### Missing Lab Names\n"
-            for issue in lab_issues[:3]:
-                explanation += f"- {issue.get('description', '')} (from: {issue.get('file', '')})\n"
+            parts.append("### Missing Lab Names\n")
+            for issue in islice(lab_issues, 3):
+                parts.append(f"- {issue.get('description', '')} (from: {issue.get('file', '')})\n")
         
         if range_issues:
-            explanation += "\n### Missing Reference Ranges\n"
-            for issue in range_issues[:3]:
-                explanation += f"- {issue.get('description', '')} (from: {issue.get('file', '')})\n"
+            parts.append("\n### Missing Reference Ranges\n")
+            for issue in islice(range_issues, 3):
+                parts.append(f"- {issue.get('description', '')} (from: {issue.get('file', '')})\n")
         
-        explanation += "\n**Impact:** Missing lab data affects data completeness and can impact "
-        explanation += "regulatory submissions. Sites with lab data issues should be prioritized for follow-up."
+        parts.append("\n**Impact:** Missing lab data affects data completeness and can impact ")
+        parts.append("regulatory submissions. Sites with lab data issues should be prioritized for follow-up.")
         
-        return explanation
+        return "".join(parts)
     
     def _explain_specific_site(self, site_id: str, site_risks: Dict, 
                                 quality_issues: Dict, operational_issues: Dict) -> str:
         """Explain why a specific site was flagged."""
         # Find matching site (handle different formats)
-        matching_site = None
-        for sid in site_risks.keys():
-            if str(sid) == str(site_id) or sid.endswith(site_id):
-                matching_site = sid
-                break
+        index = self._site_index(site_risks)
+        matching_site = index.get(str(site_id)) or index.get(str(site_id).lstrip('0') or '0')
+        if not matching_site:
+            for sid in site_risks.keys():
+                if str(sid) == str(site_id) or sid.endswith(site_id):
+                    matching_site = sid
+                    break
         
         if not matching_site:
             return f"## Site {site_id}\n\nNo data found for Site {site_id} in this study."
@@ -220,112 +331,106 @@ class AIExplainer:
     
     def _explain_top_issues(self, issues_data: Dict, issue_category: str) -> str:
         """Explain the top/most frequent issues."""
-        explanation = f"## Top {issue_category.title()} Issues\n\n"
+        parts = [f"## Top {issue_category.title()} Issues\n\n"]
         
         by_type = issues_data.get("by_type", {})
         
         if not by_type:
-            return explanation + f"No {issue_category} issues detected."
+            parts.append(f"No {issue_category} issues detected.")
+            return "".join(parts)
         
-        # Count by type
-        type_counts = [(t, len(issues)) for t, issues in by_type.items()]
-        type_counts.sort(key=lambda x: x[1], reverse=True)
+        # Most frequent types by count
+        top_types = heapq.nlargest(self.TOP_ISSUE_TYPES, by_type.items(), key=lambda kv: len(kv[1]))
         
-        explanation += "**Most frequent issues (by count):**\n\n"
-        for issue_type, count in type_counts:
+        parts.append("**Most frequent issues (by count):**\n\n")
+        for issue_type, issues in top_types:
             type_desc = self.issue_descriptions.get(issue_type, issue_type)
-            explanation += f"1. **{type_desc}**: {count} occurrences\n"
+            parts.append(f"1. **{type_desc}**: {len(issues)} occurrences\n")
             
-            # Show contributing sites
-            issues = by_type.get(issue_type, [])
-            sites_affected = set()
+            # Show contributing sites: first 5 distinct in issue order, stop once found
+            sites_affected = {}
             for issue in issues:
                 site = issue.get("site_id")
-                if site:
-                    sites_affected.add(site)
+                if site and site not in sites_affected:
+                    sites_affected[site] = None
+                    if len(sites_affected) == 5:
+                        break
             if sites_affected:
-                explanation += f"   - Affects sites: {', '.join(list(sites_affected)[:5])}\n"
+                parts.append(f"   - Affects sites: {', '.join(sites_affected)}\n")
         
-        return explanation
+        return "".join(parts)
 
     
     def _explain_sites_needing_attention(self, site_risks: Dict, 
                                           quality_issues: Dict, operational_issues: Dict) -> str:
         """Explain which sites need attention and why."""
-        explanation = "## Sites Requiring Attention\n\n"
+        parts = ["## Sites Requiring Attention\n\n"]
         
-        high_risk = [(sid, data) for sid, data in site_risks.items() 
-                     if data.get("risk_level") == "High Risk"]
-        medium_risk = [(sid, data) for sid, data in site_risks.items() 
-                       if data.get("risk_level") == "Medium Risk"]
+        high_risk, medium_risk = [], []
+        for sid, data in site_risks.items():
+            level = data.get("risk_level")
+            if level == "High Risk":
+                high_risk.append((sid, data))
+            elif level == "Medium Risk":
+                medium_risk.append((sid, data))
         
         if high_risk:
-            explanation += "### High Priority Sites\n"
+            parts.append("### High Priority Sites\n")
             for site_id, data in high_risk:
                 factors = data.get("contributing_factors", [])
-                explanation += f"\n**Site {site_id}**\n"
+                parts.append(f"\n**Site {site_id}**\n")
                 for f in factors:
-                    explanation += f"- {f}\n"
+                    parts.append(f"- {f}\n")
         
         if medium_risk:
-            explanation += "\n### Monitor These Sites\n"
+            parts.append("\n### Monitor These Sites\n")
             for site_id, data in medium_risk:
                 factors = data.get("contributing_factors", [])
-                explanation += f"\n**Site {site_id}**\n"
+                parts.append(f"\n**Site {site_id}**\n")
                 for f in factors:
-                    explanation += f"- {f}\n"
+                    parts.append(f"- {f}\n")
         
         if not high_risk and not medium_risk:
-            explanation += "All sites are currently performing well with no major concerns."
+            parts.append("All sites are currently performing well with no major concerns.")
         
-        return explanation
+        return "".join(parts)
     
     def _explain_quality_issues(self, quality_results: Dict) -> str:
         """Explain data quality issues."""
-        explanation = "## Data Quality Issues\n\n"
-        
-        by_type = quality_results.get("by_type", {})
-        by_severity = quality_results.get("by_severity", {})
-        
-        if by_severity:
-            explanation += f"**Summary:** {by_severity.get('High', 0)} high, "
-            explanation += f"{by_severity.get('Medium', 0)} medium, {by_severity.get('Low', 0)} low severity\n\n"
-        
-        for issue_type, issues in by_type.items():
-            type_desc = self.issue_descriptions.get(issue_type, issue_type)
-            explanation += f"### {type_desc}\n"
-            for issue in issues[:5]:  # Limit to 5 per type
-                explanation += f"- {issue.get('description', '')}\n"
-            if len(issues) > 5:
-                explanation += f"- _...and {len(issues) - 5} more_\n"
-            explanation += "\n"
-        
-        if not by_type:
-            explanation += "No data quality issues detected."
-        
-        return explanation
+        return "".join(self.iter_explain_quality_issues(quality_results))
     
     def _explain_operational_issues(self, operational_results: Dict) -> str:
         """Explain operational issues."""
-        explanation = "## Operational Issues\n\n"
+        return "".join(self.iter_explain_operational_issues(operational_results))
+    
+    def iter_explain_quality_issues(self, quality_results: Dict) -> Iterator[str]:
+        """Yield the data quality explanation in markdown chunks (for streaming UIs)."""
+        yield "## Data Quality Issues\n\n"
+        yield from self._iter_issue_sections(quality_results, "No data quality issues detected.")
+    
+    def iter_explain_operational_issues(self, operational_results: Dict) -> Iterator[str]:
+        """Yield the operational explanation in markdown chunks (for streaming UIs)."""
+        yield "## Operational Issues\n\n"
+        yield from self._iter_issue_sections(operational_results, "No operational issues detected.")
+    
+    def _iter_issue_sections(self, results: Dict, empty_message: str) -> Iterator[str]:
+        """Yield severity summary and per-type issue sections for an issues result."""
+        desc_map = self.issue_descriptions
         
-        by_type = operational_results.get("by_type", {})
-        by_severity = operational_results.get("by_severity", {})
+        by_type = results.get("by_type", {})
+        by_severity = results.get("by_severity", {})
         
         if by_severity:
-            explanation += f"**Summary:** {by_severity.get('High', 0)} high, "
-            explanation += f"{by_severity.get('Medium', 0)} medium, {by_severity.get('Low', 0)} low severity\n\n"
+            yield (f"**Summary:** {by_severity.get('High', 0)} high, "
+                   f"{by_severity.get('Medium', 0)} medium, {by_severity.get('Low', 0)} low severity\n\n")
         
         for issue_type, issues in by_type.items():
-            type_desc = self.issue_descriptions.get(issue_type, issue_type)
-            explanation += f"### {type_desc}\n"
-            for issue in issues[:5]:
-                explanation += f"- {issue.get('description', '')}\n"
+            type_desc = desc_map.get(issue_type, issue_type)
+            yield f"### {type_desc}\n"
+            yield from (f"- {issue.get('description', '')}\n" for issue in islice(issues, 5))  # Limit to 5 per type
             if len(issues) > 5:
-                explanation += f"- _...and {len(issues) - 5} more_\n"
-            explanation += "\n"
+                yield f"- _...and {len(issues) - 5} more_\n"
+            yield "\n"
         
         if not by_type:
-            explanation += "No operational issues detected."
-        
-        return explanation
+            yield empty_message
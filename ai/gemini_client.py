@@ -1,9 +1,186 @@
 """
 Gemini AI Client - Read-only AI integration for insights and explanations
 """
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import itertools
 import os
 import json
+import re
+import tempfile
+import threading
+import time
+
+import orjson
+from cachetools import TTLCache
+
+# Imported once per process; the SDK pulls in grpc/protobuf and is slow to load
+try:
+    import google.generativeai as genai
+    _GENAI_AVAILABLE = True
+except ImportError:
+    genai = None
+    _GENAI_AVAILABLE = False
+
+
+# One google-genai client (and its pooled HTTP connections) per API key, shared process-wide
+_genai_clients: Dict[str, object] = {}
+_genai_clients_lock = threading.Lock()
+
+
+def _get_genai_client(api_key: str):
+    """Get the shared google-genai client for an API key, creating it on first use."""
+    client = _genai_clients.get(api_key)
+    if client is None:
+        with _genai_clients_lock:
+            client = _genai_clients.get(api_key)
+            if client is None:
+                import httpx
+                from google import genai as genai_sdk
+                from google.genai import types
+                
+                client = genai_sdk.Client(
+                    api_key=api_key,
+                    http_options=types.HttpOptions(
+                        async_client_args={
+                            "limits": httpx.Limits(max_connections=100, max_keepalive_connections=50)
+                        }
+                    )
+                )
+                _genai_clients[api_key] = client
+    return client
+
+
+_BASE_CONTEXT = """You are an AI assistant for clinical trial intelligence. 
+You are analyzing STRUCTURED ANALYTICS DATA (not raw patient data).
+Your role is READ-ONLY: explain findings, identify patterns, and provide recommendations.
+You must NOT suggest any automated actions. All recommendations are advisory for human review.
+Keep responses concise and actionable for clinical trial teams."""
+
+# Prompt templates by type; only the selected one is formatted per call
+_PROMPT_TEMPLATES: Dict[str, str] = {
+    "summary": """{base}
+
+Provide a executive summary of this clinical trial file analysis:
+
+{analytics}
+
+Include:
+1. Overall risk assessment (1-2 sentences)
+2. Key findings (top 3)
+3. Recommended focus areas""",
+    
+    "explanation": """{base}
+
+Explain WHY this file has its risk level based on the detected issues:
+
+{analytics}
+
+Use non-technical language. Reference specific issue counts and types.
+Explain the clinical significance of the findings.""",
+    
+    "pattern": """{base}
+
+Analyze patterns across the extracted tables in this file:
+
+{analytics}
+
+Identify:
+1. Cross-table correlations (if any)
+2. Recurring issues across sheets
+3. Data quality trends""",
+    
+    "recommendation": """{base}
+
+Based on this analysis, provide role-specific recommendations:
+
+{analytics}
+
+Provide structured recommendations for:
+- CRA (Clinical Research Associate): Site-level actions
+- CTT (Clinical Trial Team): Data quality focus
+- Management: Resource allocation priorities
+
+Remember: All recommendations are ADVISORY ONLY. No automated actions.""",
+
+    "qa": """{base}
+
+Answer questions about this clinical trial data based on the analytics:
+
+{analytics}
+
+Provide clear, specific answers referencing the data provided.""",
+
+    "comparison": """{base}
+
+Compare these two clinical trial studies:
+
+{analytics}
+
+Analyze and provide:
+1. Key differences in risk profiles between the studies
+2. Which study has better data quality and why
+3. Common issues appearing in both studies
+4. Specific recommendations for each study
+5. Which study requires more immediate attention
+
+Be specific and reference actual numbers from the data."""
+}
+
+# Per-type directives used when base context + analytics go in the system instruction
+_DIRECTIVES: Dict[str, str] = {
+    prompt_type: template.replace("{base}\n\n", "").replace("\n\n{analytics}\n\n", "\n\n")
+    for prompt_type, template in _PROMPT_TEMPLATES.items()
+}
+
+# Q&A template plus the question, filled in a single format() call
+_QA_TEMPLATE = _PROMPT_TEMPLATES["qa"] + """
+
+User Question: {question}
+
+Provide a clear, specific answer based only on the data provided above."""
+
+# Fallback text tables, indexed by boolean/threshold counts instead of if/elif ladders
+_SEVERITY_STATUS_MSG = (
+    "**Status:** No critical issues detected. Continue routine monitoring.\n",
+    "**Recommendation:** Prioritize review of high-severity issues before database lock.\n",
+)
+_HIGH_SEV_MSG = (
+    "",
+    "- Some high-severity issues require attention\n",
+    "- Multiple high-severity issues indicate significant data quality concerns\n",
+)
+_ISSUE_VOLUME_MSG = (
+    "",
+    "- High volume of total issues across tables\n",
+)
+
+# Fallback Q&A routing: one regex pass over the question, keywords ranked by priority
+_QA_RE = re.compile(r"risk|table|extract|issue")
+
+# Several keyed prompts answered in one request (see GeminiClient.generate_combined)
+_COMBINED_PROMPT = """Answer each of the following tasks independently.
+Return ONLY a JSON object that maps every task key to the full text of its answer.
+
+TASKS (JSON, key -> task):
+"""
+_JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_QA_PRIORITY = {"risk": 0, "table": 1, "extract": 1, "issue": 2}
+_QA_ANSWERS = {
+    "risk": "The current risk level is **{risk_level}** based on {total_issues} detected issues across {total_tables} tables.",
+    "table": "**{total_tables} tables** were extracted from this file across multiple sheets.",
+    "extract": "**{total_tables} tables** were extracted from this file across multiple sheets.",
+    "issue": "**{total_issues} issues** were detected. Check the Issues tab for full traceability.",
+    None: "This file has {total_tables} extracted tables with {total_issues} issues. Risk level: {risk_level}.",
+}
+
+
+# Successful Gemini insights, shared by all clients, keyed by an exact hash of
+# the analytics so changed issues always produce a fresh insight.
+_insight_cache = TTLCache(maxsize=256, ttl=3600)
+_insight_cache_lock = threading.Lock()
 
 
 class GeminiClient:
@@ -16,38 +193,96 @@ class GeminiClient:
     - Advisory output: All insights are recommendations, not actions
     """
     
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.environ.get("GOOGLE_API_KEY")
-        self.model = None
+    MODEL_NAME = 'gemini-2.5-flash-lite'
+    BATCH_MODEL_NAME = 'gemini-2.5-flash'
+    BATCH_POLL_INTERVAL = 30  # seconds
+    BATCH_TIMEOUT = 24 * 60 * 60  # Batch jobs may take up to 24h
+    PROMPT_ANALYTICS_LIMIT = 5000  # Max bytes of analytics JSON embedded in a prompt
+    KEY_COOLDOWN = 60  # seconds a quota-exhausted API key is skipped
+    
+    # Process-wide instance; use GeminiClient.get() instead of constructing directly
+    _instance: Optional["GeminiClient"] = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def get(cls, api_key: Optional[str] = None) -> "GeminiClient":
+        """Return the shared client, rebuilding it only when a different API key is supplied."""
+        instance = cls._instance
+        if instance is None or (api_key and api_key != instance.api_key):
+            with cls._lock:
+                instance = cls._instance
+                if instance is None or (api_key and api_key != instance.api_key):
+                    instance = cls(api_key=api_key)
+                    cls._instance = instance
+        return instance
+    
+    def __init__(self, api_key: Optional[str] = None, api_keys: Optional[List[str]] = None):
+        # Key pool: explicit keys, else GOOGLE_API_KEYS (comma-separated), else GOOGLE_API_KEY
+        if api_keys is None:
+            if api_key:
+                api_keys = [api_key]
+            else:
+                env_keys = os.environ.get("GOOGLE_API_KEYS", "")
+                api_keys = [k.strip() for k in env_keys.split(",") if k.strip()]
+                if not api_keys and os.environ.get("GOOGLE_API_KEY"):
+                    api_keys = [os.environ["GOOGLE_API_KEY"]]
+        self.api_keys = api_keys
+        self.api_key = api_keys[0] if api_keys else None
+        self._key_cycle = itertools.cycle(api_keys) if api_keys else None
+        self._key_lock = threading.Lock()
+        self._cooldown: Dict[str, float] = {}
+        self.last_key_id: Optional[str] = None
+        # GenerativeModels with the analytics baked into the system instruction
+        self._system_models = TTLCache(maxsize=16, ttl=600)
+        self._system_models_lock = threading.Lock()
+        self.model = None  # google-generativeai model; only used when google-genai is missing
+        self._client = None  # this key's google-genai client (per-key, never process-global config)
         self._initialized = False
         
         if self.api_key:
             self._initialize_client()
     
     def _initialize_client(self):
-        """Initialize the Gemini client."""
+        """
+        Initialize the Gemini client.
+        
+        Calls go through the per-key google-genai client. genai.configure() is
+        process-global, so google-generativeai is only a fallback when google-genai
+        is not installed.
+        """
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+            self._client = _get_genai_client(self.api_key)
             self._initialized = True
+            return
         except ImportError:
+            print("Warning: google-genai not installed. Falling back to google-generativeai.")
+        except Exception as e:
+            print(f"Warning: Failed to initialize google-genai client: {e}")
+        
+        if not _GENAI_AVAILABLE:
             print("Warning: google-generativeai not installed. AI features disabled.")
+            return
+        try:
+            genai.configure(api_key=self.api_key)
+            self.model = genai.GenerativeModel(self.MODEL_NAME)
+            self._initialized = True
         except Exception as e:
             print(f"Warning: Failed to initialize Gemini: {e}")
     
     @property
     def is_available(self) -> bool:
         """Check if Gemini API is available."""
-        return self._initialized and self.model is not None
+        return self._initialized and (self._client is not None or self.model is not None)
     
-    def generate_insight(self, analytics_json: Dict, prompt_type: str = "summary") -> Dict:
+    def generate_insight(self, analytics_json: Dict, prompt_type: str = "summary",
+                         analytics_summary: Optional[str] = None) -> Dict:
         """
         Generate insights from structured analytics data.
         
         Args:
             analytics_json: Structured analytics output (NOT raw Excel data)
             prompt_type: Type of insight (summary, explanation, pattern)
+            analytics_summary: Pre-serialized analytics (reused across prompt types)
         
         Returns:
             {
@@ -60,16 +295,29 @@ class GeminiClient:
         if not self.is_available:
             return self._fallback_insight(analytics_json, prompt_type)
         
+        cache_key = self._insight_cache_key(analytics_json, prompt_type)
+        cached = self._get_cached_insight(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            prompt = self._build_prompt(analytics_json, prompt_type)
-            response = self.model.generate_content(prompt)
+            if analytics_summary is not None and len(self.api_keys) < 2:
+                # Shared summary: send only the short directive, analytics in the system instruction
+                text = self._generate_directive(analytics_summary, _DIRECTIVES.get(prompt_type, _DIRECTIVES["summary"]))
+                key_id = self._mask_key(self.api_key)
+            else:
+                prompt = self._build_prompt(analytics_json, prompt_type, analytics_summary)
+                text, key_id = self._generate_text(prompt)
             
-            return {
+            result = {
                 "success": True,
-                "insight": response.text,
+                "insight": text,
                 "prompt_type": prompt_type,
-                "input_summary": self._summarize_input(analytics_json)
+                "input_summary": self._summarize_input(analytics_json),
+                "api_key_id": key_id
             }
+            self._put_cached_insight(cache_key, result)
+            return result
         except Exception as e:
             return {
                 "success": False,
@@ -78,86 +326,401 @@ class GeminiClient:
                 "error": str(e)
             }
     
-    def _build_prompt(self, analytics_json: Dict, prompt_type: str) -> str:
-        """Build appropriate prompt based on type."""
-        base_context = """You are an AI assistant for clinical trial intelligence. 
-You are analyzing STRUCTURED ANALYTICS DATA (not raw patient data).
-Your role is READ-ONLY: explain findings, identify patterns, and provide recommendations.
-You must NOT suggest any automated actions. All recommendations are advisory for human review.
-Keep responses concise and actionable for clinical trial teams."""
-
-        analytics_summary = json.dumps(analytics_json, indent=2, default=str)[:4000]  # Limit size
+    def stream_insight(self, analytics_json: Dict, prompt_type: str = "summary") -> Iterator[str]:
+        """
+        Stream an insight as text chunks while Gemini is still generating.
         
-        prompts = {
-            "summary": f"""{base_context}
-
-Provide a executive summary of this clinical trial file analysis:
-
-{analytics_summary}
-
-Include:
-1. Overall risk assessment (1-2 sentences)
-2. Key findings (top 3)
-3. Recommended focus areas""",
-            
-            "explanation": f"""{base_context}
-
-Explain WHY this file has its risk level based on the detected issues:
-
-{analytics_summary}
-
-Use non-technical language. Reference specific issue counts and types.
-Explain the clinical significance of the findings.""",
-            
-            "pattern": f"""{base_context}
-
-Analyze patterns across the extracted tables in this file:
-
-{analytics_summary}
-
-Identify:
-1. Cross-table correlations (if any)
-2. Recurring issues across sheets
-3. Data quality trends""",
+        Yields the rule-based fallback (or a cached insight) as a single chunk.
+        The full streamed text is cached like generate_insight results.
+        """
+        if not self.is_available:
+            yield self._fallback_insight(analytics_json, prompt_type)["insight"]
+            return
+        
+        cache_key = self._insight_cache_key(analytics_json, prompt_type)
+        cached = self._get_cached_insight(cache_key)
+        if cached is not None:
+            yield cached["insight"]
+            return
+        
+        chunks = []
+        try:
+            prompt = self._build_prompt(analytics_json, prompt_type)
+            if self._client is not None:
+                stream = self._client.models.generate_content_stream(model=self.MODEL_NAME, contents=prompt)
+            else:
+                stream = self.model.generate_content(prompt, stream=True)
+            for chunk in stream:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            yield f"\n\nAI generation failed: {str(e)}. Using fallback analysis."
+            return
+        
+        self._put_cached_insight(cache_key, {
+            "success": True,
+            "insight": "".join(chunks),
+            "prompt_type": prompt_type,
+            "input_summary": self._summarize_input(analytics_json),
+            "api_key_id": self._mask_key(self.api_key)
+        })
+    
+    async def astream_insight(self, analytics_json: Dict, prompt_type: str = "summary") -> AsyncIterator[str]:
+        """Async variant of stream_insight on the pooled google-genai client."""
+        if not self.is_available or self._client is None:
+            for chunk in await asyncio.to_thread(lambda: list(self.stream_insight(analytics_json, prompt_type))):
+                yield chunk
+            return
+        
+        try:
+            prompt = self._build_prompt(analytics_json, prompt_type)
+            async for chunk in await self._client.aio.models.generate_content_stream(
+                model=self.MODEL_NAME, contents=prompt
+            ):
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            yield f"\n\nAI generation failed: {str(e)}. Using fallback analysis."
+    
+    def _generate_directive(self, analytics_summary: str, directive: str) -> str:
+        """Answer a short directive with the base context and analytics as the system instruction."""
+        if self._client is None:
+            return self._model_for(analytics_summary).generate_content(directive).text
+        return self._client.models.generate_content(
+            model=self.MODEL_NAME, contents=directive,
+            config={"system_instruction": f"{_BASE_CONTEXT}\n\nDATA:\n{analytics_summary}"}
+        ).text
+    
+    def _model_for(self, analytics_summary: str):
+        """Get a GenerativeModel whose system instruction holds the base context and analytics."""
+        key = hashlib.blake2b(analytics_summary.encode(), digest_size=16).digest()
+        with self._system_models_lock:
+            model = self._system_models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(
+                    self.MODEL_NAME,
+                    system_instruction=f"{_BASE_CONTEXT}\n\nDATA:\n{analytics_summary}"
+                )
+                self._system_models[key] = model
+        return model
+    
+    def _generate_text(self, prompt: str):
+        """
+        Generate text for a prompt, rotating across the API key pool.
+        
+        With a single key this client's google-genai client is used directly. With
+        several keys, calls round-robin over per-key google-genai clients and a key
+        that hits its quota (HTTP 429) cools down for KEY_COOLDOWN seconds.
+        
+        Returns:
+            (response_text, key_id) - key_id is a masked key for the audit trail
+        """
+        if len(self.api_keys) < 2:
+            if self._client is None:
+                return self.model.generate_content(prompt).text, self._mask_key(self.api_key)
+            response = self._client.models.generate_content(model=self.MODEL_NAME, contents=prompt)
+            return response.text, self._mask_key(self.api_key)
+        
+        last_error = None
+        for _ in range(len(self.api_keys)):
+            key = self._next_key()
+            if key is None:
+                break
+            try:
+                response = _get_genai_client(key).models.generate_content(
+                    model=self.MODEL_NAME, contents=prompt
+                )
+            except Exception as e:
+                if not self._is_quota_error(e):
+                    raise
+                self._cool_down(key)
+                last_error = e
+                continue
+            self.last_key_id = self._mask_key(key)
+            return response.text, self.last_key_id
+        
+        raise RuntimeError(f"All Gemini API keys are cooling down: {last_error}")
+    
+    async def _agenerate_text(self, prompt: str):
+        """Async variant of _generate_text with the same key rotation and cooldown."""
+        if len(self.api_keys) < 2:
+            response = await self._client.aio.models.generate_content(
+                model=self.MODEL_NAME, contents=prompt
+            )
+            return response.text, self._mask_key(self.api_key)
+        
+        last_error = None
+        for _ in range(len(self.api_keys)):
+            key = self._next_key()
+            if key is None:
+                break
+            try:
+                response = await _get_genai_client(key).aio.models.generate_content(
+                    model=self.MODEL_NAME, contents=prompt
+                )
+            except Exception as e:
+                if not self._is_quota_error(e):
+                    raise
+                self._cool_down(key)
+                last_error = e
+                continue
+            self.last_key_id = self._mask_key(key)
+            return response.text, self.last_key_id
+        
+        raise RuntimeError(f"All Gemini API keys are cooling down: {last_error}")
+    
+    def _cool_down(self, key: str):
+        """Take a quota-exhausted key out of rotation for KEY_COOLDOWN seconds."""
+        print(f"Warning: Gemini key {self._mask_key(key)} quota exhausted, rotating.")
+        with self._key_lock:
+            self._cooldown[key] = time.monotonic() + self.KEY_COOLDOWN
+    
+    def _next_key(self) -> Optional[str]:
+        """Return the next API key that is not cooling down (round-robin)."""
+        now = time.monotonic()
+        with self._key_lock:
+            for _ in range(len(self.api_keys)):
+                key = next(self._key_cycle)
+                if self._cooldown.get(key, 0) <= now:
+                    return key
+        return None
+    
+    @staticmethod
+    def _is_quota_error(error: Exception) -> bool:
+        """Check if an SDK error is a rate-limit / quota (429) error."""
+        if getattr(error, "code", None) == 429:
+            return True
+        return type(error).__name__ == "ResourceExhausted" or "RESOURCE_EXHAUSTED" in str(error)
+    
+    @staticmethod
+    def _mask_key(key: Optional[str]) -> Optional[str]:
+        """Mask an API key for logging (last 4 characters only)."""
+        return f"...{key[-4:]}" if key else None
+    
+    async def agenerate_insight(self, analytics_json: Dict, prompt_type: str = "summary",
+                                analytics_summary: Optional[str] = None) -> Dict:
+        """Async variant of generate_insight sharing the pooled google-genai client."""
+        if not self.is_available:
+            return self._fallback_insight(analytics_json, prompt_type)
+        if self._client is None:
+            return await asyncio.to_thread(self.generate_insight, analytics_json, prompt_type)
+        
+        cache_key = self._insight_cache_key(analytics_json, prompt_type)
+        cached = self._get_cached_insight(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            prompt = self._build_prompt(analytics_json, prompt_type, analytics_summary)
+            text, key_id = await self._agenerate_text(prompt)
             
-            "recommendation": f"""{base_context}
-
-Based on this analysis, provide role-specific recommendations:
-
-{analytics_summary}
-
-Provide structured recommendations for:
-- CRA (Clinical Research Associate): Site-level actions
-- CTT (Clinical Trial Team): Data quality focus
-- Management: Resource allocation priorities
-
-Remember: All recommendations are ADVISORY ONLY. No automated actions.""",
-
-            "qa": f"""{base_context}
-
-Answer questions about this clinical trial data based on the analytics:
-
-{analytics_summary}
-
-Provide clear, specific answers referencing the data provided.""",
-
-            "comparison": f"""{base_context}
-
-Compare these two clinical trial studies:
-
-{analytics_summary}
-
-Analyze and provide:
-1. Key differences in risk profiles between the studies
-2. Which study has better data quality and why
-3. Common issues appearing in both studies
-4. Specific recommendations for each study
-5. Which study requires more immediate attention
-
-Be specific and reference actual numbers from the data."""
-        }
+            result = {
+                "success": True,
+                "insight": text,
+                "prompt_type": prompt_type,
+                "input_summary": self._summarize_input(analytics_json),
+                "api_key_id": key_id
+            }
+            self._put_cached_insight(cache_key, result)
+            return result
+        except Exception as e:
+            return {
+                "success": False,
+                "insight": f"AI generation failed: {str(e)}. Using fallback analysis.",
+                "prompt_type": prompt_type,
+                "error": str(e)
+            }
+    
+    def _insight_cache_key(self, analytics_json: Dict, prompt_type: str) -> bytes:
+        """Return the exact-hash cache key for an insight request."""
+        canonical = orjson.dumps(
+            analytics_json,
+            default=str,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+        return hashlib.blake2b(prompt_type.encode() + b"|" + canonical, digest_size=16).digest()
+    
+    def _get_cached_insight(self, cache_key: bytes) -> Optional[Dict]:
+        """Look up a cached insight by exact analytics hash."""
+        with _insight_cache_lock:
+            cached = _insight_cache.get(cache_key)
+        return dict(cached, cached=True) if cached is not None else None
+    
+    def _put_cached_insight(self, cache_key: bytes, result: Dict):
+        """Store a successful insight."""
+        with _insight_cache_lock:
+            _insight_cache[cache_key] = result
+    
+    def generate_insights_batch(self, analytics_json: Dict, prompt_types: List[str],
+                                use_batch_api: bool = False) -> Dict[str, Dict]:
+        """
+        Generate several insight types for the same analytics in one round-trip.
+        
+        The analytics JSON is serialized once and shared by every prompt. By default
+        the requests run concurrently on a thread pool; use_batch_api=True submits
+        them as a single Gemini Batch API job instead (cheaper, but not interactive).
+        
+        Returns:
+            {prompt_type: result} with the same result shape as generate_insight
+        """
+        if not self.is_available:
+            return {t: self._fallback_insight(analytics_json, t) for t in prompt_types}
+        
+        analytics_summary = self._analytics_summary(analytics_json)
+        
+        if use_batch_api:
+            prompts = {t: self._build_prompt(analytics_json, t, analytics_summary) for t in prompt_types}
+            texts = self.generate_batch(prompts, use_batch_api=True)
+            input_summary = self._summarize_input(analytics_json)
+            results = {}
+            for prompt_type in prompt_types:
+                if texts.get(prompt_type):
+                    results[prompt_type] = {
+                        "success": True,
+                        "insight": texts[prompt_type],
+                        "prompt_type": prompt_type,
+                        "input_summary": input_summary
+                    }
+                else:
+                    results[prompt_type] = self._fallback_insight(analytics_json, prompt_type)
+            return results
+        
+        with ThreadPoolExecutor(max_workers=max(len(prompt_types), 1)) as pool:
+            results = pool.map(
+                lambda t: self.generate_insight(analytics_json, t, analytics_summary), prompt_types
+            )
+            return dict(zip(prompt_types, results))
+    
+    def generate_batch(self, prompts: Dict[str, str], use_batch_api: bool = False) -> Dict[str, str]:
+        """
+        Generate responses for many prompts at once.
+        
+        Args:
+            prompts: {key: prompt} - key is echoed back with each response
+            use_batch_api: Submit as a single Gemini Batch API job (half cost,
+                           higher latency; blocks while polling). False runs
+                           synchronous calls.
+        
+        Returns:
+            {key: response_text} for every prompt that produced a response
+        """
+        if not prompts or not self.is_available:
+            return {}
+        
+        if use_batch_api:
+            try:
+                return self._run_batch_job(prompts)
+            except ImportError:
+                print("Warning: google-genai not installed. Falling back to synchronous generation.")
+            except Exception as e:
+                print(f"Warning: Gemini batch job failed ({e}). Falling back to synchronous generation.")
+        
+        results = {}
+        for key, prompt in prompts.items():
+            try:
+                results[key] = self._generate_text(prompt)[0]
+            except Exception as e:
+                print(f"Warning: Gemini generation failed for {key}: {e}")
+        return results
+    
+    def generate_combined(self, prompts: Dict[str, str]) -> Dict[str, str]:
+        """
+        Generate responses for several short prompts in a single request.
+        
+        The prompts are packed into one call that returns a JSON object keyed
+        like `prompts`, so N drafts pay one round trip and one shared prompt
+        prefix. Keys missing from the reply are left out of the result.
+        """
+        if not prompts or not self.is_available:
+            return {}
+        
+        packed = _COMBINED_PROMPT + orjson.dumps(prompts).decode("utf-8")
+        try:
+            text = self._generate_text(packed)[0]
+            replies = orjson.loads(_JSON_FENCE_RE.sub("", text))
+        except Exception as e:
+            print(f"Warning: Combined Gemini generation failed: {e}")
+            return {}
         
-        return prompts.get(prompt_type, prompts["summary"])
+        if not isinstance(replies, dict):
+            print("Warning: Combined Gemini response was not a JSON object.")
+            return {}
+        return {key: str(replies[key]) for key in prompts if replies.get(key)}
+    
+    def _run_batch_job(self, prompts: Dict[str, str]) -> Dict[str, str]:
+        """Submit prompts as a JSONL batch job and wait for the results."""
+        from google.genai import types
+        
+        client = self._client or _get_genai_client(self.api_key)
+        
+        # One request per line, keyed so responses can be matched back
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+            for key, prompt in prompts.items():
+                f.write(json.dumps({
+                    "key": key,
+                    "request": {"contents": [{"parts": [{"text": prompt}]}]}
+                }) + "\n")
+            jsonl_path = f.name
+        
+        try:
+            uploaded = client.files.upload(
+                file=jsonl_path,
+                config=types.UploadFileConfig(display_name="agentic-drafts", mime_type="jsonl")
+            )
+        finally:
+            os.remove(jsonl_path)
+        
+        job = client.batches.create(
+            model=self.BATCH_MODEL_NAME,
+            src=uploaded.name,
+            config={"display_name": "agentic-drafts"}
+        )
+        
+        finished_states = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED",
+                           "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+        deadline = time.monotonic() + self.BATCH_TIMEOUT
+        while job.state.name not in finished_states:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Batch job {job.name} did not finish in time")
+            time.sleep(self.BATCH_POLL_INTERVAL)
+            job = client.batches.get(name=job.name)
+        
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Batch job {job.name} ended with {job.state.name}")
+        
+        content = client.files.download(file=job.dest.file_name).decode("utf-8")
+        
+        results = {}
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            try:
+                parts = row["response"]["candidates"][0]["content"]["parts"]
+                results[row["key"]] = "".join(p.get("text", "") for p in parts)
+            except (KeyError, IndexError):
+                print(f"Warning: No response for batch key {row.get('key')}: {row.get('error')}")
+        return results
+    
+    def _analytics_summary(self, analytics_json: Dict) -> str:
+        """Serialize analytics for prompts as compact JSON (size-limited)."""
+        serialized = orjson.dumps(
+            analytics_json,
+            default=str,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+        # Truncate bytes before decoding; drop any multi-byte char split at the cut
+        return serialized[:self.PROMPT_ANALYTICS_LIMIT].decode("utf-8", errors="ignore")
+    
+    def _build_prompt(self, analytics_json: Dict, prompt_type: str,
+                      analytics_summary: Optional[str] = None) -> str:
+        """Build appropriate prompt based on type (pass analytics_summary to reuse it)."""
+        if analytics_summary is None:
+            analytics_summary = self._analytics_summary(analytics_json)
+        
+        template = _PROMPT_TEMPLATES.get(prompt_type, _PROMPT_TEMPLATES["summary"])
+        return template.format(base=_BASE_CONTEXT, analytics=analytics_summary)
     
     def _fallback_insight(self, analytics_json: Dict, prompt_type: str) -> Dict:
         """Generate rule-based insight when Gemini is unavailable."""
@@ -195,21 +758,13 @@ Be specific and reference actual numbers from the data."""
             insight += f"- {total_issues} unique issues detected (de-duplicated)\n"
             insight += f"- {high_severity} high severity issues requiring attention\n\n"
             
-            if high_severity > 0:
-                insight += "**Recommendation:** Prioritize review of high-severity issues before database lock.\n"
-            else:
-                insight += "**Status:** No critical issues detected. Continue routine monitoring.\n"
+            insight += _SEVERITY_STATUS_MSG[high_severity > 0]
         
         elif prompt_type == "explanation":
             insight += f"This {'study' if study_name else 'file'} is classified as **{risk_level}** because:\n\n"
             
-            if high_severity > 3:
-                insight += "- Multiple high-severity issues indicate significant data quality concerns\n"
-            elif high_severity > 0:
-                insight += "- Some high-severity issues require attention\n"
-            
-            if total_issues > 20:
-                insight += "- High volume of total issues across tables\n"
+            insight += _HIGH_SEV_MSG[(high_severity > 0) + (high_severity > 3)]
+            insight += _ISSUE_VOLUME_MSG[total_issues > 20]
             
             insight += f"\nThe analysis covered {total_tables} tables"
             if total_files > 0:
@@ -239,38 +794,55 @@ Be specific and reference actual numbers from the data."""
             return self._fallback_qa(question, analytics_json)
         
         try:
-            prompt = f"""{self._build_prompt(analytics_json, "qa")}
-
-User Question: {question}
-
-Provide a clear, specific answer based only on the data provided above."""
-            
-            response = self.model.generate_content(prompt)
+            prompt = self._build_qa_prompt(question, analytics_json)
+            text, key_id = self._generate_text(prompt)
             
             return {
                 "success": True,
-                "answer": response.text,
-                "question": question
+                "answer": text,
+                "question": question,
+                "api_key_id": key_id
             }
         except Exception as e:
             return self._fallback_qa(question, analytics_json)
     
+    async def aanswer_question(self, question: str, analytics_json: Dict) -> Dict:
+        """Async variant of answer_question sharing the pooled google-genai client."""
+        if not self.is_available:
+            return self._fallback_qa(question, analytics_json)
+        if self._client is None:
+            return await asyncio.to_thread(self.answer_question, question, analytics_json)
+        
+        try:
+            prompt = self._build_qa_prompt(question, analytics_json)
+            text, key_id = await self._agenerate_text(prompt)
+            
+            return {
+                "success": True,
+                "answer": text,
+                "question": question,
+                "api_key_id": key_id
+            }
+        except Exception:
+            return self._fallback_qa(question, analytics_json)
+    
+    def _build_qa_prompt(self, question: str, analytics_json: Dict) -> str:
+        """Build the Q&A prompt for a user question."""
+        return _QA_TEMPLATE.format(
+            base=_BASE_CONTEXT,
+            analytics=self._analytics_summary(analytics_json),
+            question=question
+        )
+    
     def _fallback_qa(self, question: str, analytics_json: Dict) -> Dict:
         """Fallback Q&A when Gemini unavailable."""
-        question_lower = question.lower()
+        key = min(_QA_RE.findall(question.lower()), key=_QA_PRIORITY.__getitem__, default=None)
         
-        total_tables = analytics_json.get("total_tables", 0)
-        total_issues = analytics_json.get("issues_summary", {}).get("total_issues", 0)
-        risk_level = analytics_json.get("risk_level", "Unknown")
-        
-        if "risk" in question_lower:
-            answer = f"The current risk level is **{risk_level}** based on {total_issues} detected issues across {total_tables} tables."
-        elif "table" in question_lower or "extract" in question_lower:
-            answer = f"**{total_tables} tables** were extracted from this file across multiple sheets."
-        elif "issue" in question_lower:
-            answer = f"**{total_issues} issues** were detected. Check the Issues tab for full traceability."
-        else:
-            answer = f"This file has {total_tables} extracted tables with {total_issues} issues. Risk level: {risk_level}."
+        answer = _QA_ANSWERS[key].format(
+            total_tables=analytics_json.get("total_tables", 0),
+            total_issues=analytics_json.get("issues_summary", {}).get("total_issues", 0),
+            risk_level=analytics_json.get("risk_level", "Unknown"),
+        )
         
         return {
             "success": True,
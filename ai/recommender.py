@@ -1,66 +1,113 @@
 """
 Recommender - Generates role-aware recommendations
 """
-from typing import Dict, List
+from dataclasses import dataclass
+from itertools import islice
+from types import MappingProxyType
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ._jit import RISK_CODES, SEVERITY_CODES, collect_high, encode
+
+
+def _top5(ids: Sequence[str]) -> str:
+    """Comma-join the first five ids without slicing a copy of the list."""
+    return ", ".join(islice(ids, 5))
+
+
+@dataclass(slots=True)
+class _RecInputs:
+    """Study facts the CRA/CTT rules read, flattened once per call."""
+    high_risk_sites: Tuple[str, ...]
+    missing_crf_count: Optional[int]  # None when no missing CRF page issues were reported
+    inactivated_forms: bool
+    high_query_sites: Tuple[str, ...]
+    has_delayed_visits: bool
+    has_delayed_data_entry: bool
 
 
 class Recommender:
     """Generates advisory recommendations for clinical trial teams."""
     
-    ROLES = ["CRA", "CTT", "Management"]
+    ROLES = ("CRA", "CTT", "Management")
+    
+    # Shared, read-only; Recommender holds no per-instance state
+    ROLE_FOCUS = MappingProxyType({
+        "CRA": ("site_level", "data_quality", "patient_visits"),
+        "CTT": ("operational", "timelines", "queries"),
+        "Management": ("study_level", "risk_overview", "resource_allocation")
+    })
+    
+    @staticmethod
+    def _high_risk_sites(site_risks: Dict) -> List[str]:
+        """Site ids rated High risk, via parallel id / risk-code arrays."""
+        site_ids = np.array(list(site_risks), dtype=object)
+        risk_codes = encode((data.get("risk_level") for data in site_risks.values()), RISK_CODES)
+        return site_ids[collect_high(risk_codes)].tolist()
     
-    def __init__(self):
-        self.role_focus = {
-            "CRA": ["site_level", "data_quality", "patient_visits"],
-            "CTT": ["operational", "timelines", "queries"],
-            "Management": ["study_level", "risk_overview", "resource_allocation"]
-        }
+    @staticmethod
+    def _high_query_sites(backlog: List[Dict]) -> List[str]:
+        """Site ids of High-severity query backlog issues, via parallel id / severity arrays."""
+        site_ids = np.array([i.get("site_id") for i in backlog], dtype=object)
+        severities = encode((i.get("severity") for i in backlog), SEVERITY_CODES)
+        return site_ids[collect_high(severities)].tolist()
     
-    def generate_recommendations(self, study_analysis: Dict, role: str = "Management") -> List[Dict]:
+    @classmethod
+    def generate_recommendations(cls, study_analysis: Dict, role: str = "Management") -> List[Dict]:
         """Generate role-aware recommendations."""
         recommendations = []
         
-        study_risk = study_analysis.get("study_risk", {})
-        site_risks = study_analysis.get("site_risks", {})
-        quality_issues = study_analysis.get("quality_issues", {})
-        operational_issues = study_analysis.get("operational_issues", {})
-        
         if role == "CRA":
-            recommendations.extend(self._cra_recommendations(site_risks, quality_issues))
+            recommendations.extend(cls._cra_recommendations(cls._rec_inputs(study_analysis)))
         elif role == "CTT":
-            recommendations.extend(self._ctt_recommendations(site_risks, operational_issues))
+            recommendations.extend(cls._ctt_recommendations(cls._rec_inputs(study_analysis)))
         else:  # Management
-            recommendations.extend(self._management_recommendations(study_risk, site_risks))
+            recommendations.extend(cls._management_recommendations(study_analysis.get("study_risk", {})))
         
         return recommendations
     
-    def _cra_recommendations(self, site_risks: Dict, quality_issues: Dict) -> List[Dict]:
+    @classmethod
+    def _rec_inputs(cls, study_analysis: Dict) -> _RecInputs:
+        """Flatten the nested analysis dicts into a _RecInputs."""
+        quality_by_type = study_analysis.get("quality_issues", {}).get("by_type", {})
+        op_by_type = study_analysis.get("operational_issues", {}).get("by_type", {})
+        missing_crf = quality_by_type.get("missing_crf_pages")
+        
+        return _RecInputs(
+            high_risk_sites=tuple(cls._high_risk_sites(study_analysis.get("site_risks", {}))),
+            missing_crf_count=None if missing_crf is None else len(missing_crf),
+            inactivated_forms="inactivated_forms" in quality_by_type,
+            high_query_sites=tuple(cls._high_query_sites(op_by_type.get("query_backlog", []))),
+            has_delayed_visits="delayed_visits" in op_by_type,
+            has_delayed_data_entry="delayed_data_entry" in op_by_type
+        )
+    
+    @staticmethod
+    def _cra_recommendations(inputs: _RecInputs) -> List[Dict]:
         """Generate CRA-focused recommendations."""
         recs = []
         
         # High-risk site visits
-        high_risk_sites = [sid for sid, data in site_risks.items() 
-                          if data.get("risk_level") == "High Risk"]
+        high_risk_sites = inputs.high_risk_sites
         if high_risk_sites:
             recs.append({
                 "priority": "High",
-                "action": f"Schedule monitoring visits for high-risk sites: {', '.join(high_risk_sites[:5])}",
+                "action": f"Schedule monitoring visits for high-risk sites: {_top5(high_risk_sites)}",
                 "reason": "These sites have multiple data quality and operational issues",
                 "triggered_by": ["high_risk_sites", "data_quality_issues"]
             })
         
         # Missing data follow-up
-        quality_by_type = quality_issues.get("by_type", {})
-        if "missing_crf_pages" in quality_by_type:
-            count = len(quality_by_type["missing_crf_pages"])
+        if inputs.missing_crf_count is not None:
             recs.append({
                 "priority": "Medium",
-                "action": f"Follow up on {count} missing CRF page issues with sites",
+                "action": f"Follow up on {inputs.missing_crf_count} missing CRF page issues with sites",
                 "reason": "Missing CRF pages can impact data completeness and regulatory compliance",
                 "triggered_by": ["missing_crf_pages"]
             })
         
-        if "inactivated_forms" in quality_by_type:
+        if inputs.inactivated_forms:
             recs.append({
                 "priority": "Medium",
                 "action": "Review inactivated forms for appropriate documentation",
@@ -70,26 +117,22 @@ class Recommender:
         
         return recs
     
-    def _ctt_recommendations(self, site_risks: Dict, operational_issues: Dict) -> List[Dict]:
+    @staticmethod
+    def _ctt_recommendations(inputs: _RecInputs) -> List[Dict]:
         """Generate CTT-focused recommendations."""
         recs = []
         
-        op_by_type = operational_issues.get("by_type", {})
-        
         # Query backlog
-        if "query_backlog" in op_by_type:
-            high_query_sites = [i.get("site_id") for i in op_by_type["query_backlog"] 
-                               if i.get("severity") == "High"]
-            if high_query_sites:
-                recs.append({
-                    "priority": "High",
-                    "action": f"Escalate query resolution at sites: {', '.join(high_query_sites[:5])}",
-                    "reason": "High query backlog can delay database lock",
-                    "triggered_by": ["query_backlog"]
-                })
+        if inputs.high_query_sites:
+            recs.append({
+                "priority": "High",
+                "action": f"Escalate query resolution at sites: {_top5(inputs.high_query_sites)}",
+                "reason": "High query backlog can delay database lock",
+                "triggered_by": ["query_backlog"]
+            })
         
         # Visit delays
-        if "delayed_visits" in op_by_type:
+        if inputs.has_delayed_visits:
             recs.append({
                 "priority": "Medium",
                 "action": "Review visit scheduling with sites showing delays",
@@ -98,7 +141,7 @@ class Recommender:
             })
         
         # Data entry delays
-        if "delayed_data_entry" in op_by_type:
+        if inputs.has_delayed_data_entry:
             recs.append({
                 "priority": "Medium",
                 "action": "Implement data entry reminders for sites with delays",
@@ -108,7 +151,8 @@ class Recommender:
         
         return recs
     
-    def _management_recommendations(self, study_risk: Dict, site_risks: Dict) -> List[Dict]:
+    @staticmethod
+    def _management_recommendations(study_risk: Dict) -> List[Dict]:
         """Generate Management-focused recommendations."""
         recs = []
         
@@ -142,7 +186,8 @@ class Recommender:
         
         return recs
     
-    def format_recommendations(self, recommendations: List[Dict]) -> str:
+    @staticmethod
+    def format_recommendations(recommendations: List[Dict]) -> str:
         """Format recommendations as readable text."""
         if not recommendations:
             return "No specific recommendations at this time."
@@ -157,3 +202,7 @@ class Recommender:
             output += f"**Triggered by:** {', '.join(rec.get('triggered_by', []))}\n\n"
         
         return output
+
+
+# Recommender is stateless; share one instance instead of constructing per request
+RECOMMENDER = Recommender()
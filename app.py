@@ -3,19 +3,44 @@ Clinical Trial Intelligence System - Enterprise Edition
 A Streamlit-based dashboard with database storage and Gemini AI integration
 """
 import streamlit as st
+import hashlib
+import logging
+import os
 import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Final, Iterator, List, Optional
+import numpy as np
+import orjson
 import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+import xlrd
+
+# Loaded once per process rather than on each trends render
+try:
+    import plotly.graph_objects as go
+except ImportError:
+    go = None
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from database.storage import DatabaseStorage
 from database.models import ProcessingStatus, AnalysisStatus, init_database
-from core.pipeline import ProcessingPipeline
+from core.pipeline import ProcessingPipeline, summarize_sites
 from core.worker import start_async_analysis, AnalysisWorker
 from ai.gemini_client import GeminiClient
+from ai.agentic import AgenticAI, get_agentic_ai
+from config import DATA_LAKE_PATH_STR, PAGE_SIZE, SIDEBAR_STUDY_LIMIT
+
+logger = logging.getLogger(__name__)
 
 # Initialize database on startup (cached to prevent race conditions)
 @st.cache_resource
@@ -32,9 +57,17 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize theme in session state
-if "theme" not in st.session_state:
-    st.session_state.theme = "dark"  # Default theme
+# Session state defaults, applied once per rerun before the theme CSS is built
+SESSION_DEFAULTS: Final[Dict[str, object]] = {
+    "gemini_api_key": None,
+    "user_role": "CTT",
+    "theme": "dark",
+    "notification_recipients": "",
+    "selected_study_id": None,
+    "issue_page": 0,
+}
+for _key, _value in SESSION_DEFAULTS.items():
+    st.session_state.setdefault(_key, _value)
 
 # Theme color schemes
 THEMES = {
@@ -88,8 +121,28 @@ THEMES = {
 # Get current theme colors
 theme = THEMES[st.session_state.theme]
 
-# Custom CSS with theme support
-st.markdown(f"""
+# Badge colors / icons shared by the table renderers
+DEFAULT_BADGE_COLOR: Final[str] = "#6b7280"
+STATUS_COLORS: Final[Dict[str, str]] = {
+    "completed": "#22c55e",
+    "processing": "#3b82f6",
+    "pending": "#f59e0b",
+    "failed": "#ef4444"
+}
+SEVERITY_COLORS: Final[Dict[str, str]] = {"High": "#ef4444", "Medium": "#f59e0b", "Low": "#22c55e"}
+RISK_BADGE_COLORS: Final[Dict[str, str]] = {"High": "red", "Medium": "orange"}  # anything else renders green
+CONFIDENCE_BADGES: Final[Dict[str, str]] = {
+    "rule_verified": "✅",
+    "ai_explained": "⚠️",
+    "needs_review": "🧪"
+}
+
+
+@st.cache_data(show_spinner=False)
+def _build_css(theme_name: str) -> str:
+    """Build the themed stylesheet once per theme."""
+    theme = THEMES[theme_name]
+    return f"""
 <style>
     /* Main container */
     .main .block-container {{
@@ -168,9 +221,6 @@ st.markdown(f"""
     }}
     
     /* Risk badges */
-    .risk-high {{ background: #ef4444; color: white; padding: 4px 12px; border-radius: 20px; }}
-    .risk-medium {{ background: #f59e0b; color: white; padding: 4px 12px; border-radius: 20px; }}
-    .risk-low {{ background: #22c55e; color: white; padding: 4px 12px; border-radius: 20px; }}
     
     /* Table styling */
     .data-table {{ width: 100%; border-collapse: collapse; font-size: 14px; margin-top: 10px; }}
@@ -199,7 +249,11 @@ st.markdown(f"""
     #MainMenu {{visibility: hidden;}}
     footer {{visibility: hidden;}}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+
+# Custom CSS with theme support (must be re-emitted each rerun or Streamlit drops it)
+st.markdown(_build_css(st.session_state.theme), unsafe_allow_html=True)
 
 
 @st.cache_resource
@@ -214,23 +268,200 @@ def get_pipeline():
     return ProcessingPipeline("database/clinical_trials.db")
 
 
+@st.cache_resource
+def get_watcher(_storage: DatabaseStorage, _pipeline: ProcessingPipeline):
+    """Initialize and cache the data lake watcher so its folder listings persist across reruns."""
+    from core.folder_watcher import FolderWatcher
+    return FolderWatcher(DATA_LAKE_PATH_STR, _storage, _pipeline)
+
+
+def _bump_files_version():
+    """Invalidate the cached file listing / summary / study list after files or studies change."""
+    st.session_state["files_version"] = st.session_state.get("files_version", 0) + 1
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _cached_files(version: int) -> List[Dict]:
+    """Uploaded files as plain dicts (ORM rows do not survive cache pickling)."""
+    return [
+        {
+            "file_id": f.file_id,
+            "filename": f.filename,
+            "processing_status": f.processing_status,
+            "table_count": len(f.extracted_tables) if f.extracted_tables else 0,
+            "upload_timestamp": f.upload_timestamp
+        }
+        for f in get_storage().get_all_files()
+    ]
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _cached_system_summary(version: int) -> Dict:
+    """System summary counts, reused across reruns until the files version changes."""
+    return get_storage().get_system_summary()
+
+
+@st.cache_data(ttl=15, show_spinner=False)
+def _cached_studies(version: int) -> List[Dict]:
+    """Sidebar study rows as plain dicts, shared by bursts of reruns."""
+    return [
+        {"study_id": s.study_id, "study_name": s.study_name, "risk_level": s.risk_level}
+        for s in get_storage().get_all_studies()
+    ]
+
+
+@st.cache_data(ttl=15, show_spinner=False)
+def _cached_alerts(role: str) -> List[Dict]:
+    """Active alerts for a role as plain dicts; cleared when an alert is acknowledged."""
+    return [
+        {
+            "alert_id": a.alert_id,
+            "severity": a.severity,
+            "title": a.title,
+            "message": a.message,
+            "rule_id": a.rule_id,
+            "created_at": a.created_at
+        }
+        for a in get_storage().get_alerts_for_role(role)
+    ]
+
+
+@st.cache_resource(show_spinner=False)
+def _gemini_for(api_key: Optional[str]) -> GeminiClient:
+    """One GeminiClient per API key, shared across reruns and sessions."""
+    if not api_key:
+        return GeminiClient.get()
+    return GeminiClient(api_key=api_key)
+
+
 def get_gemini(api_key: str = None):
     """Initialize Gemini client with optional API key."""
     # Check session state for API key first
     if api_key is None:
         api_key = st.session_state.get("gemini_api_key")
     
-    return GeminiClient(api_key=api_key)
+    return _gemini_for(api_key)
+
+
+def _warm_resources():
+    """Build the shared storage, pipeline and default Gemini client ahead of first use."""
+    try:
+        get_storage()
+        get_pipeline()
+        _gemini_for(None)
+    except Exception as e:
+        logger.warning("Resource warm-up failed: %s", e)
+
+
+@st.cache_resource(show_spinner=False)
+def _start_warmup() -> threading.Thread:
+    """Start the warm-up thread once per server process (the script body re-runs every interaction)."""
+    thread = threading.Thread(target=_warm_resources, name="resource-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+_start_warmup()
+
+
+def _risk_color(risk_level) -> str:
+    """Native badge color for a risk level such as "High Risk"."""
+    level = str(risk_level)
+    return next((color for key, color in RISK_BADGE_COLORS.items() if key in level), "green")
+
+
+def _throttle_stream(chunks: Iterator[str], interval: float = 0.1) -> Iterator[str]:
+    """Coalesce streamed chunks so st.write_stream re-renders at most every `interval` seconds."""
+    buffer = []
+    last_flush = time.monotonic()
+    for chunk in chunks:
+        buffer.append(chunk)
+        now = time.monotonic()
+        if now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
+
+
+def _spool_upload(uploaded_file):
+    """Copy an upload to a temp file in 1 MiB chunks, hashing as it goes.
+    
+    Returns (path, content_hash); the caller removes the path.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    uploaded_file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=Path(uploaded_file.name).suffix, delete=False) as tmp:
+        while chunk := uploaded_file.read(1 << 20):
+            digest.update(chunk)
+            tmp.write(chunk)
+    uploaded_file.seek(0)
+    return tmp.name, digest.hexdigest()
+
+
+PREVIEW_MAX_BYTES = 20 * 1024 * 1024  # Larger uploads list sheets only on request
 
 
-def render_file_upload():
+def _sheet_names(uploaded_file) -> List[str]:
+    """List workbook sheet names without loading sheet data or styles."""
+    uploaded_file.seek(0)
+    try:
+        if uploaded_file.name.lower().endswith(".xls"):
+            book = xlrd.open_workbook(file_contents=uploaded_file.getvalue(), on_demand=True)
+            try:
+                return book.sheet_names()
+            finally:
+                book.release_resources()
+        
+        wb = load_workbook(uploaded_file, read_only=True, keep_links=False, data_only=True)
+        try:
+            return wb.sheetnames
+        finally:
+            wb.close()
+    finally:
+        uploaded_file.seek(0)
+
+
+# Each ingest worker thread gets its own pipeline (and so its own SQLite session)
+_ingest_local = threading.local()
+
+
+def _ingest_one(uploaded_file, study_id: int) -> Dict:
+    """Save, assign and process one upload; runs on an ingest worker thread."""
+    pipeline = getattr(_ingest_local, "pipeline", None)
+    if pipeline is None:
+        pipeline = _ingest_local.pipeline = ProcessingPipeline("database/clinical_trials.db")
+    
+    # Stream to disk, then into the database
+    tmp_path, content_hash = _spool_upload(uploaded_file)
+    try:
+        # Identical bytes already processed for this study (or unassigned): reuse, skip the pipeline
+        existing = pipeline.storage.get_file_by_content_hash(content_hash, study_id)
+        if existing and existing.processing_status == ProcessingStatus.COMPLETED.value:
+            if existing.study_id is None:
+                pipeline.storage.assign_file_to_study(existing.file_id, study_id)
+            return {"file_id": existing.file_id, "success": True, "deduplicated": True}
+        
+        # Insert and study assignment share one transaction
+        file_record = pipeline.storage.save_uploaded_file_path(
+            filename=uploaded_file.name,
+            path=tmp_path,
+            content_hash=content_hash,
+            study_id=study_id
+        )
+    finally:
+        os.unlink(tmp_path)
+    
+    # Process file
+    return pipeline.process_file(file_record.file_id)
+
+
+def render_file_upload(storage: DatabaseStorage):
     """Render file upload interface with study selection."""
     st.markdown("## 📤 Upload Clinical Trial Files")
     st.markdown("Upload Excel files (.xlsx, .xls) to a clinical trial study.")
     
-    storage = get_storage()
-    pipeline = get_pipeline()
-    
     # Study Selection Section
     st.markdown("### 📋 Select or Create Study")
     
@@ -271,6 +502,7 @@ def render_file_upload():
                         st.error("Please enter a study name")
                         return
                     study = storage.create_study(new_study_name)
+                    _bump_files_version()
                 else:
                     study = storage.get_study_by_name(selected_study_option)
                 
@@ -281,29 +513,25 @@ def render_file_upload():
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                for i, uploaded_file in enumerate(uploaded_files):
-                    status_text.text(f"Processing {uploaded_file.name}...")
-                    
-                    # Read file bytes
-                    file_bytes = uploaded_file.read()
-                    
-                    # Save to database WITH STUDY ID
-                    file_record = storage.save_uploaded_file(
-                        filename=uploaded_file.name,
-                        file_bytes=file_bytes
-                    )
-                    
-                    # Assign to study
-                    storage.assign_file_to_study(file_record.file_id, study.study_id)
-                    
-                    # Process file
-                    result = pipeline.process_file(file_record.file_id)
-                    
-                    progress_bar.progress((i + 1) / len(uploaded_files))
+                status_text.text(f"Processing {len(uploaded_files)} file(s)...")
+                
+                with ThreadPoolExecutor(max_workers=min(8, len(uploaded_files))) as executor:
+                    futures = {
+                        executor.submit(_ingest_one, uploaded_file, study.study_id): uploaded_file.name
+                        for uploaded_file in uploaded_files
+                    }
+                    deduplicated = 0
+                    for i, future in enumerate(as_completed(futures), 1):
+                        deduplicated += bool(future.result().get("deduplicated"))
+                        status_text.text(f"Processed {futures[future]}")
+                        progress_bar.progress(i / len(futures))
                 
                 status_text.text("✅ All files processed!")
+                _bump_files_version()
                 
                 st.success(f"✅ Successfully processed {len(uploaded_files)} file(s) for study '{study.study_name}'")
+                if deduplicated:
+                    st.info(f"♻️ Reused {deduplicated} previously processed identical file(s)")
                 
                 # Start Async Analysis
                 status_text.text("🚀 Starting background analysis...")
@@ -316,10 +544,13 @@ def render_file_upload():
         st.markdown("### 📋 Selected Files")
         for f in uploaded_files:
             with st.expander(f"📄 {f.name} ({f.size / 1024:.1f} KB)"):
+                if f.size > PREVIEW_MAX_BYTES and not st.button("List sheets", key=f"preview_{f.file_id}"):
+                    st.caption("Large file: sheet preview skipped")
+                    continue
                 try:
-                    xl = pd.ExcelFile(f)
-                    st.markdown(f"**Sheets:** {', '.join(xl.sheet_names)}")
-                except:
+                    st.markdown(f"**Sheets:** {', '.join(_sheet_names(f))}")
+                except (zipfile.BadZipFile, InvalidFileException, xlrd.XLRDError, ValueError, KeyError):
+                    logger.exception("Sheet preview failed for %s", f.name)
                     st.markdown("_Preview not available_")
 
 
@@ -327,8 +558,8 @@ def render_files_list():
     """Render list of uploaded files."""
     st.markdown("## 📁 Uploaded Files")
     
-    storage = get_storage()
-    files = storage.get_all_files()
+    files_version = st.session_state.get("files_version", 0)
+    files = _cached_files(files_version)
     
     if not files:
         st.info("No files uploaded yet. Use the Upload tab to add files.")
@@ -336,7 +567,7 @@ def render_files_list():
     
     # Summary metrics
     col1, col2, col3, col4 = st.columns(4)
-    summary = storage.get_system_summary()
+    summary = _cached_system_summary(files_version)
     
     with col1:
         st.metric("Total Files", summary["total_files"])
@@ -349,50 +580,35 @@ def render_files_list():
     
     st.markdown("---")
     
-    # Files table
-    html = '''<table class="data-table">
-        <tr>
-            <th>File Name</th>
-            <th>Status</th>
-            <th>Tables</th>
-            <th>Upload Time</th>
-            <th>Actions</th>
-        </tr>
-    '''
-    
-    status_colors = {
-        "completed": "#22c55e",
-        "processing": "#3b82f6",
-        "pending": "#f59e0b",
-        "failed": "#ef4444"
-    }
-    
-    for f in files:
-        status = f.processing_status
-        color = status_colors.get(status, "#6b7280")
-        timestamp = f.upload_timestamp.strftime("%Y-%m-%d %H:%M") if f.upload_timestamp else ""
-        table_count = len(f.extracted_tables) if f.extracted_tables else 0
-        
-        html += f'''
-        <tr>
-            <td><strong>{f.filename}</strong></td>
-            <td><span style="background:{color}; color:white; padding:2px 8px; border-radius:4px;">{status}</span></td>
-            <td>{table_count}</td>
-            <td>{timestamp}</td>
-            <td>
-                <a href="?file_id={f.file_id}" style="color:#3b82f6;">View Details</a>
-            </td>
-        </tr>
-        '''
-    
-    html += '</table>'
-    st.markdown(html, unsafe_allow_html=True)
+    # Files table (Arrow-serialized, virtualized grid)
+    status_color = STATUS_COLORS.get
+    
+    files_df = pd.DataFrame({
+        "File Name": [f["filename"] for f in files],
+        "Status": [f["processing_status"] for f in files],
+        "Tables": [f["table_count"] for f in files],
+        "Upload Time": [f["upload_timestamp"] for f in files],
+        "Actions": [f"?file_id={f['file_id']}" for f in files]
+    })
+    
+    st.dataframe(
+        files_df.style.map(
+            lambda status: f"background-color: {status_color(status, DEFAULT_BADGE_COLOR)}; color: white",
+            subset=["Status"]
+        ),
+        column_config={
+            "Upload Time": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+            "Actions": st.column_config.LinkColumn(display_text="View Details")
+        },
+        hide_index=True,
+        use_container_width=True
+    )
     
     # File selection for detailed view
     st.markdown("---")
     st.markdown("### 🔍 Select File for Details")
     
-    file_options = {f.filename: f.file_id for f in files}
+    file_options = {f["filename"]: f["file_id"] for f in files}
     
     col1, col2 = st.columns([3, 1])
     
@@ -401,36 +617,86 @@ def render_files_list():
     
     with col2:
         st.markdown("<br>", unsafe_allow_html=True)  # Spacing
-        if st.button("📊 View Analysis", type="primary"):
-            if selected_file:
-                st.session_state["selected_file_id"] = file_options[selected_file]
-                st.rerun()
+        st.button(
+            "📊 View Analysis", type="primary",
+            disabled=not selected_file,
+            on_click=_open_file, args=(file_options.get(selected_file),)
+        )
+
+
+def _selected_file_id() -> Optional[int]:
+    """File drill-down target from the ?file_id= deep link, if any."""
+    try:
+        return int(st.query_params["file_id"])
+    except (KeyError, ValueError):
+        return None
+
 
+def _open_file(file_id: int):
+    """Route to a file's analysis; runs as a callback so the view switches on the same rerun."""
+    st.query_params["file_id"] = str(file_id)
 
-def render_file_analysis(file_id: int):
+
+def _close_file():
+    """Drop the file deep link and return to the previous view."""
+    st.query_params.pop("file_id", None)
+
+
+@dataclass(slots=True, frozen=True)
+class AnalysisView:
+    """Per-tab slices of a file's full analysis, unpacked once per render."""
+    file: Dict
+    tables: Dict
+    issues: Dict
+    result: Optional[Dict]
+    insights: List[Dict]
+    audit: Optional[Dict]
+    risk_level: str
+    high_severity: int
+    
+    @classmethod
+    def from_analysis(cls, analysis: Dict) -> "AnalysisView":
+        result = analysis.get("analysis")
+        issues = analysis.get("issues", {})
+        return cls(
+            file=analysis.get("file", {}),
+            tables=analysis.get("tables", {}),
+            issues=issues,
+            result=result,
+            insights=analysis.get("insights", []),
+            audit=analysis.get("audit"),
+            risk_level=result.get("risk_level", "Unknown") if result else "Pending",
+            high_severity=issues.get("by_severity", {}).get("High", 0)
+        )
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _cached_full_analysis(file_id: int, version: int, _pipeline: ProcessingPipeline) -> Dict:
+    """Full file analysis, reused across reruns until the files version changes."""
+    return _pipeline.get_full_analysis(file_id)
+
+
+@st.fragment
+def render_file_analysis(file_id: int, storage: DatabaseStorage, pipeline: ProcessingPipeline):
     """Render detailed analysis for a specific file."""
-    storage = get_storage()
-    pipeline = get_pipeline()
-    
-    analysis = pipeline.get_full_analysis(file_id)
+    analysis = _cached_full_analysis(file_id, st.session_state.get("files_version", 0), pipeline)
     
     if "error" in analysis:
         st.error(analysis["error"])
         return
     
-    file_info = analysis.get("file", {})
-    tables_info = analysis.get("tables", {})
-    issues_info = analysis.get("issues", {})
-    result = analysis.get("analysis", {})
-    audit_info = analysis.get("audit")
+    view = AnalysisView.from_analysis(analysis)
+    file_info = view.file
+    tables_info = view.tables
+    issues_info = view.issues
+    audit_info = view.audit
     
     # Header
     st.markdown(f"## 📊 Analysis: {file_info.get('filename', 'Unknown')}")
     
     # Risk badge
-    risk_level = result.get("risk_level", "Unknown") if result else "Pending"
-    risk_class = "high" if "High" in risk_level else "medium" if "Medium" in risk_level else "low"
-    st.markdown(f'<span class="risk-{risk_class}">{risk_level}</span>', unsafe_allow_html=True)
+    risk_level = view.risk_level
+    st.badge(risk_level, color=_risk_color(risk_level))
     
     # Extraction Audit Banner
     if audit_info:
@@ -461,8 +727,7 @@ def render_file_analysis(file_id: int):
     with col3:
         st.metric("Total Issues", issues_info.get("total_issues", 0))
     with col4:
-        high_sev = issues_info.get("by_severity", {}).get("High", 0)
-        st.metric("High Severity", high_sev)
+        st.metric("High Severity", view.high_severity)
     
     # Tabs for different views
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -477,13 +742,13 @@ def render_file_analysis(file_id: int):
         render_extracted_tables(file_id, tables_info)
     
     with tab2:
-        render_issues_traceability(file_id, issues_info)
+        render_issues_traceability(file_id, issues_info, storage)
     
     with tab3:
-        render_ai_insights(file_id, analysis)
+        render_ai_insights(file_id, view)
     
     with tab4:
-        render_analysis_summary(analysis)
+        render_analysis_summary(view)
     
     with tab5:
         render_audit_trail(file_id, audit_info)
@@ -508,7 +773,7 @@ def render_extracted_tables(file_id: int, tables_info: Dict):
                 st.markdown("---")
 
 
-def render_issues_traceability(file_id: int, issues_info: Dict):
+def render_issues_traceability(file_id: int, issues_info: Dict, storage: DatabaseStorage):
     """Render issues with full traceability and RULE EVIDENCE."""
     st.markdown("### Detected Issues with Traceability")
     
@@ -525,11 +790,11 @@ def render_issues_traceability(file_id: int, issues_info: Dict):
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.markdown(f"🔴 **High:** {by_severity.get('High', 0)}")
+        st.metric("🔴 High", by_severity.get("High", 0))
     with col2:
-        st.markdown(f"🟡 **Medium:** {by_severity.get('Medium', 0)}")
+        st.metric("🟡 Medium", by_severity.get("Medium", 0))
     with col3:
-        st.markdown(f"🟢 **Low:** {by_severity.get('Low', 0)}")
+        st.metric("🟢 Low", by_severity.get("Low", 0))
     
     st.markdown("---")
     
@@ -540,95 +805,113 @@ def render_issues_traceability(file_id: int, issues_info: Dict):
         st.success("✅ No issues detected!")
         return
     
+    _issues_fragment(file_id, storage)
+
+
+ISSUES_PER_PAGE = 50
+
+
+def _page_slice(items: List, key: str, page_size: int = PAGE_SIZE) -> List:
+    """Current page of `items`; the page selector only appears when there is more than one page."""
+    total_pages = max(1, (len(items) - 1) // page_size + 1)
+    if total_pages == 1:
+        return items
+    
+    # Clamp a remembered page that no longer exists (e.g. after deletions)
+    if st.session_state.get(key, 1) > total_pages:
+        st.session_state[key] = total_pages
+    page = st.number_input("Page", min_value=1, max_value=total_pages, step=1, key=key)
+    st.caption(f"Page {page} of {total_pages} ({len(items)} total)")
+    start = (page - 1) * page_size
+    return items[start:start + page_size]
+
+
+def _reset_issue_page():
+    st.session_state.issue_page = 0
+
+
+def _step_issue_page(step: int):
+    st.session_state.issue_page += step
+
+
+@st.fragment
+def _issues_fragment(file_id: int, storage: DatabaseStorage):
+    """Severity filter, one SQL-paged slice of issues and rule evidence; reruns alone."""
     # Filter
-    severity_filter = st.selectbox("Filter by Severity", ["All", "High", "Medium", "Low"])
+    severity_filter = st.selectbox(
+        "Filter by Severity", ["All", "High", "Medium", "Low"], on_change=_reset_issue_page
+    )
     
-    if severity_filter != "All":
-        issues = [i for i in issues if i.get("severity") == severity_filter]
+    current_page = st.session_state.issue_page
     
-    # Confidence badge mapping
-    confidence_badges = {
-        "rule_verified": "✅",
-        "ai_explained": "⚠️",
-        "needs_review": "🧪"
-    }
+    issues, total = storage.get_issues_page(
+        file_id,
+        severity=None if severity_filter == "All" else severity_filter,
+        offset=current_page * ISSUES_PER_PAGE,
+        limit=ISSUES_PER_PAGE
+    )
+    total_pages = max(1, (total - 1) // ISSUES_PER_PAGE + 1)
     
-    # Pagination Logic
-    items_per_page = 50
-    if "issue_page" not in st.session_state:
-        st.session_state.issue_page = 0
+    # Page fell off the end (issues were removed since it was chosen)
+    if current_page >= total_pages:
+        current_page = st.session_state.issue_page = 0
+        issues, total = storage.get_issues_page(
+            file_id,
+            severity=None if severity_filter == "All" else severity_filter,
+            offset=0,
+            limit=ISSUES_PER_PAGE
+        )
     
-    total_pages = max(1, (len(issues) - 1) // items_per_page + 1)
-    current_page = st.session_state.issue_page
+    confidence_badge = CONFIDENCE_BADGES.get
+    severity_color = SEVERITY_COLORS.get
     
-    # Reset page if filter changed size
-    if current_page >= total_pages:
-        current_page = 0
-        st.session_state.issue_page = 0
-        
-    start_idx = current_page * items_per_page
-    end_idx = start_idx + items_per_page
-    
-    paginated_issues = issues[start_idx:end_idx]
-    
-    html = '''<table class="data-table">
-        <tr>
-            <th>Trust</th>
-            <th>Severity</th>
-            <th>Rule ID</th>
-            <th>Description</th>
-            <th>Trigger</th>
-            <th>Sheet</th>
-            <th>Site</th>
-        </tr>
-    '''
-    
-    severity_colors = {"High": "#ef4444", "Medium": "#f59e0b", "Low": "#22c55e"}
-    
-    for issue in paginated_issues:
-        sev = issue.get("severity", "Low")
-        color = severity_colors.get(sev, "#6b7280")
-        confidence = issue.get("confidence_level", "rule_verified")
-        badge = confidence_badges.get(confidence, "✅")
-        rule_id = issue.get("rule_id", "-")
-        trigger = issue.get("trigger_condition", "-")
+    rows = []
+    append = rows.append
+    for issue in issues:
+        trigger_display = issue.get("trigger_condition", "-")
         actual = issue.get("actual_value", "-")
-        threshold = issue.get("threshold_value", "-")
         
         # Format trigger with actual value
-        trigger_display = f"{trigger}" if trigger != "-" else "-"
         if actual != "-" and actual:
-            trigger_display += f" (actual: {actual})"
-        
-        html += f'''
-        <tr>
-            <td title="{confidence}">{badge}</td>
-            <td><span style="background:{color}; color:white; padding:2px 8px; border-radius:4px;">{sev}</span></td>
-            <td><code>{rule_id}</code></td>
-            <td>{issue.get("description", "")}</td>
-            <td style="font-size:12px;">{trigger_display}</td>
-            <td>{issue.get("sheet_name", "-")}</td>
-            <td>{issue.get("site_id", "-")}</td>
-        </tr>
-        '''
-    
-    html += '</table>'
-    st.markdown(html, unsafe_allow_html=True)
-    
-    # Pagination Controls
-    st.markdown("---")
+            trigger_display = f"{trigger_display} (actual: {actual})"
+        
+        append((
+            confidence_badge(issue.get("confidence_level", "rule_verified"), "✅"),
+            issue.get("severity", "Low"),
+            str(issue.get("rule_id", "-")),
+            issue.get("description", ""),
+            str(trigger_display),
+            str(issue.get("sheet_name", "-")),
+            str(issue.get("site_id", "-"))
+        ))
+    
+    issues_df = pd.DataFrame(rows, columns=["Trust", "Severity", "Rule ID", "Description", "Trigger", "Sheet", "Site"])
+    
+    st.dataframe(
+        issues_df.style.map(
+            lambda sev: f"background-color: {severity_color(sev, DEFAULT_BADGE_COLOR)}; color: white",
+            subset=["Severity"]
+        ),
+        column_config={
+            "Trust": st.column_config.TextColumn(width="small", help="✅ Rule-Verified | ⚠️ AI-Explained | 🧪 Needs Review"),
+            "Rule ID": st.column_config.TextColumn(width="small"),
+            "Description": st.column_config.TextColumn(width="large")
+        },
+        hide_index=True,
+        use_container_width=True,
+        height=min(600, 38 + 35 * len(rows))
+    )
+    
+    # Pagination Controls (callbacks update the page before the fragment reruns)
+    start_idx = current_page * ISSUES_PER_PAGE
     col1, col2, col3 = st.columns([1, 2, 1])
     with col1:
-        if st.button("⬅️ Previous", disabled=current_page == 0):
-            st.session_state.issue_page -= 1
-            st.rerun()
+        st.button("⬅️ Previous", disabled=current_page == 0, on_click=_step_issue_page, args=(-1,))
     with col2:
-        st.markdown(f"**Page {current_page + 1} of {total_pages}** ({len(issues)} total issues)", unsafe_allow_html=True)
-        st.markdown(f"<p style='text-align: center; color: gray;'>Showing rows {start_idx + 1} - {min(end_idx, len(issues))}</p>", unsafe_allow_html=True)
+        st.markdown(f"**Page {current_page + 1} of {total_pages}** ({total} total issues)")
+        st.caption(f"Showing rows {min(start_idx + 1, total)} - {start_idx + len(issues)}")
     with col3:
-        if st.button("Next ➡️", disabled=current_page == total_pages - 1):
-            st.session_state.issue_page += 1
-            st.rerun()
+        st.button("Next ➡️", disabled=current_page >= total_pages - 1, on_click=_step_issue_page, args=(1,))
     
     # Rule Evidence Expandable Panel
     with st.expander("📋 **Rule Evidence Details** (Proof Layer)"):
@@ -653,17 +936,17 @@ def render_issues_traceability(file_id: int, issues_info: Dict):
             """)
 
 
-def render_ai_insights(file_id: int, analysis: Dict):
+@st.fragment
+def render_ai_insights(file_id: int, view: AnalysisView):
     """Render AI-generated insights."""
     st.markdown("### 🤖 AI-Powered Insights")
     
     gemini = get_gemini()
-    pipeline = get_pipeline()
     
     # Build analytics JSON for Gemini
-    tables_info = analysis.get("tables", {})
-    issues_info = analysis.get("issues", {})
-    result = analysis.get("analysis", {})
+    tables_info = view.tables
+    issues_info = view.issues
+    result = view.result
     
     analytics_json = {
         "file_id": file_id,
@@ -682,15 +965,11 @@ def render_ai_insights(file_id: int, analysis: Dict):
     
     with col1:
         if st.button("📊 Generate Summary"):
-            with st.spinner("Generating AI summary..."):
-                insight = gemini.generate_insight(analytics_json, "summary")
-                st.markdown(insight.get("insight", "No insight generated"))
+            st.write_stream(_throttle_stream(gemini.stream_insight(analytics_json, "summary")))
     
     with col2:
         if st.button("💡 Explain Risk Level"):
-            with st.spinner("Analyzing risk factors..."):
-                insight = gemini.generate_insight(analytics_json, "explanation")
-                st.markdown(insight.get("insight", "No insight generated"))
+            st.write_stream(_throttle_stream(gemini.stream_insight(analytics_json, "explanation")))
     
     st.markdown("---")
     
@@ -705,7 +984,7 @@ def render_ai_insights(file_id: int, analysis: Dict):
             st.markdown(f"**Answer:** {answer.get('answer', 'Unable to answer')}")
     
     # Previous insights
-    insights = analysis.get("insights", [])
+    insights = view.insights
     if insights:
         st.markdown("---")
         st.markdown("#### Previous AI Insights")
@@ -714,14 +993,14 @@ def render_ai_insights(file_id: int, analysis: Dict):
                 st.markdown(insight.get("output_text", ""))
 
 
-def render_analysis_summary(analysis: Dict):
+def render_analysis_summary(view: AnalysisView):
     """Render analysis summary."""
     st.markdown("### 📈 Analysis Summary")
     
-    file_info = analysis.get("file", {})
-    tables_info = analysis.get("tables", {})
-    issues_info = analysis.get("issues", {})
-    result = analysis.get("analysis", {})
+    file_info = view.file
+    tables_info = view.tables
+    issues_info = view.issues
+    result = view.result
     
     # File info
     st.markdown("#### File Information")
@@ -780,27 +1059,21 @@ def render_audit_trail(file_id: int, audit_info: Optional[Dict]):
     sheet_details = audit_info.get("sheet_details", {})
     
     if sheet_details:
-        html = '''<table class="data-table">
-            <tr>
-                <th>Sheet Name</th>
-                <th>Tables</th>
-                <th>Rows</th>
-                <th>Source Type</th>
-            </tr>
-        '''
-        for sheet_name, details in sheet_details.items():
-            source_type = details.get("source_type", "primary")
-            badge_color = "#22c55e" if source_type == "primary" else "#f59e0b"
-            html += f'''
-            <tr>
-                <td>{sheet_name}</td>
-                <td>{details.get("tables", 0)}</td>
-                <td>{details.get("rows", 0)}</td>
-                <td><span style="background:{badge_color}; color:white; padding:2px 8px; border-radius:4px;">{source_type}</span></td>
-            </tr>
-            '''
-        html += '</table>'
-        st.markdown(html, unsafe_allow_html=True)
+        sheets_df = pd.DataFrame(
+            [
+                (sheet_name, details.get("tables", 0), details.get("rows", 0), details.get("source_type", "primary"))
+                for sheet_name, details in sheet_details.items()
+            ],
+            columns=["Sheet Name", "Tables", "Rows", "Source Type"]
+        )
+        st.dataframe(
+            sheets_df.style.map(
+                lambda source_type: f"background-color: {'#22c55e' if source_type == 'primary' else '#f59e0b'}; color: white",
+                subset=["Source Type"]
+            ),
+            hide_index=True,
+            use_container_width=True
+        )
     
     st.markdown("---")
     
@@ -814,11 +1087,167 @@ def render_audit_trail(file_id: int, audit_info: Optional[Dict]):
         st.success("✅ No extraction warnings")
 
 
-def render_study_dashboard(study_id: int):
-    """Render study-level dashboard with ROLE-SPECIFIC content."""
-    pipeline = get_pipeline()
-    storage = get_storage()
+@dataclass(slots=True, frozen=True)
+class IssueCounts:
+    """Study issue counters the dashboard reads many times per render."""
+    high: int
+    medium: int
+    low: int
+    unique: int
+    raw: int
+    sites: int
+    query_backlog: int
+    
+    @classmethod
+    def from_issues_info(cls, issues_info: Dict) -> "IssueCounts":
+        by_severity = issues_info.get("by_severity") or {}
+        by_category = issues_info.get("by_category") or {}
+        return cls(
+            high=by_severity.get("High", 0),
+            medium=by_severity.get("Medium", 0),
+            low=by_severity.get("Low", 0),
+            unique=issues_info.get("total_unique_issues", 0),
+            raw=issues_info.get("total_raw_issues", 0),
+            sites=issues_info.get("sites_affected", 0),
+            query_backlog=by_category.get("query_backlog", 0)
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def _agentic_ai() -> AgenticAI:
+    """AgenticAI instance shared across reruns and sessions."""
+    return get_agentic_ai(_gemini_for(None))
+
+
+@st.cache_data(max_entries=64, ttl=300, show_spinner=False)
+def _compute_top_site(study_id: int, version: tuple, _issues: List[Dict]) -> Optional[tuple]:
+    """(site_id, issues) for the site with the most issues; ties go to the first site seen.
+    
+    `version` is the study's analytics timestamp and stands in for the unhashed issue list.
+    """
+    sites_issues = defaultdict(list)
+    for issue in _issues:
+        sites_issues[issue.get("site_id", "Unknown")].append(issue)
+    if not sites_issues:
+        return None
+    return max(sites_issues.items(), key=lambda x: len(x[1]))
+
+
+@st.cache_data(max_entries=64, ttl=300, show_spinner=False)
+def _compute_category_sorted(by_category: tuple) -> List[tuple]:
+    """(category, count, percent of all category counts) rows, largest first."""
+    counts = np.fromiter((count for _, count in by_category), dtype=np.int64, count=len(by_category))
+    pcts = counts * (100.0 / max(int(counts.sum()), 1))
+    order = np.argsort(-counts, kind="stable")
+    return [(by_category[i][0], int(counts[i]), float(pcts[i])) for i in order]
+
+
+@st.cache_data(max_entries=64, ttl=300, show_spinner=False)
+def _compute_trend_stats(scores: np.ndarray) -> tuple:
+    """(average, peak, lowest) of the risk-score trend."""
+    return float(scores.mean()), float(scores.max()), float(scores.min())
+
+
+def _approve_action(agentic: AgenticAI, action_key: str, user_role: str):
+    """Approve callback; runs before the fragment re-renders, so the list is already updated."""
+    agentic.approve_by_key(action_key, user_role)
+    st.toast("Action approved!")
+
+
+def _reject_action(agentic: AgenticAI, action_key: str):
+    """Reject callback; runs before the fragment re-renders, so the list is already updated."""
+    agentic.reject_by_key(action_key, "User rejected")
+    st.toast("Action rejected")
+
+
+@st.fragment
+def _pending_actions_fragment(agentic: AgenticAI, user_role: str):
+    """Pending actions and their summary; approve/reject reruns only this fragment."""
+    # Pending Actions Section
+    pending = [action.to_dict() for action in agentic.get_pending_actions()]
+    
+    if pending:
+        st.markdown(f"#### 📋 Pending Actions ({len(pending)})")
+        st.warning("⚠️ Review and approve/reject each action before it is executed.")
+        
+        for action in _page_slice(pending, key="pending_actions_page"):
+            action_key = action["action_key"]
+            action_type = action.get("type", "action")
+            
+            with st.expander(f"📝 {action_type.replace('_', ' ').title()} - {action.get('target_site', action.get('site_id', 'N/A'))}", expanded=True):
+                
+                if action_type == "email_draft":
+                    st.markdown(f"**To:** Site {action.get('target_site')}")
+                    st.markdown(f"**Subject:** {action.get('subject')}")
+                    st.text_area("Email Body", action.get("body", ""), height=200, disabled=True, key=f"body_{action_key}")
+                
+                elif action_type == "site_visit_recommendation":
+                    st.markdown(f"**Site:** {action.get('site_id')}")
+                    st.markdown(f"**Urgency:** {action.get('urgency', 'N/A').upper()}")
+                    st.markdown(f"**Timeline:** {action.get('recommended_timeline')}")
+                    st.markdown(action.get("rationale", ""))
+                
+                # Approval buttons
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.button("✅ Approve", key=f"approve_{action_key}", type="primary",
+                              on_click=_approve_action, args=(agentic, action_key, user_role))
+                with col2:
+                    st.button("❌ Reject", key=f"reject_{action_key}",
+                              on_click=_reject_action, args=(agentic, action_key))
+    else:
+        st.info("🤖 No pending actions. Click buttons above to generate AI-powered drafts.")
     
+    # Action Summary
+    summary = agentic.get_action_summary()
+    if summary.get("total_actions", 0) > 0:
+        st.markdown("---")
+        st.markdown("#### 📊 Action Summary")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Pending", summary.get("pending", 0))
+        with col2:
+            st.metric("Approved", summary.get("approved", 0))
+        with col3:
+            st.metric("Rejected", summary.get("rejected", 0))
+
+
+
+@st.cache_data(max_entries=64, ttl=300, show_spinner=False)
+def _build_trend_fig(study_id: int, sig: tuple, theme_name: str, _timestamps: pd.DatetimeIndex, _scores: np.ndarray):
+    """Risk trend figure; `sig` (snapshot count, latest snapshot time) stands in for the unhashed data."""
+    # Create Plotly figure
+    fig = go.Figure()
+    
+    # Add line trace
+    fig.add_trace(go.Scatter(
+        x=_timestamps,
+        y=_scores,
+        mode='lines+markers',
+        name='Risk Score',
+        line=dict(color='#3b82f6', width=3),
+        marker=dict(size=8),
+        hovertemplate='<b>%{x}</b><br>Risk Score: %{y:.2f}<extra></extra>'
+    ))
+    
+    # Add threshold lines
+    fig.add_hline(y=12, line_dash="dash", line_color="red", annotation_text="High Risk (>=12)")
+    fig.add_hline(y=5, line_dash="dash", line_color="orange", annotation_text="Medium Risk (>=5)")
+    
+    # Update layout
+    fig.update_layout(
+        title="Risk Score Over Time",
+        xaxis_title="Analysis Time",
+        yaxis_title="Risk Score",
+        template="plotly_dark" if theme_name == "dark" else "plotly_white",
+        height=400,
+        showlegend=False
+    )
+    return fig
+
+
+def render_study_dashboard(study_id: int, storage: DatabaseStorage, pipeline: ProcessingPipeline):
+    """Render study-level dashboard with ROLE-SPECIFIC content."""
     study = storage.get_study_by_id(study_id)
     if not study:
         st.error("Study not found")
@@ -846,16 +1275,17 @@ def render_study_dashboard(study_id: int):
     elif study.cached_analytics:
         # FAST PATH: Read from Cache
         analysis = study.cached_analytics
-        # Ensure it's a dict (SQLAlchemy JSON type usually returns dict)
-        if isinstance(analysis, str):
-            import json
+        # OrjsonBlob decodes on load; guard against a double-encoded legacy string
+        if isinstance(analysis, (str, bytes)):
             try:
-                analysis = json.loads(analysis)
-            except:
-                analysis = {}
-    
-    else:
-        # Fallback (Legacy or first run without cache)
+                analysis = orjson.loads(analysis)
+            except (orjson.JSONDecodeError, TypeError):
+                logger.exception("Corrupt cached_analytics for study %s; recomputing", study_id)
+                analysis = None
+    
+    if analysis is None:
+        # Fallback (Legacy, first run without cache, or unreadable cache)
+        st.session_state["_cache_miss_count"] = st.session_state.get("_cache_miss_count", 0) + 1
         analysis = pipeline.get_study_full_analysis(study_id)
 
     if not analysis or "error" in analysis:
@@ -866,6 +1296,7 @@ def render_study_dashboard(study_id: int):
     files_info = analysis.get("files", {})
     issues_info = analysis.get("issues", {})
     risk_info = analysis.get("risk", {})
+    counts = IssueCounts.from_issues_info(issues_info)
     
     # Get current user role
     user_role = st.session_state.get("user_role", "CTT")
@@ -883,8 +1314,7 @@ def render_study_dashboard(study_id: int):
     
     # Risk badge
     risk_level = risk_info.get("level", "Unknown")
-    risk_class = "high" if "High" in str(risk_level) else "medium" if "Medium" in str(risk_level) else "low"
-    st.markdown(f'<span class="risk-{risk_class}">{risk_level}</span>', unsafe_allow_html=True)
+    st.badge(str(risk_level), color=_risk_color(risk_level))
     
     # ROLE-SPECIFIC METRICS
     if user_role == "CTT":
@@ -895,101 +1325,103 @@ def render_study_dashboard(study_id: int):
         with col2:
             st.metric("Risk Score", f"{risk_info.get('score', 0):.1f}")
         with col3:
-            st.metric("Unique Issues", issues_info.get("total_unique_issues", 0))
+            st.metric("Unique Issues", counts.unique)
         with col4:
-            st.metric("Sites at Risk", issues_info.get("sites_affected", 0))
+            st.metric("Sites at Risk", counts.sites)
     
     elif user_role == "CRA":
         # CRA: Site-focused metrics
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Sites to Monitor", issues_info.get("sites_affected", 0))
+            st.metric("Sites to Monitor", counts.sites)
         with col2:
-            high_issues = issues_info.get("by_severity", {}).get("High", 0)
+            high_issues = counts.high
             st.metric("High Priority", high_issues, delta=None if high_issues == 0 else "⚠️")
         with col3:
-            st.metric("Open Queries", issues_info.get("by_category", {}).get("query_backlog", 0))
+            st.metric("Open Queries", counts.query_backlog)
         with col4:
-            st.metric("Pending Actions", issues_info.get("total_unique_issues", 0))
+            st.metric("Pending Actions", counts.unique)
     
     else:  # Site
         # Site: Compliance metrics
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            compliance_pct = 100 - min(issues_info.get("total_unique_issues", 0) * 5, 100)
+            compliance_pct = 100 - min(counts.unique * 5, 100)
             st.metric("Compliance %", f"{compliance_pct}%")
         with col2:
-            st.metric("Issues to Resolve", issues_info.get("total_unique_issues", 0))
+            st.metric("Issues to Resolve", counts.unique)
         with col3:
-            medium_issues = issues_info.get("by_severity", {}).get("Medium", 0)
+            medium_issues = counts.medium
             st.metric("Medium Priority", medium_issues)
         with col4:
-            low_issues = issues_info.get("by_severity", {}).get("Low", 0)
+            low_issues = counts.low
             st.metric("Low Priority", low_issues)
     
     # De-duplication indicator
-    raw_issues = issues_info.get("total_raw_issues", 0)
-    unique_issues = issues_info.get("total_unique_issues", 0)
+    raw_issues = counts.raw
+    unique_issues = counts.unique
     if raw_issues > 0:
         dedup_ratio = (raw_issues - unique_issues) / raw_issues * 100
         st.info(f"📊 **De-duplication**: {raw_issues} raw issues → {unique_issues} unique ({dedup_ratio:.0f}% removed)")
     
     # ROLE-SPECIFIC TABS
     if user_role == "CTT":
-        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        tab_labels = [
             "📊 Strategic Overview",
             "📁 All Files",
             "🤖 AI Insights",
             "💬 AI Query",
             "📈 Risk Trends",
             "🤝 AI Actions"
-        ])
+        ]
     elif user_role == "CRA":
-        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        tab_labels = [
             "🏥 Site Issues",
             "📋 Action Items",
             "🔍 Monitoring Focus",
             "💬 AI Query",
             "📈 Site Trends",
             "🤝 AI Actions"
-        ])
+        ]
     else:  # Site
-        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+        tab_labels = [
             "✅ Compliance Status",
             "📋 My Tasks",
             "📁 Submitted Files",
             "💬 AI Query",
             "📈 Progress",
             "🤝 AI Actions"
-        ])
+        ]
     
-    with tab1:
+    # Radio-backed tabs: st.tabs runs every tab body each rerun, this runs only the visible one
+    active_tab = st.radio("View", tab_labels, horizontal=True, key=f"study_tab_{user_role}",
+                          label_visibility="collapsed")
+    
+    if active_tab == tab_labels[0]:
         # ROLE-SPECIFIC TAB 1 CONTENT
         if user_role == "CTT":
             # CTT: Strategic Overview
             st.markdown("### 📊 Strategic Risk Overview")
             
             st.markdown("#### Risk Distribution")
-            by_severity = issues_info.get("by_severity", {})
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("🔴 High Risk Issues", by_severity.get("High", 0))
+                st.metric("🔴 High Risk Issues", counts.high)
             with col2:
-                st.metric("🟡 Medium Risk Issues", by_severity.get("Medium", 0))
+                st.metric("🟡 Medium Risk Issues", counts.medium)
             with col3:
-                st.metric("🟢 Low Risk Issues", by_severity.get("Low", 0))
+                st.metric("🟢 Low Risk Issues", counts.low)
             
             st.markdown("---")
             st.markdown("#### Issue Categories")
             by_category = issues_info.get("by_category", {})
             if by_category:
-                for cat, count in sorted(by_category.items(), key=lambda x: x[1], reverse=True):
-                    pct = count / max(issues_info.get("total_unique_issues", 1), 1) * 100
+                for cat, count, pct in _compute_category_sorted(tuple(by_category.items())):
                     st.progress(pct / 100, text=f"**{cat}**: {count} issues ({pct:.0f}%)")
             
             st.markdown("---")
             st.markdown("#### Key Recommendations")
-            high_count = by_severity.get("High", 0)
+            high_count = counts.high
             if high_count > 0:
                 st.error(f"⚠️ **Action Required**: {high_count} high-severity issues need immediate attention")
             else:
@@ -999,24 +1431,19 @@ def render_study_dashboard(study_id: int):
             # CRA: Site Issues Focus
             st.markdown("### 🏥 Sites Requiring Attention")
             
-            issues_list = issues_info.get("issues", [])
-            sites_with_issues = {}
-            for issue in issues_list:
-                site_id = issue.get("site_id", "Unknown")
-                if site_id not in sites_with_issues:
-                    sites_with_issues[site_id] = {"high": 0, "medium": 0, "low": 0, "issues": []}
-                sev = issue.get("severity", "Low").lower()
-                sites_with_issues[site_id][sev] = sites_with_issues[site_id].get(sev, 0) + 1
-                sites_with_issues[site_id]["issues"].append(issue)
+            # Grouped at analysis time; older caches without it are grouped here
+            site_summary = analysis.get("site_summary")
+            if site_summary is None:
+                site_summary = summarize_sites(issues_info.get("issues", []))
             
-            if sites_with_issues:
-                for site_id, site_data in sorted(sites_with_issues.items(), key=lambda x: x[1]["high"], reverse=True):
+            if site_summary:
+                for site_data in site_summary:
                     priority = "🔴" if site_data["high"] > 0 else "🟡" if site_data["medium"] > 0 else "🟢"
-                    with st.expander(f"{priority} Site {site_id} - {site_data['high']} high, {site_data['medium']} medium"):
-                        for issue in site_data["issues"][:5]:
+                    with st.expander(f"{priority} Site {site_data['site_id']} - {site_data['high']} high, {site_data['medium']} medium"):
+                        for issue in site_data["top_issues"]:
                             st.markdown(f"- **{issue.get('issue_category')}**: {issue.get('description', '')}")
-                        if len(site_data["issues"]) > 5:
-                            st.caption(f"+{len(site_data['issues']) - 5} more issues")
+                        if site_data["issue_count"] > 5:
+                            st.caption(f"+{site_data['issue_count'] - 5} more issues")
             else:
                 st.info("No site-specific issues detected")
         
@@ -1024,7 +1451,7 @@ def render_study_dashboard(study_id: int):
             # Site: Compliance Status
             st.markdown("### ✅ Compliance Status")
             
-            total_issues = issues_info.get("total_unique_issues", 0)
+            total_issues = counts.unique
             compliance_pct = 100 - min(total_issues * 5, 100)
             
             if compliance_pct >= 80:
@@ -1036,32 +1463,32 @@ def render_study_dashboard(study_id: int):
             
             st.markdown("---")
             st.markdown("#### Issues to Resolve")
-            by_severity = issues_info.get("by_severity", {})
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("High Priority", by_severity.get("High", 0))
+                st.metric("High Priority", counts.high)
             with col2:
-                st.metric("Medium Priority", by_severity.get("Medium", 0))
+                st.metric("Medium Priority", counts.medium)
             with col3:
-                st.metric("Low Priority", by_severity.get("Low", 0))
+                st.metric("Low Priority", counts.low)
     
-    with tab2:
+    if active_tab == tab_labels[1]:
         # Files in study
         st.markdown("### 📁 Files in Study")
         
         files_list = files_info.get("list", [])
         if files_list:
-            for f in files_list:
+            for f in _page_slice(files_list, key=f"study_files_page_{study_id}"):
                 with st.expander(f"📄 {f.get('filename', 'Unknown')}"):
                     st.markdown(f"- **Status**: {f.get('processing_status', 'Unknown')}")
                     st.markdown(f"- **Tables**: {f.get('table_count', 0)}")
-                    if st.button("📊 View File Details", key=f"file_{f.get('file_id')}"):
-                        st.session_state["selected_file_id"] = f.get("file_id")
-                        st.rerun()
+                    st.button(
+                        "📊 View File Details", key=f"file_{f.get('file_id')}",
+                        on_click=_open_file, args=(f.get("file_id"),)
+                    )
         else:
             st.info("No files in this study yet.")
     
-    with tab3:
+    if active_tab == tab_labels[2]:
         # AI Insights for study
         st.markdown("### 🤖 Study-Level AI Insights")
         
@@ -1073,8 +1500,8 @@ def render_study_dashboard(study_id: int):
             This study is classified as **{study.risk_level}** with a risk score of **{study.risk_score:.1f}**.
             
             - **Files Analyzed**: {files_info.get('total', 0)}
-            - **Unique Issues**: {issues_info.get('total_unique_issues', 0)}
-            - **Sites Affected**: {issues_info.get('sites_affected', 0)}
+            - **Unique Issues**: {counts.unique}
+            - **Sites Affected**: {counts.sites}
             """)
             
             if st.button("🔄 Regenerate AI Insights"):
@@ -1086,11 +1513,11 @@ def render_study_dashboard(study_id: int):
         else:
             st.info("No insights available. Process files first.")
     
-    with tab4:
+    if active_tab == tab_labels[3]:
         # AI QUERY SECTION (NEW)
-        render_ai_query_section(study_id)
+        render_ai_query_section(study_id, storage)
     
-    with tab5:
+    if active_tab == tab_labels[4]:
         # TREND VISUALIZATION
         st.markdown("### 📈 Risk Trend Analysis")
         
@@ -1116,48 +1543,25 @@ def render_study_dashboard(study_id: int):
         st.markdown("---")
         
         if trend_data and len(trend_data) > 0:
-            import plotly.graph_objects as go
-            
             # Prepare chart data
-            timestamps = [t["snapshot_time"][:16] for t in trend_data]  # Trim to minutes
-            scores = [t["risk_score"] for t in trend_data]
+            # One vectorized ISO parse; a DatetimeIndex also gives Plotly a real time axis
+            timestamps = pd.to_datetime([t["snapshot_time"] for t in trend_data], format="ISO8601").floor("min")
+            scores = np.fromiter((t["risk_score"] for t in trend_data), dtype=np.float64, count=len(trend_data))
             levels = [t["risk_level"] for t in trend_data]
             
-            # Create Plotly figure
-            fig = go.Figure()
-            
-            # Add line trace
-            fig.add_trace(go.Scatter(
-                x=timestamps,
-                y=scores,
-                mode='lines+markers',
-                name='Risk Score',
-                line=dict(color='#3b82f6', width=3),
-                marker=dict(size=8),
-                hovertemplate='<b>%{x}</b><br>Risk Score: %{y:.2f}<extra></extra>'
-            ))
-            
-            # Add threshold lines
-            fig.add_hline(y=12, line_dash="dash", line_color="red", annotation_text="High Risk (>=12)")
-            fig.add_hline(y=5, line_dash="dash", line_color="orange", annotation_text="Medium Risk (>=5)")
-            
-            # Update layout
-            fig.update_layout(
-                title="Risk Score Over Time",
-                xaxis_title="Analysis Time",
-                yaxis_title="Risk Score",
-                template="plotly_dark" if st.session_state.get("theme") == "dark" else "plotly_white",
-                height=400,
-                showlegend=False
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
+            if len(trend_data) < 2:
+                st.caption("A trend line needs at least two snapshots; analyze again to start charting.")
+            elif go is None:
+                # Plotly not installed: plain line chart without threshold lines
+                st.line_chart(pd.DataFrame({"Risk Score": scores}, index=timestamps))
+            else:
+                sig = (len(trend_data), trend_data[-1]["snapshot_time"])
+                fig = _build_trend_fig(study_id, sig, st.session_state.get("theme"), timestamps, scores)
+                st.plotly_chart(fig, use_container_width=True)
             
             # Summary stats
-            if len(scores) > 1:
-                avg_score = sum(scores) / len(scores)
-                max_score = max(scores)
-                min_score = min(scores)
+            if scores.size > 1:
+                avg_score, max_score, min_score = _compute_trend_stats(scores)
                 
                 st.markdown("#### Summary Statistics")
                 col1, col2, col3 = st.columns(3)
@@ -1182,14 +1586,12 @@ def render_study_dashboard(study_id: int):
         - **Current Risk Score**: {risk_info.get('score', 0):.1f}
         """)
     
-    with tab6:
+    if active_tab == tab_labels[5]:
         # AGENTIC AI PANEL (NEW)
         st.markdown("### 🤝 AI-Powered Actions")
         st.caption("*AI proposes, Human approves* - All actions require your approval before execution.")
         
-        # Import agentic AI
-        from ai.agentic import get_agentic_ai
-        agentic = get_agentic_ai()
+        agentic = _agentic_ai()
         
         st.markdown("---")
         
@@ -1207,9 +1609,8 @@ def render_study_dashboard(study_id: int):
                     # Generate drafts for high-severity issues
                     high_issues = [i for i in issues_list if i.get("severity") == "High"][:3]
                     
-                    for issue in high_issues:
-                        site_id = issue.get("site_id", "Unknown")
-                        agentic.draft_query_resolution_email(issue, site_id, study_name)
+                    # One packed Gemini request for all drafts instead of a round trip per issue
+                    agentic.draft_query_resolution_emails_batch(high_issues, study_name, combined=True)
                     
                     st.success(f"✅ Generated {len(high_issues)} email drafts - see below for approval")
                 else:
@@ -1221,16 +1622,11 @@ def render_study_dashboard(study_id: int):
                 study_name = study_info.get("study_name", "Study")
                 
                 # Group issues by site
-                sites_issues = {}
-                for issue in issues_list:
-                    site_id = issue.get("site_id", "Unknown")
-                    if site_id not in sites_issues:
-                        sites_issues[site_id] = []
-                    sites_issues[site_id].append(issue)
+                issues_version = (study.last_analyzed_at, study.updated_at)
+                top_site = _compute_top_site(study_id, issues_version, issues_list)
                 
                 # Generate recommendation for top site
-                if sites_issues:
-                    top_site = max(sites_issues.items(), key=lambda x: len(x[1]))
+                if top_site:
                     agentic.draft_site_visit_recommendation(top_site[0], top_site[1], study_name)
                     st.success(f"✅ Generated site visit recommendation for Site {top_site[0]}")
                 else:
@@ -1238,63 +1634,32 @@ def render_study_dashboard(study_id: int):
         
         st.markdown("---")
         
-        # Pending Actions Section
-        pending = agentic.get_pending_actions()
-        
-        if pending:
-            st.markdown(f"#### 📋 Pending Actions ({len(pending)})")
-            st.warning("⚠️ Review and approve/reject each action before it is executed.")
-            
-            for idx, action in enumerate(pending):
-                action_type = action.get("type", "action")
-                
-                with st.expander(f"📝 {action_type.replace('_', ' ').title()} - {action.get('target_site', action.get('site_id', 'N/A'))}", expanded=True):
-                    
-                    if action_type == "email_draft":
-                        st.markdown(f"**To:** Site {action.get('target_site')}")
-                        st.markdown(f"**Subject:** {action.get('subject')}")
-                        st.text_area("Email Body", action.get("body", ""), height=200, disabled=True, key=f"body_{idx}")
-                    
-                    elif action_type == "site_visit_recommendation":
-                        st.markdown(f"**Site:** {action.get('site_id')}")
-                        st.markdown(f"**Urgency:** {action.get('urgency', 'N/A').upper()}")
-                        st.markdown(f"**Timeline:** {action.get('recommended_timeline')}")
-                        st.markdown(action.get("rationale", ""))
-                    
-                    # Approval buttons
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button("✅ Approve", key=f"approve_{idx}", type="primary"):
-                            agentic.approve_action(idx, user_role)
-                            st.success("Action approved!")
-                            st.rerun()
-                    with col2:
-                        if st.button("❌ Reject", key=f"reject_{idx}"):
-                            agentic.reject_action(idx, "User rejected")
-                            st.info("Action rejected")
-                            st.rerun()
-        else:
-            st.info("🤖 No pending actions. Click buttons above to generate AI-powered drafts.")
-        
-        # Action Summary
-        summary = agentic.get_action_summary()
-        if summary.get("total_actions", 0) > 0:
-            st.markdown("---")
-            st.markdown("#### 📊 Action Summary")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Pending", summary.get("pending", 0))
-            with col2:
-                st.metric("Approved", summary.get("approved", 0))
-            with col3:
-                st.metric("Rejected", summary.get("rejected", 0))
+        _pending_actions_fragment(agentic, user_role)
+
+THEME_OPTIONS: Final[Dict[str, str]] = {"🌙 Dark": "dark", "☀️ Light": "light", "🌊 Blue": "blue"}
+ROLE_OPTIONS: Final[Dict[str, str]] = {
+    "🎯 CTT (Clinical Trial Team)": "CTT",
+    "🔍 CRA (Clinical Research Associate)": "CRA",
+    "🏥 Site (Investigational Site)": "Site"
+}
+THEME_LABELS: Final[tuple] = tuple(THEME_OPTIONS)
+ROLE_LABELS: Final[tuple] = tuple(ROLE_OPTIONS)
+# Session value -> selectbox index; unknown values fall back to the first option
+THEME_INDEX: Final[Dict[str, int]] = {v: i for i, v in enumerate(THEME_OPTIONS.values())}
+ROLE_INDEX: Final[Dict[str, int]] = {v: i for i, v in enumerate(ROLE_OPTIONS.values())}
+
+
+def _apply_settings():
+    """Commit the settings form; as a callback it runs before the script, so the new theme CSS applies on this rerun."""
+    st.session_state.theme = THEME_OPTIONS[st.session_state["settings_theme"]]
+    st.session_state.user_role = ROLE_OPTIONS[st.session_state["settings_role"]]
 
 
 def main():
     """Main application entry point."""
-    # Initialize session state for API key
-    if "gemini_api_key" not in st.session_state:
-        st.session_state.gemini_api_key = None
+    # Resolve cached resources once per rerun and pass them down
+    storage = get_storage()
+    pipeline = get_pipeline()
     
     # Sidebar
     with st.sidebar:
@@ -1302,55 +1667,37 @@ def main():
         st.markdown("# Intelligence")
         st.markdown("### Enterprise Edition")
         
-        # Theme selector
-        st.markdown("---")
-        st.markdown("### 🎨 Theme")
-        theme_options = {"🌙 Dark": "dark", "☀️ Light": "light", "🌊 Blue": "blue"}
-        current_theme_name = next((k for k, v in theme_options.items() if v == st.session_state.theme), "🌙 Dark")
-        
-        selected_theme = st.selectbox(
-            "Select theme",
-            options=list(theme_options.keys()),
-            index=list(theme_options.keys()).index(current_theme_name),
-            label_visibility="collapsed"
-        )
-        
-        if theme_options[selected_theme] != st.session_state.theme:
-            st.session_state.theme = theme_options[selected_theme]
-            st.rerun()
-        
-        # Role selector (NEW)
+        # Theme and role are batched in one form: a single rerun on Apply instead of one per change
         st.markdown("---")
-        st.markdown("### 👤 User Role")
-        
-        # Initialize role in session state
-        if "user_role" not in st.session_state:
-            st.session_state.user_role = "CTT"
-        
-        role_options = {
-            "🎯 CTT (Clinical Trial Team)": "CTT",
-            "🔍 CRA (Clinical Research Associate)": "CRA",
-            "🏥 Site (Investigational Site)": "Site"
-        }
-        current_role_name = next((k for k, v in role_options.items() if v == st.session_state.user_role), "🎯 CTT (Clinical Trial Team)")
-        
-        selected_role = st.selectbox(
-            "Select role",
-            options=list(role_options.keys()),
-            index=list(role_options.keys()).index(current_role_name),
-            label_visibility="collapsed"
-        )
-        
-        if role_options[selected_role] != st.session_state.user_role:
-            st.session_state.user_role = role_options[selected_role]
-            st.rerun()
+        with st.form("settings_form", border=False):
+            # Theme selector
+            st.markdown("### 🎨 Theme")
+            st.selectbox(
+                "Select theme",
+                options=THEME_LABELS,
+                index=THEME_INDEX.get(st.session_state.theme, 0),
+                key="settings_theme",
+                label_visibility="collapsed"
+            )
+            
+            # Role selector (NEW)
+            st.markdown("### 👤 User Role")
+            st.selectbox(
+                "Select role",
+                options=ROLE_LABELS,
+                index=ROLE_INDEX.get(st.session_state.user_role, 0),
+                key="settings_role",
+                label_visibility="collapsed"
+            )
+            
+            st.form_submit_button("Apply", on_click=_apply_settings, use_container_width=True)
         
         st.markdown("---")
         
         # System status
-        storage = get_storage()
-        summary = storage.get_system_summary()
-        studies = storage.get_all_studies()
+        files_version = st.session_state.get("files_version", 0)
+        summary = _cached_system_summary(files_version)
+        studies = _cached_studies(files_version)
         
         st.markdown("### 📊 System Status")
         st.markdown(f"**Studies:** {len(studies)}")
@@ -1360,19 +1707,20 @@ def main():
         
         # ALERTS PANEL (NEW)
         user_role = st.session_state.get("user_role", "CTT")
-        alerts = storage.get_alerts_for_role(user_role)
+        alerts = _cached_alerts(user_role)
         
         if alerts:
             st.markdown("---")
             st.markdown(f"### 🚨 Alerts ({len(alerts)})")
             
             for alert in alerts[:3]:  # Show top 3
-                severity_icon = "🔴" if alert.severity == "critical" else "🟡" if alert.severity == "warning" else "🔵"
-                with st.expander(f"{severity_icon} {alert.title[:25]}...", expanded=(alert.severity == "critical")):
-                    st.markdown(alert.message)
-                    st.caption(f"Rule: `{alert.rule_id}` | {alert.created_at.strftime('%m/%d %H:%M')}")
-                    if st.button("✅ Acknowledge", key=f"ack_{alert.alert_id}"):
-                        storage.acknowledge_alert(alert.alert_id, user_role)
+                severity_icon = "🔴" if alert["severity"] == "critical" else "🟡" if alert["severity"] == "warning" else "🔵"
+                with st.expander(f"{severity_icon} {alert['title'][:25]}...", expanded=(alert["severity"] == "critical")):
+                    st.markdown(alert["message"])
+                    st.caption(f"Rule: `{alert['rule_id']}` | {alert['created_at'].strftime('%m/%d %H:%M')}")
+                    if st.button("✅ Acknowledge", key=f"ack_{alert['alert_id']}"):
+                        storage.acknowledge_alert(alert["alert_id"], user_role)
+                        _cached_alerts.clear()
                         st.rerun()
         
         # NOTIFICATION SETTINGS (NEW)
@@ -1380,19 +1728,18 @@ def main():
         with st.expander("📧 Notification Settings"):
             st.markdown("**Email Notifications**")
             
-            # Initialize notification recipients in session state
-            if "notification_recipients" not in st.session_state:
-                st.session_state.notification_recipients = ""
-            
-            recipients = st.text_input(
-                "Recipients (comma-separated emails)",
-                value=st.session_state.notification_recipients,
-                placeholder="user@example.com, manager@example.com"
-            )
-            st.session_state.notification_recipients = recipients
-            
-            notify_critical = st.checkbox("🔴 Notify on Critical Alerts", value=True)
-            notify_warning = st.checkbox("🟡 Notify on Warning Alerts", value=False)
+            with st.form("notification_form", border=False):
+                recipients = st.text_input(
+                    "Recipients (comma-separated emails)",
+                    value=st.session_state.notification_recipients,
+                    placeholder="user@example.com, manager@example.com"
+                )
+                
+                notify_critical = st.checkbox("🔴 Notify on Critical Alerts", value=True)
+                notify_warning = st.checkbox("🟡 Notify on Warning Alerts", value=False)
+                
+                if st.form_submit_button("Save"):
+                    st.session_state.notification_recipients = recipients
             
             st.caption("*Configure SMTP in production for actual email delivery*")
         
@@ -1401,11 +1748,11 @@ def main():
         # Studies List (NEW - Study-centric navigation)
         if studies:
             st.markdown("### 📋 Studies")
-            for study in studies[:10]:  # Show top 10
-                risk_emoji = "🔴" if study.risk_level == "High Risk" else "🟡" if study.risk_level == "Medium Risk" else "🟢"
-                if st.button(f"{risk_emoji} {study.study_name[:20]}...", key=f"study_{study.study_id}"):
-                    st.session_state["selected_study_id"] = study.study_id
-                    st.session_state["selected_file_id"] = None
+            for study in studies[:SIDEBAR_STUDY_LIMIT]:
+                risk_emoji = "🔴" if study["risk_level"] == "High Risk" else "🟡" if study["risk_level"] == "Medium Risk" else "🟢"
+                if st.button(f"{risk_emoji} {study['study_name'][:20]}...", key=f"study_{study['study_id']}"):
+                    st.session_state["selected_study_id"] = study["study_id"]
+                    _close_file()
                     st.rerun()
             st.markdown("---")
         
@@ -1424,20 +1771,21 @@ def main():
             st.markdown("🟡 **Status:** Not Connected")
             st.caption("Enter your Google API key below to enable AI features")
             
-            # API Key input (password field for security)
-            api_key_input = st.text_input(
-                "Google API Key",
-                type="password",
-                placeholder="Enter your API key...",
-                help="Your API key is stored securely in session only and never saved to disk."
-            )
-            
-            if st.button("🔑 Connect AI", type="primary"):
-                if api_key_input:
-                    st.session_state.gemini_api_key = api_key_input
-                    st.rerun()
-                else:
-                    st.error("Please enter an API key")
+            # API Key input (password field for security); a form so typing does not rerun the app
+            with st.form("gemini_key_form", border=False):
+                api_key_input = st.text_input(
+                    "Google API Key",
+                    type="password",
+                    placeholder="Enter your API key...",
+                    help="Your API key is stored securely in session only and never saved to disk."
+                )
+                
+                if st.form_submit_button("🔑 Connect AI", type="primary"):
+                    if api_key_input:
+                        st.session_state.gemini_api_key = api_key_input
+                        st.rerun()
+                    else:
+                        st.error("Please enter an API key")
         
         st.markdown("---")
         st.markdown("### ℹ️ About")
@@ -1467,18 +1815,16 @@ def main():
     
     # Check for selected study or file
     selected_study_id = st.session_state.get("selected_study_id")
-    selected_file_id = st.session_state.get("selected_file_id")
+    selected_file_id = _selected_file_id()
     
     # Main content - tabs
     if selected_file_id:
         # File drill-down view
         col1, col2 = st.columns([1, 4])
         with col1:
-            if st.button("← Back to Study"):
-                del st.session_state["selected_file_id"]
-                st.rerun()
+            st.button("← Back to Study", on_click=_close_file)
         
-        render_file_analysis(selected_file_id)
+        render_file_analysis(selected_file_id, storage, pipeline)
     
     elif selected_study_id:
         # Study dashboard (DEFAULT for study-scoped view)
@@ -1488,7 +1834,7 @@ def main():
                 del st.session_state["selected_study_id"]
                 st.rerun()
         
-        render_study_dashboard(selected_study_id)
+        render_study_dashboard(selected_study_id, storage, pipeline)
     
     else:
         # Main tabs for upload and management
@@ -1501,26 +1847,25 @@ def main():
         ])
         
         with tab1:
-            render_file_upload()
+            render_file_upload(storage)
         
         with tab2:
-            render_pending_ingestion()
+            render_pending_ingestion(storage, pipeline)
         
         with tab3:
             render_files_list()
         
         with tab4:
-            render_studies_list()
+            render_studies_list(storage)
         
         with tab5:
-            render_study_comparison()
+            render_study_comparison(storage)
 
 
-def render_studies_list():
+def render_studies_list(storage: DatabaseStorage):
     """Render list of all studies with delete option."""
     st.markdown("## 📊 All Studies")
     
-    storage = get_storage()
     studies = storage.get_all_studies()
     
     if not studies:
@@ -1528,7 +1873,7 @@ def render_studies_list():
         return
     
     # Studies table with delete
-    for study in studies:
+    for study in _page_slice(studies, key="studies_page"):
         risk_emoji = "🔴" if study.risk_level == "High Risk" else "🟡" if study.risk_level == "Medium Risk" else "🟢"
         
         with st.expander(f"{risk_emoji} **{study.study_name}** - {len(study.files) if study.files else 0} files"):
@@ -1555,6 +1900,7 @@ def render_studies_list():
                 with col_a:
                     if st.button("✅ Yes, Delete", key=f"confirm_yes_{study.study_id}", type="primary"):
                         result = storage.delete_study(study.study_id)
+                        _bump_files_version()
                         if result["success"]:
                             st.success(f"Deleted study with {result['deleted_files']} files, {result['deleted_issues']} issues")
                             st.session_state[f"confirm_delete_{study.study_id}"] = False
@@ -1567,17 +1913,12 @@ def render_studies_list():
                         st.rerun()
 
 
-def render_pending_ingestion():
+def render_pending_ingestion(storage: DatabaseStorage, pipeline: ProcessingPipeline):
     """Show files detected in Data Lake awaiting approval (Human-in-Loop)."""
     st.markdown("### 📥 Pending Ingestion Queue")
     st.caption("*Files are auto-detected but require your approval to process*")
     
-    from core.folder_watcher import FolderWatcher
-    from config import DATA_LAKE_PATH
-    
-    storage = get_storage()
-    pipeline = get_pipeline()
-    watcher = FolderWatcher(str(DATA_LAKE_PATH), storage, pipeline)
+    watcher = get_watcher(storage, pipeline)
     
     # Check for interrupted files first
     in_progress = watcher.get_in_progress()
@@ -1585,6 +1926,7 @@ def render_pending_ingestion():
         st.warning(f"⚠️ {len(in_progress)} file(s) were interrupted. Click to resume.")
         if st.button("🔄 Resume Interrupted"):
             results = watcher.resume_interrupted()
+            _bump_files_version()
             for r in results:
                 if r["result"]["success"]:
                     st.success(f"✅ Resumed: {r['file']}")
@@ -1603,6 +1945,18 @@ def render_pending_ingestion():
     
     st.info(f"🔔 **{len(detected)} new file(s) detected**")
     
+    if len(detected) > 1 and st.button("✅ Approve All", type="primary"):
+        with st.spinner(f"Processing {len(detected)} files..."):
+            results = watcher.process_files(detected)
+            _bump_files_version()
+        succeeded = sum(1 for result in results if result["success"])
+        if succeeded:
+            st.success(f"✅ Processed {succeeded} of {len(results)} file(s)")
+        for (_, file_path), result in zip(detected, results):
+            if not result["success"]:
+                st.error(f"❌ {file_path.name}: {result.get('error')}")
+        st.rerun()
+    
     for study_name, file_path in detected:
         col1, col2, col3 = st.columns([3, 1, 1])
         with col1:
@@ -1612,6 +1966,7 @@ def render_pending_ingestion():
             if st.button("✅ Approve", key=f"approve_{hash(str(file_path))}"):
                 with st.spinner(f"Processing {file_path.name}..."):
                     result = watcher.process_file(study_name, file_path)
+                    _bump_files_version()
                     if result["success"]:
                         st.success(f"✅ Processed: {result['tables_extracted']} tables, {result['issues_detected']} issues")
                     else:
@@ -1623,7 +1978,7 @@ def render_pending_ingestion():
                 st.rerun()
 
 
-def render_ai_query_section(study_id: int):
+def render_ai_query_section(study_id: int, storage: DatabaseStorage):
     """AI-powered natural language query interface."""
     st.markdown("### 🤖 AI Query Assistant")
     st.markdown("Ask questions about your clinical trial data in plain English.")
@@ -1646,7 +2001,6 @@ def render_ai_query_section(study_id: int):
             return
             
         with st.spinner("Analyzing..."):
-            storage = get_storage()
             study_summary = storage.get_study_summary(study_id)
             gemini = get_gemini()
             
@@ -1660,11 +2014,10 @@ def render_ai_query_section(study_id: int):
                 st.caption("*Generated using rule-based fallback (Gemini unavailable)*")
 
 
-def render_study_comparison():
+def render_study_comparison(storage: DatabaseStorage):
     """Compare two studies side by side with AI insights."""
     st.markdown("### 📊 Cross-Study Comparison")
     
-    storage = get_storage()
     studies = storage.get_all_studies()
     
     if len(studies) < 2:
@@ -1725,11 +2078,9 @@ def render_study_comparison():
         # Visual comparison
         col1, col2 = st.columns(2)
         with col1:
-            risk_class1 = "high" if "High" in str(sum1["risk"]["level"]) else "medium" if "Medium" in str(sum1["risk"]["level"]) else "low"
-            st.markdown(f'**{study1_name}**: <span class="risk-{risk_class1}">{sum1["risk"]["level"]}</span>', unsafe_allow_html=True)
+            st.markdown(f'**{study1_name}**: :{_risk_color(sum1["risk"]["level"])}-badge[{sum1["risk"]["level"]}]')
         with col2:
-            risk_class2 = "high" if "High" in str(sum2["risk"]["level"]) else "medium" if "Medium" in str(sum2["risk"]["level"]) else "low"
-            st.markdown(f'**{study2_name}**: <span class="risk-{risk_class2}">{sum2["risk"]["level"]}</span>', unsafe_allow_html=True)
+            st.markdown(f'**{study2_name}**: :{_risk_color(sum2["risk"]["level"])}-badge[{sum2["risk"]["level"]}]')
         
         st.markdown("---")
         
@@ -1744,9 +2095,7 @@ def render_study_comparison():
             "study_b": sum2
         }
         
-        with st.spinner("Generating AI comparison..."):
-            insight = gemini.generate_insight(comparison_json, "comparison")
-            st.markdown(insight.get("insight", "Unable to generate comparison"))
+        st.write_stream(_throttle_stream(gemini.stream_insight(comparison_json, "comparison")))
 
 
 if __name__ == "__main__":
@@ -3,8 +3,12 @@ Configuration for Clinical Trial Intelligence System
 """
 from pathlib import Path
 
-# Data Lake Path
-DATA_LAKE_PATH = Path(__file__).parent / "clinical_trial_data_lake"
+# Data Lake Path (resolved once; use the str form when joining many paths)
+DATA_LAKE_PATH = (Path(__file__).parent / "clinical_trial_data_lake").resolve()
+DATA_LAKE_PATH_STR = str(DATA_LAKE_PATH)
+
+# Parquet shards of ingested workbooks (kept outside the data lake so scans never see them)
+PARQUET_CACHE_PATH = (Path(__file__).parent / "database" / "parquet_cache").resolve()
 
 # File Classification Keywords (Priority: Data Quality > Safety > Operational > Clinical)
 FILE_CLASSIFICATION = {
@@ -22,6 +26,20 @@ CLASSIFICATION_PRIORITY = {
     "Clinical": 1
 }
 
+# keyword -> (category, priority), highest-priority categories first so the first hit wins
+# (a keyword shared by several categories keeps its highest-priority one)
+KEYWORD_TO_CATEGORY = {}
+for _category in sorted(FILE_CLASSIFICATION, key=lambda c: CLASSIFICATION_PRIORITY.get(c, 0), reverse=True):
+    for _keyword in FILE_CLASSIFICATION[_category]:
+        KEYWORD_TO_CATEGORY.setdefault(_keyword, (_category, CLASSIFICATION_PRIORITY.get(_category, 0)))
+del _category, _keyword
+
+# Column-header substrings read by OperationalDetector (dates, status, site, slippage, queries, delays)
+OPERATIONAL_COLUMN_KEYWORDS = frozenset({
+    "date", "status", "complete", "site", "slip", "variance",
+    "query", "open", "delay", "lag", "days"
+})
+
 # Identifier Standardization Mapping
 IDENTIFIER_MAPPING = {
     "site_id": ["site", "site id", "site number", "siteid", "site_id", "site_number", "siteno", "site no"],
@@ -29,6 +47,13 @@ IDENTIFIER_MAPPING = {
     "visit": ["visit", "visit name", "visit number", "visitname", "visit_name", "visitno", "visit no"]
 }
 
+# Lower-cased alias -> standard identifier name
+ALIAS_TO_CANONICAL = {
+    alias.lower(): canonical
+    for canonical, aliases in IDENTIFIER_MAPPING.items()
+    for alias in aliases
+}
+
 # Data Quality Issue Thresholds
 QUALITY_THRESHOLDS = {
     "missing_lab_names": {"low": 1, "medium": 5, "high": 10},
@@ -51,6 +76,15 @@ RISK_WEIGHTS = {
     "operational": 0.5
 }
 
+# Severity label -> per-site counter key (avoids a str.lower() per issue)
+SEVERITY_BUCKET = {
+    "High": "high", "Medium": "medium", "Low": "low",
+    "high": "high", "medium": "medium", "low": "low"
+}
+
+# Parsed workbook cache budget (approximate DataFrame bytes held by FileIngestionEngine)
+DATAFRAME_CACHE_BYTES = 2 * 1024 ** 3
+
 # Severity Colors
 SEVERITY_COLORS = {
     "High": "#ef4444",
@@ -64,3 +98,7 @@ RISK_COLORS = {
     "Medium Risk": "#f97316",
     "Low Risk": "#16a34a"
 }
+
+# UI Pagination
+PAGE_SIZE = 20  # rows per page for studies, study files and pending actions
+SIDEBAR_STUDY_LIMIT = 10  # studies listed in the sidebar
@@ -1,28 +1,36 @@
 """
 Core package initialization
 """
-from .ingestion import FileIngestionEngine
-from .classifier import FileClassifier
-from .registry import MetadataRegistry
-from .standardizer import IdentifierStandardizer
-from .linker import CrossFileLinker
-from .quality_detector import DataQualityDetector
-from .operational_detector import OperationalDetector
-from .risk_scorer import RiskScorer
-from .analytics import AnalyticsEngine
-from .table_extractor import TableExtractor
-from .pipeline import ProcessingPipeline
+import importlib
 
-__all__ = [
-    'FileIngestionEngine',
-    'FileClassifier', 
-    'MetadataRegistry',
-    'IdentifierStandardizer',
-    'CrossFileLinker',
-    'DataQualityDetector',
-    'OperationalDetector',
-    'RiskScorer',
-    'AnalyticsEngine',
-    'TableExtractor',
-    'ProcessingPipeline'
-]
+# Public name -> submodule; imported on first attribute access (PEP 562)
+# so `import core.pipeline` does not pull in every engine
+_LAZY = {
+    'FileIngestionEngine': 'ingestion',
+    'FileClassifier': 'classifier',
+    'MetadataRegistry': 'registry',
+    'IdentifierStandardizer': 'standardizer',
+    'CrossFileLinker': 'linker',
+    'DataQualityDetector': 'quality_detector',
+    'OperationalDetector': 'operational_detector',
+    'RiskScorer': 'risk_scorer',
+    'AnalyticsEngine': 'analytics',
+    'TableExtractor': 'table_extractor',
+    'ProcessingPipeline': 'pipeline'
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+__all__ = list(_LAZY)
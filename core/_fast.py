@@ -0,0 +1,38 @@
+"""
+Fast helpers - Typed hot loops, compilable in place with mypyc (`mypyc core/_fast.py`)
+"""
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from config import SEVERITY_BUCKET
+
+# mypyc builds an extension module that shadows this file on import; otherwise it runs as plain Python
+COMPILED = not __file__.endswith(".py")
+
+
+def _new_site() -> Dict[str, Any]:
+    return {"high": 0, "medium": 0, "low": 0, "issue_count": 0, "top_issues": []}
+
+
+def group_issues_by_site(issues: List[Dict[str, Any]], top_n: int = 5) -> Dict[Any, Dict[str, Any]]:
+    """Per-site severity counts, issue count and first `top_n` issues, in one pass."""
+    sites: Dict[Any, Dict[str, Any]] = defaultdict(_new_site)
+    for issue in issues:
+        get = issue.get
+        site = sites[get("site_id", "Unknown")]
+        severity = get("severity", "Low")
+        bucket = SEVERITY_BUCKET.get(severity)
+        if bucket is not None:
+            site[bucket] += 1
+        else:
+            # tolerate severities outside High/Medium/Low
+            bucket = severity.lower()
+            site[bucket] = site.get(bucket, 0) + 1
+        site["issue_count"] += 1
+        top_issues = site["top_issues"]
+        if len(top_issues) < top_n:
+            top_issues.append({
+                "issue_category": get("issue_category"),
+                "description": get("description", "")
+            })
+    return sites
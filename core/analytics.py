@@ -1,7 +1,10 @@
 """
 Analytics Engine - Aggregates insights across the system
 """
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import multiprocessing
+import os
 import pandas as pd
 from pathlib import Path
 
@@ -13,11 +16,35 @@ from .operational_detector import OperationalDetector
 from .risk_scorer import RiskScorer
 
 
+def _summarize_study(study_id: str, analysis: Dict) -> Dict:
+    """Reduce a full study analysis to the row shown in the studies summary."""
+    study_risk = analysis.get("study_risk", {})
+    return {
+        "study_id": study_id,
+        "file_count": analysis.get("file_count", 0),
+        "risk_level": study_risk.get("risk_level", "Unknown"),
+        "high_risk_sites": study_risk.get("high_risk_sites", 0),
+        "total_sites": study_risk.get("total_sites", 0),
+        "quality_issues": analysis.get("quality_issues", {}).get("total_issues", 0),
+        "operational_issues": analysis.get("operational_issues", {}).get("total_issues", 0)
+    }
+
+
+def _analyze_one(data_lake_path: Path, study_id: str, study_files: List[Dict]) -> Dict:
+    """
+    Worker entry point: run the detectors over one study's registered files and return
+    only its summary. Scanning, registration and Parquet conversion stay in the parent.
+    """
+    engine = AnalyticsEngine(data_lake_path, max_workers=1)
+    return _summarize_study(study_id, engine._detect_study(study_id, study_files))
+
+
 class AnalyticsEngine:
     """Main analytics engine that orchestrates all analysis components."""
     
-    def __init__(self, data_lake_path: Path):
+    def __init__(self, data_lake_path: Path, max_workers: Optional[int] = None):
         self.data_lake_path = data_lake_path
+        self.max_workers = max_workers or os.cpu_count() or 1
         self.ingestion = FileIngestionEngine(data_lake_path)
         self.classifier = FileClassifier()
         self.registry = MetadataRegistry()
@@ -27,11 +54,12 @@ class AnalyticsEngine:
         
         self._initialized = False
         self._study_cache: Dict[str, Dict] = {}
+        self._summary_cache: Dict[str, Dict] = {}
     
     def initialize(self) -> Dict:
         """Initialize the system by ingesting and classifying all files."""
         files = self.ingestion.ingest_all_studies()
-        files = self.classifier.classify_files(files)
+        files = self.classifier.classify_files_bulk(files)
         self.registry.register(files)
         self._initialized = True
         return self.registry.get_summary()
@@ -49,15 +77,29 @@ class AnalyticsEngine:
         
         if study_id in self._study_cache and not force_refresh:
             return self._study_cache[study_id]
+        if force_refresh:
+            self.ingestion.clear_data_cache()
         
         study_files = self.registry.get_files_by_study(study_id)
         if not study_files:
             return {"error": f"Study {study_id} not found"}
         
-        # Load file data
+        result = self._detect_study(study_id, study_files)
+        result["categories"] = self.registry.get_study_categories(study_id)
+        
+        self._study_cache[study_id] = result
+        self._summary_cache.pop(study_id, None)
+        return result
+    
+    def _detect_study(self, study_id: str, study_files: List[Dict]) -> Dict:
+        """Load a study's files and run the detectors and risk scoring over them."""
+        # Load file data, materializing only the columns the detectors read
         file_data = {}
         for f in study_files:
-            df = self.ingestion.load_file_data(f["file_path"])
+            column_keywords = self.classifier.required_columns(f["category"])
+            if column_keywords is not None and not column_keywords:
+                continue  # no detector analyzes this category
+            df = self.ingestion.load_file_data(f["file_path"], column_keywords=column_keywords)
             if df is not None:
                 file_data[f["file_name"]] = (df, f["category"])
         
@@ -72,32 +114,40 @@ class AnalyticsEngine:
         )
         study_risk = self.risk_scorer.calculate_study_risk(site_risks)
         
-        result = {
+        return {
             "study_id": study_id,
             "file_count": len(study_files),
             "files": study_files,
             "quality_issues": quality_results,
             "operational_issues": operational_results,
             "site_risks": site_risks,
-            "study_risk": study_risk,
-            "categories": self.registry.get_study_categories(study_id)
+            "study_risk": study_risk
         }
-        
-        self._study_cache[study_id] = result
-        return result
     
     def get_all_studies_summary(self) -> List[Dict]:
-        """Get summary for all studies."""
-        summaries = []
-        for study_id in self.get_studies():
-            analysis = self.analyze_study(study_id)
-            summaries.append({
-                "study_id": study_id,
-                "file_count": analysis.get("file_count", 0),
-                "risk_level": analysis.get("study_risk", {}).get("risk_level", "Unknown"),
-                "high_risk_sites": analysis.get("study_risk", {}).get("high_risk_sites", 0),
-                "total_sites": analysis.get("study_risk", {}).get("total_sites", 0),
-                "quality_issues": analysis.get("quality_issues", {}).get("total_issues", 0),
-                "operational_issues": analysis.get("operational_issues", {}).get("total_issues", 0)
-            })
-        return summaries
+        """
+        Get summary for all studies.
+        Uncached studies are analyzed in a process pool. Workers get the registered file
+        records and only run the detectors; only the small summary dicts come back.
+        Workers are spawned, not forked, since the Streamlit server is multi-threaded.
+        """
+        study_ids = self.get_studies()
+        for study_id in study_ids:
+            if study_id in self._study_cache and study_id not in self._summary_cache:
+                self._summary_cache[study_id] = _summarize_study(study_id, self._study_cache[study_id])
+        
+        pending = [sid for sid in study_ids if sid not in self._summary_cache]
+        if len(pending) > 1 and self.max_workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending)),
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {
+                    executor.submit(_analyze_one, self.data_lake_path, sid, self.registry.get_files_by_study(sid)): sid
+                    for sid in pending
+                }
+                for future in as_completed(futures):
+                    self._summary_cache[futures[future]] = future.result()
+        else:
+            for study_id in pending:
+                self._summary_cache[study_id] = _summarize_study(study_id, self.analyze_study(study_id))
+        
+        return [self._summary_cache[sid] for sid in study_ids]
@@ -6,9 +6,13 @@ Features:
 - Tracks processed files to avoid re-processing  
 - Supports resume on connection loss
 - Human approval required before processing
+- State changes are appended to an NDJSON event log; the JSON snapshot is
+  rewritten only on compaction
 """
 import os
-import json
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Tuple, Set, Dict, Optional
 from datetime import datetime
@@ -25,22 +29,27 @@ class FolderWatcher:
     """
     
     STATE_FILE = "ingestion_state.json"
+    LOG_FILE = "ingestion_log.ndjson"
+    COMPACT_AFTER = 1000  # log events before the snapshot is rewritten
     
     def __init__(self, watch_path: str, storage=None, pipeline=None):
         self.watch_path = Path(watch_path)
         self.storage = storage
         self.pipeline = pipeline
         self.state_file = self.watch_path / self.STATE_FILE
+        self.log_file = self.watch_path / self.LOG_FILE
+        self._log = None  # opened on first append
+        self._state_lock = threading.RLock()  # process_files marks state from worker threads
+        self._worker_local = threading.local()  # process_files workers each get their own pipeline
+        self._log_events = 0
+        # study folder -> (st_mtime_ns, *.xlsx paths) from the last glob; unchanged folders reuse it
+        self._dir_listings: Dict[str, Tuple[int, List[Path]]] = {}
         self.state = self._load_state()
+        if self._log_events >= self.COMPACT_AFTER:
+            self.compact()
     
-    def _load_state(self) -> Dict:
-        """Load processing state from disk for resume capability."""
-        if self.state_file.exists():
-            try:
-                with open(self.state_file, 'r') as f:
-                    return json.load(f)
-            except:
-                pass
+    @staticmethod
+    def _empty_state() -> Dict:
         return {
             "processed_files": [],
             "skipped_files": [],
@@ -48,14 +57,98 @@ class FolderWatcher:
             "last_scan": None
         }
     
-    def _save_state(self):
-        """Persist state to disk."""
-        try:
-            self.state["last_scan"] = datetime.utcnow().isoformat()
-            with open(self.state_file, 'w') as f:
-                json.dump(self.state, f, indent=2)
-        except Exception as e:
-            print(f"Warning: Could not save state: {e}")
+    def _load_state(self) -> Dict:
+        """Load the snapshot, then replay the event log on top of it for resume capability."""
+        state = self._empty_state()
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, 'rb') as f:
+                    state.update(orjson.loads(f.read()))
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not load state: {e}")
+        # Sets are the in-memory form; sorted lists only exist in the snapshot
+        self._processed = set(state.pop("processed_files"))
+        self._skipped = set(state.pop("skipped_files"))
+        
+        if self.log_file.exists():
+            try:
+                with open(self.log_file, 'rb') as f:
+                    for line in f:
+                        try:
+                            event = orjson.loads(line)
+                        except ValueError:
+                            continue  # torn final line from an interrupted write
+                        self._apply(state, event)
+                        self._log_events += 1
+            except OSError as e:
+                print(f"Warning: Could not replay state log: {e}")
+        return state
+    
+    def _apply(self, state: Dict, event: Dict):
+        """Apply one logged state change to the in-memory state."""
+        op = event.get("op")
+        file_key = event.get("path")
+        if op == "processed":
+            self._processed.add(file_key)
+            state["in_progress"].pop(file_key, None)
+        elif op == "skipped":
+            self._skipped.add(file_key)
+        elif op == "in_progress":
+            state["in_progress"][file_key] = {
+                "study_name": event.get("study_name"),
+                "started_at": event.get("at")
+            }
+        elif op == "scan":
+            state["last_scan"] = event.get("at")
+    
+    def _record(self, event: Dict):
+        """Apply an event and append it to the log: O(1) bytes written per state change."""
+        with self._state_lock:
+            self._apply(self.state, event)
+            try:
+                if self._log is None:
+                    self._log = open(self.log_file, 'ab', buffering=0)  # unbuffered: one write per event
+                    self._terminate_torn_line()
+                self._log.write(orjson.dumps(event) + b"\n")
+                self._log_events += 1
+            except OSError as e:
+                print(f"Warning: Could not save state: {e}")
+                return
+            if self._log_events >= self.COMPACT_AFTER:
+                self.compact()
+    
+    def _terminate_torn_line(self):
+        """Start appends on a fresh line if an interrupted write left the log unterminated."""
+        if self._log.tell() > 0:
+            with open(self.log_file, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._log.write(b"\n")
+    
+    def compact(self):
+        """Write the current state as a fresh snapshot and truncate the event log."""
+        with self._state_lock:
+            try:
+                tmp_file = self.state_file.with_suffix(".tmp")
+                snapshot = {
+                    **self.state,
+                    "processed_files": sorted(self._processed),
+                    "skipped_files": sorted(self._skipped)
+                }
+                with open(tmp_file, 'wb') as f:
+                    f.write(orjson.dumps(snapshot, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+                os.replace(tmp_file, self.state_file)
+                if self._log is not None:
+                    self._log.close()
+                    self._log = None
+                open(self.log_file, 'w').close()
+                self._log_events = 0
+            except OSError as e:
+                print(f"Warning: Could not save state: {e}")
+    
+    def close(self):
+        """Compact state and release the log handle (call on shutdown)."""
+        self.compact()
     
     def scan_for_new_files(self) -> List[Tuple[str, Path]]:
         """
@@ -65,30 +158,42 @@ class FolderWatcher:
         Does NOT process files - human approval required.
         """
         new_files = []
-        processed = set(self.state.get("processed_files", []))
-        skipped = set(self.state.get("skipped_files", []))
         
         if not self.watch_path.exists():
             return new_files
         
-        for study_folder in self.watch_path.iterdir():
-            if not study_folder.is_dir():
-                continue
-            if study_folder.name.startswith('.'):
-                continue
-            
-            # Extract study name from folder (remove "_CPID_Input Files..." suffix)
-            study_name = study_folder.name.split("_CPID_")[0].replace("_", " ").strip()
-            
-            for file in study_folder.glob("*.xlsx"):
-                file_key = str(file.absolute())
-                
-                if file_key in processed or file_key in skipped:
+        listings = {}
+        with os.scandir(self.watch_path) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                if entry.name.startswith('.'):
                     continue
                 
-                new_files.append((study_name, file))
+                # Directory mtime bumps when files are added, removed or renamed,
+                # so an unchanged folder can reuse its previous glob
+                mtime = entry.stat().st_mtime_ns
+                cached = self._dir_listings.get(entry.path)
+                if cached is not None and cached[0] == mtime:
+                    files = cached[1]
+                else:
+                    files = sorted(Path(entry.path).glob("*.xlsx"))
+                listings[entry.path] = (mtime, files)
+                
+                # Extract study name from folder (remove "_CPID_Input Files..." suffix)
+                study_name = entry.name.split("_CPID_")[0].replace("_", " ").strip()
+                
+                for file in files:
+                    file_key = str(file.absolute())
+                    
+                    if file_key in self._processed or file_key in self._skipped:
+                        continue
+                    
+                    new_files.append((study_name, file))
         
-        self._save_state()
+        # Rebuilt each scan so removed folders drop out
+        self._dir_listings = listings
+        self._record({"op": "scan", "at": datetime.utcnow().isoformat()})
         return new_files
     
     def get_in_progress(self) -> Dict[str, Dict]:
@@ -97,35 +202,38 @@ class FolderWatcher:
     
     def mark_in_progress(self, file_path: str, study_name: str):
         """Mark file as in-progress for resume capability."""
-        self.state["in_progress"][file_path] = {
+        self._record({
+            "op": "in_progress",
+            "path": file_path,
             "study_name": study_name,
-            "started_at": datetime.utcnow().isoformat()
-        }
-        self._save_state()
+            "at": datetime.utcnow().isoformat()
+        })
     
     def mark_as_processed(self, file_path: str):
-        """Mark file as successfully processed."""
-        file_key = str(file_path)
-        if file_key not in self.state["processed_files"]:
-            self.state["processed_files"].append(file_key)
-        # Remove from in-progress
-        self.state["in_progress"].pop(file_key, None)
-        self._save_state()
+        """Mark file as successfully processed (also clears its in-progress entry)."""
+        self._record({"op": "processed", "path": str(file_path)})
     
     def mark_as_skipped(self, file_path: str):
         """Mark file as skipped by user."""
-        file_key = str(file_path)
-        if file_key not in self.state["skipped_files"]:
-            self.state["skipped_files"].append(file_key)
-        self._save_state()
+        self._record({"op": "skipped", "path": str(file_path)})
     
-    def process_file(self, study_name: str, file_path: Path) -> Dict:
+    def _worker_pipeline(self):
+        """This worker thread's own pipeline (and so its own extractor, client and SQLite session)."""
+        pipeline = getattr(self._worker_local, "pipeline", None)
+        if pipeline is None:
+            from core.pipeline import ProcessingPipeline
+            pipeline = self._worker_local.pipeline = ProcessingPipeline(self.pipeline.storage.db_path)
+        return pipeline
+    
+    def process_file(self, study_name: str, file_path: Path, pipeline=None) -> Dict:
         """
         Process a single file after user approval.
         
+        `pipeline` overrides the shared one (process_files passes a per-thread pipeline).
         Returns processing result with success status.
         """
-        if not self.storage or not self.pipeline:
+        pipeline = pipeline or self.pipeline
+        if not self.storage or not pipeline:
             return {"success": False, "error": "Storage or pipeline not configured"}
         
         file_key = str(file_path.absolute())
@@ -137,21 +245,17 @@ class FolderWatcher:
             # Get or create study
             study = self.storage.get_or_create_study(study_name)
             
-            # Read file bytes
-            with open(file_path, 'rb') as f:
-                file_bytes = f.read()
-            
-            # Save to database
-            file_record = self.storage.save_uploaded_file(
+            # Save to database (streamed from disk)
+            file_record = self.storage.save_uploaded_file_path(
                 filename=file_path.name,
-                file_bytes=file_bytes
+                path=str(file_path)
             )
             
             # Assign to study
             self.storage.assign_file_to_study(file_record.file_id, study.study_id)
             
             # Process file
-            result = self.pipeline.process_file(file_record.file_id)
+            result = pipeline.process_file(file_record.file_id)
             
             # Mark as processed on success
             if result.get("success"):
@@ -168,6 +272,28 @@ class FolderWatcher:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def process_files(self, approvals: List[Tuple[str, Path]], max_workers: int = 8) -> List[Dict]:
+        """
+        Process several approved files concurrently.
+        
+        Each file still goes through process_file, on a pipeline owned by its worker
+        thread; studies are resolved up front so parallel workers never race to
+        create the same study.
+        Returns results in the same order as approvals.
+        """
+        if not approvals:
+            return []
+        if not self.storage or not self.pipeline:
+            return [self.process_file(*approval) for approval in approvals]
+        for study_name in dict.fromkeys(name for name, _ in approvals):
+            self.storage.get_or_create_study(study_name)
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(approvals))) as executor:
+            return list(executor.map(
+                lambda approval: self.process_file(*approval, pipeline=self._worker_pipeline()),
+                approvals
+            ))
+    
     def resume_interrupted(self) -> List[Dict]:
         """Resume any files that were interrupted mid-processing."""
         results = []
@@ -186,19 +312,16 @@ class FolderWatcher:
     
     def clear_state(self):
         """Clear all processing state (for testing/reset)."""
-        self.state = {
-            "processed_files": [],
-            "skipped_files": [],
-            "in_progress": {},
-            "last_scan": None
-        }
-        self._save_state()
+        self.state = {"in_progress": {}, "last_scan": None}
+        self._processed = set()
+        self._skipped = set()
+        self.compact()
     
     def get_statistics(self) -> Dict:
         """Get watcher statistics."""
         return {
-            "processed_count": len(self.state.get("processed_files", [])),
-            "skipped_count": len(self.state.get("skipped_files", [])),
+            "processed_count": len(self._processed),
+            "skipped_count": len(self._skipped),
             "in_progress_count": len(self.state.get("in_progress", {})),
             "last_scan": self.state.get("last_scan")
         }
@@ -208,6 +331,6 @@ class FolderWatcher:
 def create_watcher(watch_path: str = None):
     """Create a folder watcher with default data lake path."""
     if watch_path is None:
-        from config import DATA_LAKE_PATH
-        watch_path = str(DATA_LAKE_PATH)
+        from config import DATA_LAKE_PATH_STR
+        watch_path = DATA_LAKE_PATH_STR
     return FolderWatcher(watch_path)
@@ -1,17 +1,86 @@
 """
 File Ingestion Engine - Scans and registers study folders
 """
+import hashlib
 import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import FrozenSet, List, Dict, Optional, Tuple
 import pandas as pd
+from cachetools import LRUCache
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from config import DATAFRAME_CACHE_BYTES, PARQUET_CACHE_PATH
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # optional Rust-backed reader; pandas' default engines still work
+    CalamineWorkbook = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; without it workbooks are always parsed from Excel
+    pq = None
+
+
+def _frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+# Parsed sheets keyed by (abs path, mtime_ns, size, sheet); bounded by approximate DataFrame bytes
+_frame_cache = LRUCache(maxsize=DATAFRAME_CACHE_BYTES, getsizeof=_frame_nbytes)
+_frame_cache_lock = threading.Lock()
+
+# Background Excel -> Parquet conversions scheduled at ingest
+_parquet_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="parquet-convert")
+# (abs path, mtime_ns) of workbooks queued for conversion, and of those that yielded no first-sheet shard
+_parquet_inflight = set()
+_parquet_unconvertible = set()
+_parquet_lock = threading.Lock()
+
+
+def _parquet_shard(file_path: str, sheet_index: int) -> Path:
+    """Shard path for one sheet of a workbook, named by a hash of its absolute path."""
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    return PARQUET_CACHE_PATH / f"{digest}.{sheet_index}.parquet"
+
+
+def _arrow_table(df: pd.DataFrame):
+    """Arrow table for a sheet; mixed-type object columns (e.g. 'S1' and 2) are stringified, nulls kept."""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        pass
+    coerced = {}
+    for column in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[column], from_pandas=True)
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            coerced[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return pa.Table.from_pandas(df.assign(**coerced), preserve_index=False)
+
+
+def _fresh_shard(file_path: str, sheet_index: int) -> Optional[Path]:
+    """The sheet's shard if it exists and is at least as new as the workbook."""
+    shard = _parquet_shard(file_path, sheet_index)
+    try:
+        if shard.stat().st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+            return shard
+    except OSError:
+        pass
+    return None
 
 
 class FileIngestionEngine:
     """Handles ingestion of clinical study folders and Excel files."""
     
     SUPPORTED_EXTENSIONS = ['.xlsx', '.xls']
+    SCAN_WORKERS = 8  # concurrent directory listings; overlaps latency on network mounts
     
     def __init__(self, data_lake_path: Path):
         self.data_lake_path = Path(data_lake_path)
@@ -19,6 +88,7 @@ class FileIngestionEngine:
         self.skipped_files: List[Dict] = []  # Non-Excel files
         self.empty_folders: List[str] = []
         self.malformed_files: List[Dict] = []
+        self._sheet_names_cache: Dict[Tuple[str, float], List[str]] = {}
         
     def scan_studies(self) -> List[str]:
         """Scan and return list of study folder names."""
@@ -41,52 +111,113 @@ class FileIngestionEngine:
             return study_part.replace("Study ", "").replace("STUDY ", "").strip()
         return folder_name
     
-    def _scan_folder_recursive(self, folder_path: Path, study_id: str, 
-                                study_folder: str) -> Tuple[List[Dict], List[Dict]]:
-        """Recursively scan folder and subfolders for Excel files."""
+    def _scan_dir(self, folder: str) -> List[Tuple[str, object]]:
+        """
+        List one directory in scandir order as ("dir", (path, (st_dev, st_ino))) or
+        ("file", (name, path, size)) items. Symlinked directories are followed.
+        """
+        items = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    stat = entry.stat()
+                    items.append(("dir", (entry.path, (stat.st_dev, stat.st_ino))))
+                elif entry.is_file():
+                    size = entry.stat().st_size if os.path.splitext(entry.name)[1].lower() in self.SUPPORTED_EXTENSIONS else 0
+                    items.append(("file", (entry.name, entry.path, size)))
+        return items
+    
+    def _scan_folder_recursive(self, folder_path: Path, study_id: str, study_folder: str,
+                               executor: Optional[ThreadPoolExecutor] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Scan folder and subfolders for Excel files.
+        Directories are listed concurrently (one os.scandir per folder), then
+        assembled depth-first so the output order matches a recursive walk.
+        Listings are keyed by (st_dev, st_ino), so a directory reached through
+        several symlinks is listed once and symlink cycles terminate.
+        Listings run on `executor` when given (shared across studies), else on a private pool.
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as executor:
+                return self._scan_folder_recursive(folder_path, study_id, study_folder, executor)
+        
+        root = str(folder_path)
+        root_stat = os.stat(root)
+        root_key = (root_stat.st_dev, root_stat.st_ino)
+        listings: Dict[Tuple[int, int], List[Tuple[str, object]]] = {}
+        seen = {root_key}
+        pending = {executor.submit(self._scan_dir, root): root_key}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                listings[key] = future.result()
+                for kind, value in listings[key]:
+                    if kind == "dir" and value[1] not in seen:
+                        seen.add(value[1])
+                        pending[executor.submit(self._scan_dir, value[0])] = value[1]
+        
         excel_files = []
         other_files = []
-        
-        for item in folder_path.iterdir():
-            if item.is_dir():
-                # Recursively scan subfolders
-                sub_excel, sub_other = self._scan_folder_recursive(item, study_id, study_folder)
-                excel_files.extend(sub_excel)
-                other_files.extend(sub_other)
-            elif item.is_file():
-                if item.suffix.lower() in self.SUPPORTED_EXTENSIONS:
-                    file_record = {
-                        "study_id": study_id,
-                        "study_folder": study_folder,
-                        "file_name": item.name,
-                        "file_path": str(item),
-                        "file_size": item.stat().st_size,
-                        "ingestion_timestamp": datetime.now().isoformat(),
-                        "category": None,
-                        "subfolder": str(item.parent.relative_to(self.data_lake_path / study_folder)) if item.parent != self.data_lake_path / study_folder else None
-                    }
-                    excel_files.append(file_record)
-                else:
-                    # Track non-Excel files
-                    other_files.append({
-                        "file_name": item.name,
-                        "file_path": str(item),
-                        "extension": item.suffix,
-                        "study_id": study_id
-                    })
+        # Stack of (listing iterator, relative subfolder): a subfolder's files are
+        # emitted where it appears in its parent, exactly like the recursive walk;
+        # a directory seen again (symlink alias or cycle) is skipped
+        emitted = {root_key}
+        stack = [(iter(listings[root_key]), None)]
+        while stack:
+            items, subfolder = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                continue
+            kind, value = item
+            if kind == "dir":
+                path, key = value
+                if key in emitted:
+                    continue
+                emitted.add(key)
+                name = os.path.basename(path)
+                stack.append((iter(listings[key]), name if subfolder is None else os.path.join(subfolder, name)))
+                continue
+            name, path, size = value
+            extension = os.path.splitext(name)[1]
+            if extension.lower() in self.SUPPORTED_EXTENSIONS:
+                excel_files.append({
+                    "study_id": study_id,
+                    "study_folder": study_folder,
+                    "file_name": name,
+                    "file_path": path,
+                    "file_size": size,
+                    "ingestion_timestamp": datetime.now().isoformat(),
+                    "category": None,
+                    "subfolder": subfolder
+                })
+            else:
+                # Track non-Excel files
+                other_files.append({
+                    "file_name": name,
+                    "file_path": path,
+                    "extension": extension,
+                    "study_id": study_id
+                })
         
         return excel_files, other_files
     
-    def ingest_study(self, study_folder: str) -> List[Dict]:
-        """Ingest all files from a single study folder (including subfolders)."""
+    def _scan_study(self, study_folder: str,
+                    executor: Optional[ThreadPoolExecutor] = None) -> Optional[Tuple[List[Dict], List[Dict]]]:
+        """Scan one study folder without touching shared state; None if it does not exist."""
         study_path = self.data_lake_path / study_folder
         if not study_path.exists():
-            return []
+            return None
         
         study_id = self.extract_study_id(study_folder)
-        
-        # Recursively scan for files
-        excel_files, other_files = self._scan_folder_recursive(study_path, study_id, study_folder)
+        return self._scan_folder_recursive(study_path, study_id, study_folder, executor)
+    
+    def _record_study(self, study_folder: str, scanned: Optional[Tuple[List[Dict], List[Dict]]]) -> List[Dict]:
+        """Fold one study's scan into the skipped/empty trackers and return its Excel files."""
+        if scanned is None:
+            return []
+        excel_files, other_files = scanned
         
         # Track empty folders
         if not excel_files and not other_files:
@@ -95,10 +226,49 @@ class FileIngestionEngine:
         # Track skipped non-Excel files
         self.skipped_files.extend(other_files)
         
+        # Convert workbooks to Parquet in the background so later loads skip Excel parsing
+        if pq is not None:
+            for file_record in excel_files:
+                if _fresh_shard(file_record["file_path"], 0) is None:
+                    self._schedule_parquet(file_record["file_path"])
+        
         return excel_files
     
+    def _schedule_parquet(self, file_path: str):
+        """Queue a workbook conversion unless it is already queued or known not to convert."""
+        try:
+            key = (os.path.abspath(file_path), os.stat(file_path).st_mtime_ns)
+        except OSError:
+            return
+        with _parquet_lock:
+            if key in _parquet_inflight or key in _parquet_unconvertible:
+                return
+            _parquet_inflight.add(key)
+        _parquet_executor.submit(self._convert_queued, file_path, key)
+    
+    def _convert_queued(self, file_path: str, key: Tuple[str, int]):
+        """Run a queued conversion; remember workbooks whose first sheet got no shard."""
+        converted = False
+        try:
+            self.convert_to_parquet(file_path)
+            converted = _fresh_shard(file_path, 0) is not None
+        finally:
+            with _parquet_lock:
+                _parquet_inflight.discard(key)
+                if not converted:
+                    _parquet_unconvertible.add(key)
+    
+    def ingest_study(self, study_folder: str) -> List[Dict]:
+        """Ingest all files from a single study folder (including subfolders)."""
+        return self._record_study(study_folder, self._scan_study(study_folder))
+    
     def ingest_all_studies(self) -> List[Dict]:
-        """Ingest all studies from the data lake."""
+        """
+        Ingest all studies from the data lake.
+        Studies are scanned concurrently; trackers are updated here, in study order.
+        All studies share one pool of SCAN_WORKERS directory listers, so the thread
+        count stays bounded however many studies the lake holds.
+        """
         all_files = []
         self.skipped_files = []
         self.empty_folders = []
@@ -106,24 +276,124 @@ class FileIngestionEngine:
         
         studies = self.scan_studies()
         
-        for study_folder in studies:
-            files = self.ingest_study(study_folder)
-            all_files.extend(files)
+        if studies:
+            with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS, thread_name_prefix="scan-dir") as listers, \
+                    ThreadPoolExecutor(max_workers=min(self.SCAN_WORKERS, len(studies))) as executor:
+                scans = list(executor.map(lambda study_folder: self._scan_study(study_folder, listers), studies))
+            for study_folder, scanned in zip(studies, scans):
+                all_files.extend(self._record_study(study_folder, scanned))
         
         self.ingested_files = all_files
         return all_files
     
-    def load_file_data(self, file_path: str, sheet_name: Optional[str] = None) -> Optional[pd.DataFrame]:
-        """Load Excel file data into DataFrame with error handling."""
+    def _read_excel(self, file_path: str, sheet_name, usecols=None) -> pd.DataFrame:
+        """Read one sheet with calamine when available, falling back to pandas' default engine."""
+        if CalamineWorkbook is not None:
+            try:
+                return pd.read_excel(file_path, sheet_name=sheet_name, usecols=usecols, engine="calamine")
+            except Exception:
+                pass
+        return pd.read_excel(file_path, sheet_name=sheet_name, usecols=usecols)
+    
+    def _sheet_names(self, file_path: str) -> List[str]:
+        """Sheet names for a workbook, cached by (path, mtime) so the file is probed once."""
+        key = (str(file_path), os.path.getmtime(file_path))
+        names = self._sheet_names_cache.get(key)
+        if names is None:
+            if CalamineWorkbook is not None:
+                try:
+                    names = CalamineWorkbook.from_path(str(file_path)).sheet_names
+                except Exception:
+                    pass
+            if names is None:
+                names = pd.ExcelFile(file_path).sheet_names
+            self._sheet_names_cache[key] = names
+        return names
+    
+    def convert_to_parquet(self, file_path: str) -> int:
+        """
+        Write every sheet of a workbook as a zstd Parquet shard; returns shards written.
+        Mixed-type object columns are stored as strings; sheets with non-string
+        headers keep being read from Excel.
+        """
         try:
-            if sheet_name:
-                return pd.read_excel(file_path, sheet_name=sheet_name)
-            else:
-                # Try to read first sheet
-                xl = pd.ExcelFile(file_path)
-                if xl.sheet_names:
-                    return pd.read_excel(file_path, sheet_name=xl.sheet_names[0])
-            return None
+            sheets = self._read_excel(file_path, None)
+        except Exception as e:
+            print(f"Warning: Could not convert {file_path} to Parquet: {e}")
+            return 0
+        
+        PARQUET_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+        written = 0
+        for sheet_index, sheet_name in enumerate(list(sheets)):
+            # Pop each sheet so its frame is released once written
+            df = sheets.pop(sheet_name)
+            if not all(isinstance(column, str) for column in df.columns):
+                continue
+            shard = _parquet_shard(file_path, sheet_index)
+            # Unique temp name: concurrent conversions of one workbook never share a file
+            with tempfile.NamedTemporaryFile(dir=PARQUET_CACHE_PATH, suffix=".tmp", delete=False) as tmp:
+                tmp_shard = tmp.name
+            try:
+                table = _arrow_table(df)
+                pq.write_table(table, tmp_shard, compression="zstd")
+                os.replace(tmp_shard, shard)  # readers never see a partial shard
+                written += 1
+            except Exception:
+                Path(tmp_shard).unlink(missing_ok=True)
+        return written
+    
+    def _read_shard(self, shard: Path, column_keywords: Optional[FrozenSet[str]]) -> pd.DataFrame:
+        """Read a Parquet shard, pruning columns by keyword from the schema alone."""
+        columns = None
+        if column_keywords is not None:
+            columns = [
+                column for column in pq.read_schema(shard).names
+                if any(keyword in column.lower() for keyword in column_keywords)
+            ]
+        return pd.read_parquet(shard, columns=columns)
+    
+    @staticmethod
+    def clear_data_cache():
+        """Drop every cached DataFrame so the next load re-parses from disk."""
+        with _frame_cache_lock:
+            _frame_cache.clear()
+    
+    def load_file_data(self, file_path: str, sheet_name: Optional[str] = None,
+                       column_keywords: Optional[FrozenSet[str]] = None) -> Optional[pd.DataFrame]:
+        """
+        Load Excel file data into DataFrame with error handling.
+        column_keywords keeps only columns whose lower-cased header contains one of
+        the keywords (passed to pandas as a usecols callable); None keeps every column.
+        Parsed frames are shared from an LRU cache; callers must not mutate them.
+        """
+        try:
+            stat = os.stat(file_path)
+            # Sheet 0 is the first sheet: one parse, no separate sheet-name probe
+            sheet = sheet_name if sheet_name else 0
+            key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, sheet, column_keywords)
+            with _frame_cache_lock:
+                df = _frame_cache.get(key)
+            if df is None:
+                shard = None
+                if pq is not None:
+                    sheet_index = sheet if isinstance(sheet, int) else self._sheet_names(file_path).index(sheet)
+                    shard = _fresh_shard(file_path, sheet_index)
+                if shard is not None:
+                    try:
+                        df = self._read_shard(shard, column_keywords)
+                    except Exception as e:
+                        # Unreadable shard (truncated, removed, schema drift): parse the workbook instead
+                        print(f"Warning: Could not read Parquet shard {shard}: {e}")
+                        shard = None
+                if shard is None:
+                    usecols = None
+                    if column_keywords is not None:
+                        usecols = lambda column: any(keyword in str(column).lower() for keyword in column_keywords)
+                    df = self._read_excel(file_path, sheet, usecols)
+                if _frame_nbytes(df) <= _frame_cache.maxsize:
+                    with _frame_cache_lock:
+                        _frame_cache[key] = df
+            return df
         except Exception as e:
             # Track malformed files
             self.malformed_files.append({
@@ -136,8 +406,7 @@ class FileIngestionEngine:
     def get_file_sheets(self, file_path: str) -> List[str]:
         """Get list of sheet names in an Excel file."""
         try:
-            xl = pd.ExcelFile(file_path)
-            return xl.sheet_names
+            return self._sheet_names(file_path)
         except Exception:
             return []
     
@@ -151,9 +420,9 @@ class FileIngestionEngine:
         }
         
         try:
-            xl = pd.ExcelFile(file_path)
-            result["sheets"] = xl.sheet_names
-            result["valid"] = len(xl.sheet_names) > 0
+            sheets = self._sheet_names(file_path)
+            result["sheets"] = sheets
+            result["valid"] = len(sheets) > 0
         except Exception as e:
             result["error"] = str(e)
         
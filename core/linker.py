@@ -77,18 +77,19 @@ class CrossFileLinker:
         
         return values_by_file
     
-    def get_sites_across_files(self, study_id: str, file_data: Dict[str, pd.DataFrame]) -> List[str]:
-        """Get all unique site IDs across all files in a study."""
-        all_sites = set()
-        
+    def _sites_by_file(self, file_data: Dict[str, pd.DataFrame]) -> Dict[str, Set[str]]:
+        """Normalized site IDs per non-empty file, extracted once (values are de-duplicated before normalizing)."""
+        sites_by_file = {}
         for file_name, df in file_data.items():
             if df is None or df.empty:
                 continue
-            
             sites = self.standardizer.extract_identifier_values(df, "site_id")
-            all_sites.update([str(s) for s in sites])
-        
-        return sorted(list(all_sites))
+            sites_by_file[file_name] = set(map(str, sites))
+        return sites_by_file
+    
+    def get_sites_across_files(self, study_id: str, file_data: Dict[str, pd.DataFrame]) -> List[str]:
+        """Get all unique site IDs across all files in a study."""
+        return sorted(set().union(*self._sites_by_file(file_data).values()))
     
     def create_site_file_matrix(self, study_id: str, 
                                  file_data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
@@ -96,16 +97,15 @@ class CrossFileLinker:
         Create a matrix showing which sites appear in which files.
         Useful for understanding data coverage.
         """
-        all_sites = self.get_sites_across_files(study_id, file_data)
-        matrix_data = {"Site": all_sites}
+        sites_by_file = self._sites_by_file(file_data)
+        all_sites = pd.Index(sorted(set().union(*sites_by_file.values())))
+        matrix_data = {"Site": all_sites.tolist()}
         
-        for file_name, df in file_data.items():
-            if df is None or df.empty:
+        for file_name in file_data:
+            sites_in_file = sites_by_file.get(file_name)
+            if sites_in_file is None:
                 matrix_data[file_name] = [False] * len(all_sites)
                 continue
-            
-            sites_in_file = set(str(s) for s in 
-                              self.standardizer.extract_identifier_values(df, "site_id"))
-            matrix_data[file_name] = [site in sites_in_file for site in all_sites]
+            matrix_data[file_name] = all_sites.isin(list(sites_in_file))
         
         return pd.DataFrame(matrix_data)
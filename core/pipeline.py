@@ -13,6 +13,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from database.storage import DatabaseStorage
 from database.models import ProcessingStatus
 from core.table_extractor import TableExtractor
+from core._fast import group_issues_by_site
 from core.standardizer import IdentifierStandardizer
 from ai.gemini_client import GeminiClient
 
@@ -40,6 +41,13 @@ def make_json_safe(data):
         return str(data)
 
 
+def summarize_sites(issues: List[Dict], top_n: int = 5) -> List[Dict]:
+    """Group issues by site for the CRA dashboard, most high-severity sites first."""
+    sites = group_issues_by_site(issues, top_n)
+    return sorted(({"site_id": site_id, **site} for site_id, site in sites.items()),
+                  key=lambda s: s["high"], reverse=True)
+
+
 class ProcessingPipeline:
     """
     Enterprise processing pipeline for clinical trial files.
@@ -673,13 +681,16 @@ class ProcessingPipeline:
             return {"error": "Study not found"}
         
         summary = self.storage.get_study_summary(study_id)
+        issues = summary.get("issues", {})
         
         return {
             "study": study.to_dict(),
             "files": summary.get("files", {}),
             "extraction": summary.get("extraction", {}),
-            "issues": summary.get("issues", {}),
+            "issues": issues,
             "risk": summary.get("risk", {}),
+            # Pre-grouped so cached dashboards skip the per-issue pass
+            "site_summary": summarize_sites(issues.get("issues", [])),
             "insights": []  # Study insights retrieved separately
         }
 
@@ -8,7 +8,7 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config import IDENTIFIER_MAPPING
+from config import IDENTIFIER_MAPPING, ALIAS_TO_CANONICAL
 
 
 class IdentifierStandardizer:
@@ -16,15 +16,8 @@ class IdentifierStandardizer:
     
     def __init__(self):
         self.mapping = IDENTIFIER_MAPPING
-        self._reverse_mapping = self._build_reverse_mapping()
-    
-    def _build_reverse_mapping(self) -> Dict[str, str]:
-        """Build reverse mapping from variant names to standard names."""
-        reverse = {}
-        for standard, variants in self.mapping.items():
-            for variant in variants:
-                reverse[variant.lower()] = standard
-        return reverse
+        # Built once at config import rather than per standardizer
+        self._reverse_mapping = ALIAS_TO_CANONICAL
     
     def standardize_column_name(self, column_name: str) -> str:
         """Convert a column name to its standard form."""
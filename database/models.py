@@ -1,15 +1,39 @@
 """
 Database Models - SQLAlchemy models for enterprise clinical trial system
 """
-from sqlalchemy import create_engine, Column, Integer, String, LargeBinary, DateTime, Text, ForeignKey, JSON, Float, Enum
+from sqlalchemy import create_engine, event, inspect, text, Column, Index, Integer, String, LargeBinary, DateTime, Text, ForeignKey, JSON, Float, Enum
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import deferred, relationship, sessionmaker
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 import enum
 
+import orjson
+
 Base = declarative_base()
 
 
+class OrjsonBlob(TypeDecorator):
+    """JSON stored as orjson-encoded bytes; also reads legacy JSON text rows."""
+    impl = LargeBinary
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError as e:
+            # Treat an unreadable cache as missing so callers recompute
+            print(f"Warning: Could not decode cached JSON: {e}")
+            return None
+
+
 class ProcessingStatus(enum.Enum):
     """File processing status."""
     PENDING = "pending"
@@ -47,7 +71,7 @@ class Study(Base):
     analysis_status = Column(String(20), default=AnalysisStatus.PENDING.value)
     analysis_progress = Column(Integer, default=0)
     last_analyzed_at = Column(DateTime, nullable=True)
-    cached_analytics = Column(JSON, nullable=True)  # Stores full analysis JSON
+    cached_analytics = Column(OrjsonBlob, nullable=True)  # Stores full analysis JSON
     cached_risk_score = Column(Float, default=0.0)
     
     # Relationships
@@ -79,8 +103,9 @@ class UploadedFile(Base):
     study_id = Column(Integer, ForeignKey('studies.study_id'), nullable=True)  # Link to study
     user_id = Column(String(100), nullable=False, default="default_user")
     filename = Column(String(255), nullable=False)
-    file_blob = Column(LargeBinary, nullable=False)
+    file_blob = deferred(Column(LargeBinary, nullable=False))  # Loaded only when accessed
     file_size = Column(Integer, nullable=False)
+    content_hash = Column(String(32), nullable=True, index=True)  # blake2b-128 hex of the file bytes
     upload_timestamp = Column(DateTime, default=datetime.utcnow)
     processing_status = Column(String(20), default=ProcessingStatus.PENDING.value)
     error_message = Column(Text, nullable=True)
@@ -109,7 +134,7 @@ class ExtractedTable(Base):
     __tablename__ = 'extracted_tables'
     
     table_id = Column(Integer, primary_key=True, autoincrement=True)
-    file_id = Column(Integer, ForeignKey('uploaded_files.file_id'), nullable=False)
+    file_id = Column(Integer, ForeignKey('uploaded_files.file_id'), nullable=False, index=True)
     sheet_name = Column(String(100), nullable=False)
     table_index = Column(Integer, nullable=False)  # 0-based index within sheet
     headers = Column(JSON, nullable=True)  # List of column headers
@@ -140,6 +165,7 @@ class ExtractedTable(Base):
 class DetectedIssue(Base):
     """Stores detected data quality and operational issues with full traceability and rule evidence."""
     __tablename__ = 'detected_issues'
+    __table_args__ = (Index("ix_detected_issues_table_severity", "table_id", "severity"),)
     
     issue_id = Column(Integer, primary_key=True, autoincrement=True)
     table_id = Column(Integer, ForeignKey('extracted_tables.table_id'), nullable=False)
@@ -359,9 +385,31 @@ class RiskTrendSnapshot(Base):
         }
 
 
+# Applied to every new SQLite connection; WAL lets dashboard reads proceed during pipeline writes
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
 def get_engine(db_path: str = "database/clinical_trials.db"):
     """Create database engine."""
-    return create_engine(f"sqlite:///{db_path}", echo=False)
+    engine = create_engine(
+        f"sqlite:///{db_path}", echo=False,
+        connect_args={"check_same_thread": False}
+    )
+    event.listen(engine, "connect", _apply_sqlite_pragmas)
+    return engine
 
 
 def init_database(db_path: str = "database/clinical_trials.db"):
@@ -374,9 +422,32 @@ def init_database(db_path: str = "database/clinical_trials.db"):
         # Ignore if tables already exist (common race condition in cloud envs)
         if "already exists" not in str(e):
             raise e
+    _upgrade_schema(engine)
     return engine
 
 
+def _upgrade_schema(engine):
+    """Add columns/indexes introduced after a database file was created (create_all skips existing tables)."""
+    columns = {c["name"] for c in inspect(engine).get_columns("uploaded_files")}
+    try:
+        with engine.begin() as conn:
+            if "content_hash" not in columns:
+                conn.execute(text("ALTER TABLE uploaded_files ADD COLUMN content_hash VARCHAR(32)"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_uploaded_files_content_hash ON uploaded_files (content_hash)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_extracted_tables_file_id ON extracted_tables (file_id)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_detected_issues_table_severity ON detected_issues (table_id, severity)"
+            ))
+    except Exception as e:
+        # Another process may have migrated concurrently
+        if "duplicate column" not in str(e):
+            raise e
+
+
 def get_session(engine):
     """Create a new session."""
     Session = sessionmaker(bind=engine)
@@ -4,6 +4,9 @@ Database Storage - CRUD operations for the clinical trial system
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import io
+import os
+import threading
+from sqlalchemy import case, func, or_
 from sqlalchemy.orm import Session
 
 from .models import (
@@ -16,23 +19,27 @@ from .models import (
 class DatabaseStorage:
     """Handles all database operations for the clinical trial system."""
     
+    BLOB_CHUNK_SIZE = 1 << 20  # 1 MiB per incremental BLOB write
+    
     def __init__(self, db_path: str = "database/clinical_trials.db"):
         self.db_path = db_path
         self.engine = init_database(db_path)
-        self._session = None
+        self._local = threading.local()  # One session per thread; sessions are not thread-safe
     
     @property
     def session(self) -> Session:
-        """Get or create session."""
-        if self._session is None:
-            self._session = get_session(self.engine)
-        return self._session
+        """Get or create this thread's session."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = get_session(self.engine)
+        return session
     
     def close(self):
-        """Close session."""
-        if self._session:
-            self._session.close()
-            self._session = None
+        """Close this thread's session."""
+        session = getattr(self._local, "session", None)
+        if session:
+            session.close()
+            self._local.session = None
     
     # ==================== FILE OPERATIONS ====================
     
@@ -51,10 +58,60 @@ class DatabaseStorage:
         self.session.commit()
         return file_record
     
+    def save_uploaded_file_path(self, filename: str, path: str,
+                                user_id: str = "default_user",
+                                content_hash: Optional[str] = None,
+                                study_id: Optional[int] = None) -> UploadedFile:
+        """Store a file from disk (optionally in a study), streaming it into the BLOB in fixed-size chunks."""
+        file_size = os.path.getsize(path)
+        file_record = UploadedFile(
+            study_id=study_id,
+            user_id=user_id,
+            filename=filename,
+            file_blob=func.zeroblob(file_size),
+            file_size=file_size,
+            content_hash=content_hash,
+            upload_timestamp=datetime.utcnow(),
+            processing_status=ProcessingStatus.PENDING.value
+        )
+        self.session.add(file_record)
+        self.session.commit()
+        
+        # Fill the preallocated zeroblob in place so the file is never fully in memory
+        raw = self.engine.raw_connection()
+        try:
+            with open(path, "rb") as src, \
+                    raw.driver_connection.blobopen("uploaded_files", "file_blob", file_record.file_id) as blob:
+                remaining = file_size
+                while remaining and (chunk := src.read(min(self.BLOB_CHUNK_SIZE, remaining))):
+                    blob.write(chunk)
+                    remaining -= len(chunk)
+                if remaining or src.read(1):
+                    # e.g. a data-lake file still being copied in
+                    raise OSError(f"{path} changed size while being stored")
+            raw.commit()
+        except Exception:
+            # Never leave a committed PENDING row of zeros behind
+            raw.rollback()
+            self.session.delete(file_record)
+            self.session.commit()
+            raise
+        finally:
+            raw.close()
+        return file_record
+    
     def get_file_by_id(self, file_id: int) -> Optional[UploadedFile]:
         """Retrieve a file by ID."""
         return self.session.query(UploadedFile).filter_by(file_id=file_id).first()
     
+    def get_file_by_content_hash(self, content_hash: str,
+                                 study_id: Optional[int] = None) -> Optional[UploadedFile]:
+        """Find a previously uploaded file with identical bytes, optionally within a study (or unassigned)."""
+        query = self.session.query(UploadedFile).filter_by(content_hash=content_hash)
+        if study_id is not None:
+            query = query.filter(or_(UploadedFile.study_id == study_id, UploadedFile.study_id.is_(None)))
+        return query.order_by(UploadedFile.upload_timestamp.desc()).first()
+    
     def get_file_blob(self, file_id: int) -> Optional[io.BytesIO]:
         """Get file content as BytesIO for processing."""
         file_record = self.get_file_by_id(file_id)
@@ -179,7 +236,7 @@ class DatabaseStorage:
             return []
         return self.session.query(DetectedIssue).filter(
             DetectedIssue.table_id.in_(table_ids)
-        ).all()
+        ).order_by(DetectedIssue.issue_id).all()
     
     def get_issues_by_table(self, table_id: int) -> List[DetectedIssue]:
         """Get issues for a specific table."""
@@ -309,6 +366,51 @@ class DatabaseStorage:
     
     # ==================== DE-DUPLICATED ISSUES ====================
     
+    def get_issues_page(self, file_id: int, severity: Optional[str] = None,
+                        offset: int = 0, limit: int = 50) -> Tuple[List[Dict], int]:
+        """
+        One page of a file's de-duplicated issues, filtered and paginated in SQL.
+        
+        Same de-duplication as get_deduplicated_issues (highest severity per site + category,
+        earliest issue on ties, ordered by first occurrence). Returns (issues, total matching).
+        """
+        site_key = func.coalesce(func.nullif(DetectedIssue.site_id, ""), "unknown")
+        priority = case(
+            (DetectedIssue.severity == "High", 3),
+            (DetectedIssue.severity == "Medium", 2),
+            (DetectedIssue.severity == "Low", 1),
+            else_=0
+        )
+        partition = (site_key, DetectedIssue.issue_category)
+        ranked = (
+            self.session.query(
+                DetectedIssue.issue_id.label("issue_id"),
+                DetectedIssue.severity.label("severity"),
+                func.row_number().over(
+                    partition_by=partition, order_by=(priority.desc(), DetectedIssue.issue_id)
+                ).label("rank"),
+                func.min(DetectedIssue.issue_id).over(partition_by=partition).label("first_id")
+            )
+            .join(ExtractedTable, ExtractedTable.table_id == DetectedIssue.table_id)
+            .filter(ExtractedTable.file_id == file_id)
+            .subquery()
+        )
+        
+        query = self.session.query(ranked.c.issue_id, ranked.c.first_id).filter(ranked.c.rank == 1)
+        if severity:
+            query = query.filter(ranked.c.severity == severity)
+        
+        total = query.count()
+        page_ids = [row.issue_id for row in query.order_by(ranked.c.first_id).offset(offset).limit(limit)]
+        if not page_ids:
+            return [], total
+        
+        by_id = {
+            issue.issue_id: issue
+            for issue in self.session.query(DetectedIssue).filter(DetectedIssue.issue_id.in_(page_ids))
+        }
+        return [by_id[issue_id].to_dict() for issue_id in page_ids], total
+    
     def get_deduplicated_issues(self, file_id: int) -> Dict:
         """Get de-duplicated issues by Site ID + Issue Category."""
         issues = self.get_issues_by_file(file_id)